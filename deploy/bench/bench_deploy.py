@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+部署路径基准 (可在任意 Linux 机器上运行)
+用 shims/ 下的 launchctl/dscl/createhomedir/sudo/openclaw 替身和进程内的
+stub gateway 池替代真实服务，对 L1Deployer.run() / L2Deployer.run() 计时
+
+用法:
+    python3 deploy/bench/bench_deploy.py                    # 规模 1/10/100，L1+L2
+    python3 deploy/bench/bench_deploy.py --sizes 1,10 --modes l1
+    python3 deploy/bench/bench_deploy.py --json > bench.json
+
+每个规模使用独立的临时 HOME、配置目录与用户根目录，互不影响，
+也不会读写仓库中的 deploy/config。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+LIB_DIR = BENCH_DIR.parent / 'lib'
+SHIMS_DIR = BENCH_DIR / 'shims'
+
+DEFAULT_SIZES = (1, 10, 100)
+# 避开本机常用端口，L1/L2 各用一段
+BENCH_PORT_RANGES = {'l1': [41001, 41999], 'l2': [42001, 42999]}
+BENCH_UID_RANGE = [60001, 60999]
+SHARED_ENTRIES = ('skills/summarize', 'skills/meeting-notes',
+                  'skills/domain-model-extract', 'protocols', 'knowledge')
+
+
+def percentile(samples, pct: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def prepare_root(root: Path) -> dict:
+    """在 root 下搭建一套假的 HOME / 配置目录 / 共享层，返回需要设置的环境变量"""
+    home = root / 'home'
+    claw_dir = home / '.openclaw'
+    (claw_dir / 'agents' / 'main' / 'agent').mkdir(parents=True)
+    (claw_dir / 'openclaw.json').write_text(json.dumps({
+        'env': {'DASHSCOPE_API_KEY': 'bench-dashscope'},
+        'models': {'providers': {'fireworks': {'apiKey': 'bench-fireworks'}}},
+    }))
+    (claw_dir / 'agents' / 'main' / 'agent' / 'auth-profiles.json').write_text('{}')
+    (home / 'Library' / 'LaunchAgents').mkdir(parents=True)
+
+    shared = root / 'shared'
+    for entry in SHARED_ENTRIES:
+        (shared / entry).mkdir(parents=True)
+
+    users_root = root / 'users'
+    daemons_dir = root / 'LaunchDaemons'
+    users_root.mkdir()
+    daemons_dir.mkdir()
+
+    config_dir = root / 'config'
+    config_dir.mkdir()
+    (config_dir / 'ports.yaml').write_text(json.dumps({
+        'allocated': [],
+        'next_available': {mode: low for mode, (low, _) in BENCH_PORT_RANGES.items()},
+        'reserved': [],
+        'ranges': BENCH_PORT_RANGES,
+        'uid_range': BENCH_UID_RANGE,
+    }))
+    (config_dir / 'defaults.yaml').write_text(json.dumps({
+        'shared_path': str(shared),
+        'users_root': str(users_root),
+        'launch_daemons_dir': str(daemons_dir),
+        'service_manager': 'launchd',
+        'readiness_timeout': 10,
+    }))
+
+    state_dir = root / 'state'
+    state_dir.mkdir()
+
+    return {
+        'HOME': str(home),
+        'PATH': os.pathsep.join([str(SHIMS_DIR), os.environ.get('PATH', '')]),
+        'OPENCLAW_DEPLOY_CONFIG_DIR': str(config_dir),
+        'OPENCLAW_BENCH_STATE': str(state_dir),
+        'OPENCLAW_BENCH_USERS_ROOT': str(users_root),
+    }
+
+
+def write_manifest(path: Path, size: int, modes):
+    """生成 size 个 Agent 的清单，按 modes 轮流分配模式"""
+    agents = []
+    for i in range(size):
+        mode = modes[i % len(modes)]
+        if mode == 'l1':
+            agents.append({'mode': 'l1', 'name': f'bench-l1-{i:03d}', 'role': 'Bench'})
+        else:
+            agents.append({'mode': 'l2', 'username': f'bench-l2-{i:03d}', 'role': 'Bench'})
+    path.write_text(json.dumps({'agents': agents}))
+
+
+def count_calls(state_dir: Path) -> Counter:
+    """按命令统计替身被调用的次数"""
+    calls = Counter()
+    log = state_dir / 'calls.log'
+    if log.exists():
+        for line in log.read_text().splitlines():
+            calls[json.loads(line)['cmd']] += 1
+    return calls
+
+
+def run_size(size: int, modes, workers: int, startup_delay: float, verbose: bool) -> dict:
+    """在全新的临时环境中部署 size 个 Agent，返回统计结果"""
+    from stub_gateway import StubGatewayPool
+
+    root = Path(tempfile.mkdtemp(prefix=f'openclaw-bench-{size}-'))
+    saved_env = dict(os.environ)
+    pool = StubGatewayPool(startup_delay=startup_delay)
+    pool.start()
+
+    try:
+        os.environ.update(prepare_root(root))
+        os.environ['OPENCLAW_BENCH_CONTROL'] = pool.control_address
+        manifest = root / 'fleet.yaml'
+        write_manifest(manifest, size, modes)
+
+        from config import ConfigManager
+        from batch import BatchDeployer
+
+        deployer = BatchDeployer(ConfigManager(), manifest, sudo_password='bench',
+                                 workers=workers, verify=False)
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.monotonic()
+        with output:
+            items = deployer.run()
+        wall = time.monotonic() - start
+
+        steps = {}
+        for item in items:
+            if item.result:
+                for key, seconds in item.result.step_timings.items():
+                    steps.setdefault(key, []).append(seconds)
+
+        durations = [item.duration for item in items]
+        ready = [item.result.time_to_ready for item in items
+                 if item.result and item.result.time_to_ready is not None]
+        calls = count_calls(Path(os.environ['OPENCLAW_BENCH_STATE']))
+
+        return {
+            'size': size,
+            'modes': list(modes),
+            'workers': deployer.workers,
+            'succeeded': sum(1 for item in items if item.success),
+            'errors': sorted({item.error for item in items if item.error}),
+            'wall': wall,
+            'end_to_end': {'p50': percentile(durations, 50), 'p95': percentile(durations, 95)},
+            'time_to_ready': {'p50': percentile(ready, 50), 'p95': percentile(ready, 95)},
+            'steps': {key: {'p50': percentile(v, 50), 'p95': percentile(v, 95)}
+                      for key, v in steps.items()},
+            'subprocesses': dict(calls),
+            'subprocesses_per_agent': sum(calls.values()) / size,
+        }
+    finally:
+        pool.shutdown()
+        os.environ.clear()
+        os.environ.update(saved_env)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def print_report(stats: dict):
+    """打印单个规模的结果"""
+    print(f"\n📊 规模 {stats['size']} ({'+'.join(m.upper() for m in stats['modes'])}, "
+          f"{stats['workers']} 并发)")
+    print(f"   成功: {stats['succeeded']}/{stats['size']}  总耗时: {stats['wall']:.2f}s")
+    for error in stats['errors']:
+        print(f"   ❌ {error}")
+    e2e, ready = stats['end_to_end'], stats['time_to_ready']
+    print(f"   端到端: p50 {e2e['p50']:.3f}s  p95 {e2e['p95']:.3f}s")
+    print(f"   就绪:   p50 {ready['p50']:.3f}s  p95 {ready['p95']:.3f}s")
+    print(f"   {'步骤':<28} {'p50':>9} {'p95':>9}")
+    for key, timing in stats['steps'].items():
+        print(f"   {key:<28} {timing['p50']:>8.3f}s {timing['p95']:>8.3f}s")
+    calls = ', '.join(f"{cmd} {n}" for cmd, n in sorted(stats['subprocesses'].items()))
+    print(f"   子进程: {stats['subprocesses_per_agent']:.1f}/Agent ({calls or '无'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='deploy-agent 部署路径基准')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='fleet 规模，逗号分隔 (默认 1,10,100)')
+    parser.add_argument('--modes', default='l1,l2', help='部署模式，逗号分隔 (默认 l1,l2)')
+    parser.add_argument('--workers', type=int, help='并发部署数 (默认与 --batch 相同)')
+    parser.add_argument('--startup-delay', type=float, default=0.2,
+                        help='stub gateway 启动延迟，秒 (默认 0.2)')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--verbose', action='store_true', help='显示部署器输出')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    modes = [m for m in args.modes.split(',') if m]
+    if set(modes) - {'l1', 'l2'}:
+        parser.error('--modes 只能包含 l1 / l2')
+
+    sys.path.insert(0, str(LIB_DIR))
+    sys.path.insert(0, str(BENCH_DIR))
+
+    # L2 的新用户密码在基准中不交互
+    from deploy_l2 import L2Deployer
+    L2Deployer._prompt_user_password = lambda self: 'bench'
+
+    results = []
+    for size in sizes:
+        stats = run_size(size, modes, args.workers, args.startup_delay, args.verbose)
+        results.append(stats)
+        if not args.json:
+            print_report(stats)
+
+    if args.json:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    return 0 if all(r['succeeded'] == r['size'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
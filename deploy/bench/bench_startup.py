@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+CLI 启动耗时基准
+反复执行 deploy-agent 的只读子命令，统计墙钟耗时并检查是否误导入重量级模块
+
+用法:
+    python3 deploy/bench/bench_startup.py              # 默认 --list，20 次
+    python3 deploy/bench/bench_startup.py --runs 50 --budget-ms 80
+    python3 deploy/bench/bench_startup.py -- --verify --all
+
+超出预算或导入了 FORBIDDEN_MODULES 时以退出码 1 结束，可直接用于 CI。
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DEPLOY_AGENT = Path(__file__).resolve().parent.parent / 'bin' / 'deploy-agent'
+
+# 只读子命令不应导入的模块
+FORBIDDEN_MODULES = ('yaml', 'jinja2', 'deploy_l1', 'deploy_l2', 'batch')
+
+
+def time_runs(argv, runs: int):
+    """执行 runs 次，返回每次耗时 (毫秒)"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def imported_modules(argv):
+    """用 -X importtime 找出一次执行中导入的顶层模块"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', *argv[1:]],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            modules.add(name.split('.')[0])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='deploy-agent 启动耗时基准')
+    parser.add_argument('--runs', type=int, default=20, help='执行次数 (默认 20)')
+    parser.add_argument('--budget-ms', type=float, default=100.0,
+                        help='中位数耗时预算，毫秒 (默认 100)')
+    parser.add_argument('command', nargs='*', default=['--list'],
+                        help='deploy-agent 参数 (默认 --list)')
+    args = parser.parse_args()
+
+    argv = [sys.executable, str(DEPLOY_AGENT), *args.command]
+
+    # 预热一次：生成登记快照与字节码缓存
+    subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    baseline = statistics.median(time_runs([sys.executable, '-c', 'pass'], args.runs))
+    samples = time_runs(argv, args.runs)
+    median = statistics.median(samples)
+    p95 = sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+    leaked = sorted(imported_modules(argv) & set(FORBIDDEN_MODULES))
+
+    print(f"命令:       deploy-agent {' '.join(args.command)}")
+    print(f"次数:       {args.runs}")
+    print(f"解释器基线: {baseline:7.1f} ms  (python -c pass)")
+    print(f"中位数:     {median:7.1f} ms  (预算 {args.budget_ms:.0f} ms)")
+    print(f"p95:        {p95:7.1f} ms")
+    print(f"额外开销:   {median - baseline:7.1f} ms")
+    print(f"重量级导入: {', '.join(leaked) or '无'}")
+
+    ok = median <= args.budget_ms and not leaked
+    print("结果:       " + ("✅ 通过" if ok else "❌ 未通过"))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
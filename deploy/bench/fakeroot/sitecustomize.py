@@ -0,0 +1,21 @@
+"""
+基准用 fakeroot: 由 sudo 替身经 PYTHONPATH 注入到"提权"后的 Python 进程
+把属主/降权相关调用变为空操作，账户查询统一返回当前用户
+"""
+
+import grp
+import os
+import pwd
+
+_me = pwd.getpwuid(os.getuid())
+_my_group = grp.getgrgid(os.getgid())
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+os.chown = os.lchown = _noop
+os.setuid = os.setgid = os.initgroups = _noop
+pwd.getpwnam = lambda name: _me
+grp.getgrnam = lambda name: _my_group
@@ -0,0 +1,31 @@
+"""
+基准替身的公共部分
+所有替身把自己的调用追加到 $OPENCLAW_BENCH_STATE/calls.log，用于统计子进程次数
+"""
+
+import json
+import os
+import sys
+import urllib.request
+from pathlib import Path
+
+STATE_DIR = Path(os.environ.get('OPENCLAW_BENCH_STATE', '/tmp/openclaw-bench-state'))
+
+
+def record(name: str):
+    """记录一次调用 (O_APPEND 单次写入，多进程并发安全)"""
+    line = json.dumps({'cmd': name, 'argv': sys.argv[1:]}, ensure_ascii=False) + '\n'
+    fd = os.open(STATE_DIR / 'calls.log', os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+def control(action: str, **params):
+    """通知基准进程中的 stub gateway 池启动/停止某个端口"""
+    url = f"http://{os.environ['OPENCLAW_BENCH_CONTROL']}/{action}"
+    data = json.dumps(params).encode()
+    req = urllib.request.Request(url, data=data, method='POST')
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read() or b'{}')
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Stub gateway 池
+在基准进程内为每个"启动"的 Agent 开一个返回 200 的 HTTP 服务，
+launchctl 替身通过控制端口 (POST /start /stop /list) 操作它们，
+避免为每个 Agent 启动一个真实进程。
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGatewayPool:
+    """stub gateway 池 (startup_delay 模拟 gateway 启动耗时)"""
+
+    def __init__(self, startup_delay: float = 0.2):
+        self.startup_delay = startup_delay
+        self._gateways: Dict[str, Tuple[int, ThreadingHTTPServer]] = {}
+        self._lock = threading.Lock()
+        self._control = ThreadingHTTPServer(('127.0.0.1', 0), self._control_handler())
+        self._control.daemon_threads = True
+
+    @property
+    def control_address(self) -> str:
+        host, port = self._control.server_address
+        return f'{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self._control.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            gateways = list(self._gateways.values())
+            self._gateways.clear()
+        for _, server in gateways:
+            server.shutdown()
+            server.server_close()
+        self._control.shutdown()
+        self._control.server_close()
+
+    def start_gateway(self, label: str, port: int):
+        """延迟 startup_delay 后在 port 上开始服务 (异步，立即返回)"""
+        def run():
+            time.sleep(self.startup_delay)
+            server = ThreadingHTTPServer(('127.0.0.1', port), _GatewayHandler)
+            server.daemon_threads = True
+            with self._lock:
+                self._gateways[label] = (port, server)
+            server.serve_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_gateway(self, label: str):
+        with self._lock:
+            entry = self._gateways.pop(label, None)
+        if entry:
+            entry[1].shutdown()
+            entry[1].server_close()
+
+    def labels(self):
+        with self._lock:
+            return sorted(self._gateways)
+
+    def _control_handler(self):
+        pool = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/start':
+                    pool.start_gateway(params['label'], int(params['port']))
+                    payload = {}
+                elif self.path == '/stop':
+                    pool.stop_gateway(params['label'])
+                    payload = {}
+                elif self.path == '/list':
+                    payload = {'labels': pool.labels()}
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+批量部署器
+读取 fleet 清单，并发执行多个 Agent 的部署
+
+清单格式 (fleet.yaml):
+    workers: 4                # 可选，并发上限
+    defaults:                 # 可选，合并到每个 Agent
+      role: AI Assistant
+    agents:
+      - mode: l1
+        name: researcher
+        role: 商业研究员
+      - mode: l2
+        username: wifey
+        role: 夫人助理
+        bot_token: "123456:ABC..."
+"""
+
+import argparse
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import ConfigManager, DeployResult
+from exceptions import ConfigError
+from logger import flush_logs
+
+
+DEFAULT_WORKERS = 4
+
+# 清单中允许的字段 (与 deploy-agent 命令行参数一一对应)
+AGENT_FIELDS = ('mode', 'name', 'role', 'bot_token', 'username', 'uid', 'port')
+
+
+class BatchItem:
+    """单个 Agent 的批量部署结果"""
+
+    def __init__(self, spec: Dict):
+        self.spec = spec
+        self.mode = spec['mode']
+        self.agent_name = spec.get('name') or spec.get('username')
+        self.result: Optional[DeployResult] = None
+        self.error = None
+        self.duration = 0.0
+
+    @property
+    def success(self) -> bool:
+        return self.error is None and self.result is not None and self.result.success
+
+
+class BatchDeployer:
+    """批量部署器"""
+
+    def __init__(self, config: ConfigManager, manifest_path: Path,
+                 sudo_password: str = None, workers: int = None,
+                 dry_run: bool = False, verify: bool = True, profile: bool = False):
+        self.config = config
+        self.manifest_path = Path(manifest_path)
+        self.sudo_password = sudo_password
+        self.dry_run = dry_run
+        self.verify = verify
+        self.profile = profile
+
+        manifest = load_manifest(self.manifest_path)
+        self.specs = manifest['agents']
+        self.workers = max(1, workers or manifest.get('workers') or DEFAULT_WORKERS)
+
+    @property
+    def needs_sudo(self) -> bool:
+        """清单中是否有需要 sudo 的 Agent"""
+        return not self.dry_run and any(s['mode'] == 'l2' for s in self.specs)
+
+    def run(self) -> List[BatchItem]:
+        """并发部署清单中的全部 Agent，返回与清单顺序一致的结果"""
+        items = [BatchItem(spec) for spec in self.specs]
+        self._reserve_ports(items)
+
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='deploy') as pool:
+            list(pool.map(self._deploy_one, items))
+
+        flush_logs()
+        return items
+
+    def _reserve_ports(self, items: List[BatchItem]):
+        """按模式一次性预留未指定端口的 Agent 所需端口"""
+        for mode in ('l1', 'l2'):
+            pending = [item for item in items
+                       if item.mode == mode and not item.spec.get('port')]
+            if not pending:
+                continue
+            if self.dry_run:
+                ports = self.config.peek_ports(mode, len(pending))
+            else:
+                ports = self.config.allocate_many(mode, len(pending))
+            for item, port in zip(pending, ports):
+                item.spec = {**item.spec, 'port': port}
+
+    def _deploy_one(self, item: BatchItem):
+        """部署单个 Agent (在工作线程中执行)"""
+        from deploy_l1 import L1Deployer
+        from deploy_l2 import L2Deployer
+        from verify import Verifier
+
+        args = build_args(item.spec, dry_run=self.dry_run, profile=self.profile)
+        start = time.monotonic()
+        deployer = None
+
+        try:
+            if item.mode == 'l1':
+                deployer = L1Deployer(self.config, args, self.sudo_password)
+            else:
+                deployer = L2Deployer(self.config, args, self.sudo_password)
+
+            if self.dry_run:
+                deployer.dry_run()
+                item.result = DeployResult(success=True, mode=item.mode,
+                                           agent_name=item.agent_name)
+            else:
+                item.result = deployer.run()
+                if item.result.success and self.verify:
+                    Verifier(item.result).run()
+        except Exception as e:
+            item.error = str(e)
+            if deployer is not None and not self.dry_run:
+                try:
+                    deployer.rollback()
+                except Exception as rollback_error:
+                    item.error += f" (回滚失败: {rollback_error})"
+        finally:
+            item.duration = time.monotonic() - start
+
+        return item
+
+
+def load_manifest(path: Path) -> Dict:
+    """加载并校验 fleet 清单"""
+    if not path.exists():
+        raise ConfigError(f"清单不存在: {path}")
+
+    with open(path, 'r') as f:
+        manifest = yaml.safe_load(f) or {}
+
+    defaults = manifest.get('defaults') or {}
+    agents = []
+    seen = set()
+
+    for i, raw in enumerate(manifest.get('agents') or [], 1):
+        spec = {**defaults, **(raw or {})}
+        unknown = set(spec) - set(AGENT_FIELDS)
+        if unknown:
+            raise ConfigError(f"清单第 {i} 项包含未知字段: {', '.join(sorted(unknown))}")
+
+        mode = spec.get('mode')
+        if mode not in ('l1', 'l2'):
+            raise ConfigError(f"清单第 {i} 项 mode 必须是 l1 或 l2")
+        if mode == 'l1' and not spec.get('name'):
+            raise ConfigError(f"清单第 {i} 项 (L1) 必须指定 name")
+        if mode == 'l2' and not spec.get('username'):
+            raise ConfigError(f"清单第 {i} 项 (L2) 必须指定 username")
+
+        key = spec.get('name') or spec.get('username')
+        if key in seen:
+            raise ConfigError(f"清单中 Agent 重复: {key}")
+        seen.add(key)
+        agents.append(spec)
+
+    if not agents:
+        raise ConfigError(f"清单中没有 Agent: {path}")
+
+    manifest['agents'] = agents
+    return manifest
+
+
+def build_args(spec: Dict, dry_run: bool = False, profile: bool = False) -> argparse.Namespace:
+    """将清单项转换为部署器所需的参数对象"""
+    return argparse.Namespace(
+        mode=spec['mode'],
+        name=spec.get('name') or spec.get('username'),
+        role=spec.get('role'),
+        bot_token=spec.get('bot_token'),
+        username=spec.get('username'),
+        uid=spec.get('uid'),
+        port=spec.get('port'),
+        dry_run=dry_run,
+        no_verify=False,
+        verbose=False,
+        profile=profile,
+    )
+
+
+def print_batch_report(items: List[BatchItem], elapsed: float):
+    """打印批量部署汇总表"""
+    print("\n" + "="*88)
+    print("📊 批量部署报告")
+    print("="*88)
+    print(f"{'名称':<20} {'模式':<6} {'端口':<8} {'UID':<6} {'耗时':<10} {'就绪':<10} {'状态'}")
+    print("-" * 88)
+
+    for item in items:
+        result = item.result
+        port = str(result.port) if result and result.port else '-'
+        uid = str(result.uid) if result and result.uid else '-'
+        ready = (f"{result.time_to_ready:>6.2f}s"
+                 if result and result.time_to_ready is not None else '      -')
+        status = '✅ 成功' if item.success else f'❌ {item.error or "失败"}'
+        print(f"{item.agent_name:<20} {item.mode.upper():<6} {port:<8} {uid:<6} "
+              f"{item.duration:>6.1f}s   {ready}    {status}")
+
+    succeeded = sum(1 for item in items if item.success)
+    slowest = max((item.duration for item in items), default=0.0)
+    print("-" * 88)
+    print(f"总计：{succeeded}/{len(items)} 成功，总耗时 {elapsed:.1f}s (最慢 {slowest:.1f}s)")
+    print("="*88 + "\n")
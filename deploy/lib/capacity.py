@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+部署前容量检查 (准入控制)
+用实测的各 Agent 资源占用 (usage.py 的历史样本) 与主机总量，预测再部署一个 Agent 后的负载:
+
+    内存  非 Agent 进程占用 + Σ 已登记 Agent 的 RSS + 新 Agent 预估 ≤ 总内存 × (1 - 内存余量)
+    CPU   Σ 已登记 Agent 的 CPU + 新 Agent 预估 ≤ 核数 × 100% × (1 - CPU 余量)
+
+已登记 Agent 的占用: 历史样本足够 (≥ MIN_SAMPLES) 时取 p95；否则运行中的取当前 RSS，
+未运行且无历史的按默认值计 (休眠 / 停止的 Agent 随时可能被唤醒)。
+新 Agent 按已实测 Agent 的中位数预估，尚无实测时用 capacity_agent_rss_mb / capacity_agent_cpu。
+CPU 只计 Gateway 本身 (其他进程的 CPU 波动大，不纳入预测)。
+
+capacity_policy: off (不检查) / warn (超出时警告，默认) / refuse (超出时拒绝，--ignore-capacity 跳过)。
+同一进程内并发部署 (--batch) 时，已放行但尚未登记的 Agent 计入后续检查。
+"""
+
+import os
+import statistics
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import registry_snapshot
+from exceptions import ConfigError, PrerequisiteError
+from snapshot import SystemSnapshot, host_memory, process_usage
+from usage import load_stats
+
+
+POLICIES = ('off', 'warn', 'refuse')
+MIN_SAMPLES = 10            # 历史样本少于此数时不视为实测
+DEFAULT_MEMORY_HEADROOM = 0.2
+DEFAULT_CPU_HEADROOM = 0.25
+DEFAULT_AGENT_RSS_MB = 400
+DEFAULT_AGENT_CPU = 5.0
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+
+class Footprint:
+    """一个 Agent 的预计占用"""
+
+    __slots__ = ('rss', 'cpu', 'source')
+
+    def __init__(self, rss: float, cpu: float, source: str):
+        self.rss = rss          # 字节
+        self.cpu = cpu          # %，单核 100
+        self.source = source    # p95 / 当前值 / 默认值 / 已实测 Agent 中位数
+
+
+class CapacityPlan:
+    """部署一个新 Agent 后的负载预测"""
+
+    def __init__(self, name: str, new: Footprint, agents: Dict[str, Footprint],
+                 pending: Dict[str, Footprint], running_rss: float,
+                 memory: Optional[tuple], cpus: int,
+                 memory_headroom: float, cpu_headroom: float):
+        self.name = name
+        self.new = new
+        self.agents = agents
+        self.pending = pending          # 本进程内已放行、尚未登记的 Agent
+        self.memory_total, self.memory_available = memory or (None, None)
+        self.cpus = cpus
+        self.memory_headroom = memory_headroom
+        self.cpu_headroom = cpu_headroom
+        # 已用内存中不属于 Gateway 的部分 (系统、Claw 之外的应用等)
+        self.other_rss = (max(0.0, self.memory_total - self.memory_available - running_rss)
+                          if memory else 0.0)
+
+    @property
+    def fleet_rss(self) -> float:
+        return sum(f.rss for f in self.agents.values()) + sum(f.rss for f in self.pending.values())
+
+    @property
+    def fleet_cpu(self) -> float:
+        return sum(f.cpu for f in self.agents.values()) + sum(f.cpu for f in self.pending.values())
+
+    @property
+    def projected_memory(self) -> float:
+        return self.other_rss + self.fleet_rss + self.new.rss
+
+    @property
+    def memory_limit(self) -> Optional[float]:
+        if self.memory_total is None:
+            return None
+        return self.memory_total * (1 - self.memory_headroom)
+
+    @property
+    def projected_cpu(self) -> float:
+        return self.fleet_cpu + self.new.cpu
+
+    @property
+    def cpu_limit(self) -> float:
+        return self.cpus * 100 * (1 - self.cpu_headroom)
+
+    @property
+    def problems(self) -> List[str]:
+        """超出余量的项目 (为空表示可以部署)"""
+        problems = []
+        if self.memory_limit is not None and self.projected_memory > self.memory_limit:
+            problems.append(f"内存预计 {self.projected_memory / GB:.1f}GB，"
+                            f"超出上限 {(self.projected_memory - self.memory_limit) / GB:.1f}GB")
+        if self.projected_cpu > self.cpu_limit:
+            problems.append(f"CPU 预计 {self.projected_cpu:.0f}%，"
+                            f"超出上限 {self.projected_cpu - self.cpu_limit:.0f}%")
+        return problems
+
+    def lines(self) -> List[str]:
+        """报告行 (部署日志与部署报告共用)"""
+        count = len(self.agents) + len(self.pending)
+        lines = [f"容量预测 (新 Agent 按{self.new.source}预估: "
+                 f"RSS {self.new.rss / MB:.0f}MB, CPU {self.new.cpu:.1f}%)"]
+        if self.memory_limit is None:
+            lines.append("  内存 无法获取主机内存，跳过")
+        else:
+            lines.append(
+                f"  内存 {self.projected_memory / GB:.1f}GB / 上限 {self.memory_limit / GB:.1f}GB "
+                f"(总 {self.memory_total / GB:.1f}GB，保留 {self.memory_headroom:.0%}) = "
+                f"非 Agent {self.other_rss / GB:.1f}GB + {count} 个 Agent {self.fleet_rss / GB:.1f}GB "
+                f"+ 新 {self.new.rss / GB:.2f}GB")
+        lines.append(f"  CPU  {self.projected_cpu:.0f}% / 上限 {self.cpu_limit:.0f}% "
+                     f"({self.cpus} 核，保留 {self.cpu_headroom:.0%})")
+        lines.extend(f"  ⚠️ {problem}" for problem in self.problems)
+        return lines
+
+
+class CapacityModel:
+    """按登记、历史样本与主机总量构造 CapacityPlan"""
+
+    def __init__(self, defaults: Dict, config_dir: Path = None):
+        self.defaults = defaults
+        self.config_dir = config_dir or registry_snapshot.default_config_dir()
+        self.memory_headroom = float(defaults.get('capacity_memory_headroom',
+                                                  DEFAULT_MEMORY_HEADROOM))
+        self.cpu_headroom = float(defaults.get('capacity_cpu_headroom', DEFAULT_CPU_HEADROOM))
+        self.default = Footprint(defaults.get('capacity_agent_rss_mb', DEFAULT_AGENT_RSS_MB) * MB,
+                                 float(defaults.get('capacity_agent_cpu', DEFAULT_AGENT_CPU)),
+                                 '默认值')
+
+    def plan(self, name: str, pending: Dict[str, Footprint] = None) -> CapacityPlan:
+        agents = [a for a in registry_snapshot.list_agents(self.config_dir)
+                  if a.get('port') and (a.get('name') or a.get('agent')) != name]
+        names = {a.get('name') or a.get('agent') for a in agents}
+
+        snapshot = SystemSnapshot.capture()
+        pids = {}
+        for agent in agents:
+            proc = snapshot.gateway_for_port(agent['port'])
+            if proc is not None:
+                pids[agent.get('name') or agent.get('agent')] = proc.pid
+        usage = process_usage(pids.values())
+
+        footprints, running_rss = {}, 0.0
+        for agent_name in names:
+            stats = load_stats(agent_name, self.config_dir)
+            proc = usage.get(pids.get(agent_name))
+            current = proc.rss if proc is not None and proc.rss is not None else None
+            running_rss += current or 0
+            if stats.count >= MIN_SAMPLES:
+                footprints[agent_name] = Footprint(stats.rss_p95, stats.cpu_p95 or 0.0, 'p95')
+            elif current is not None:
+                footprints[agent_name] = Footprint(current, self.default.cpu, '当前值')
+            else:
+                footprints[agent_name] = self.default
+
+        measured = [f for f in footprints.values() if f.source == 'p95']
+        new = self.default
+        if measured:
+            new = Footprint(statistics.median(f.rss for f in measured),
+                            statistics.median(f.cpu for f in measured), '已实测 Agent 中位数')
+
+        pending = {n: f for n, f in (pending or {}).items() if n not in names and n != name}
+        return CapacityPlan(name, new, footprints, pending, running_rss, host_memory(),
+                            os.cpu_count() or 1, self.memory_headroom, self.cpu_headroom)
+
+
+# 本进程内已放行但尚未登记的 Agent (--batch 并发部署时计入后续检查)
+_admitted: Dict[str, Footprint] = {}
+_lock = threading.Lock()
+
+
+def admit(defaults: Dict, name: str, ignore: bool = False,
+          config_dir: Path = None) -> Optional[CapacityPlan]:
+    """部署前容量检查，返回预测 (capacity_policy=off 时返回 None)
+
+    refuse 策略下超出余量抛出 PrerequisiteError (ignore=True 时只返回预测)。
+    放行的 Agent 在 release() 之前计入本进程内其他 Agent 的检查。
+    """
+    policy = defaults.get('capacity_policy', 'warn')
+    if policy not in POLICIES:
+        raise ConfigError(f"未知容量策略: {policy} (可选 {', '.join(POLICIES)})")
+    if policy == 'off':
+        return None
+
+    with _lock:
+        plan = CapacityModel(defaults, config_dir).plan(name, pending=_admitted)
+        if plan.problems and policy == 'refuse' and not ignore:
+            raise PrerequisiteError(
+                f"容量不足，拒绝部署 {name}:\n" + '\n'.join(f"   {line}" for line in plan.lines()) +
+                "\n   确认要部署: 加 --ignore-capacity，或调整 defaults.yaml 的 capacity_* 设置")
+        _admitted[name] = plan.new
+    return plan
+
+
+def release(name: str):
+    """部署结束 (已登记或失败) 后移出本进程的放行列表"""
+    with _lock:
+        _admitted.pop(name, None)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Claw 配置解析器
+读取 Claw 的 ~/.openclaw/openclaw.json 获取各部署器需要的 API key。
+同一路径在进程内只解析一次，文件 mtime 变化时自动重新加载。
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from exceptions import ConfigError
+
+
+_UNRESOLVED = object()
+_MISSING = object()
+
+
+class ClawConfigResolver:
+    """Claw openclaw.json 解析器 (进程内按路径共享，线程安全)"""
+
+    _instances: Dict[Path, 'ClawConfigResolver'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._data: Dict = {}
+        self._resolved: Dict[Tuple[str, ...], Any] = {}
+
+    @classmethod
+    def for_path(cls, path: Path) -> 'ClawConfigResolver':
+        """获取该路径的共享解析器"""
+        path = Path(path).expanduser()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def _current_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> Dict:
+        """返回解析后的配置 (文件不存在时为空字典)"""
+        stamp = self._current_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                if stamp is None:
+                    data = {}
+                else:
+                    try:
+                        with open(self.path) as f:
+                            data = json.load(f)
+                    except ValueError as e:
+                        raise ConfigError(f"Claw 配置解析失败: {self.path}: {e}")
+                self._data, self._stamp = data, stamp
+                self._resolved = {}
+            return self._data
+
+    def get(self, *keys: str, default: Any = '') -> Any:
+        """按路径读取配置项，例如 get('env', 'DASHSCOPE_API_KEY')"""
+        data = self.load()
+        with self._lock:
+            value = self._resolved.get(keys, _UNRESOLVED)
+
+        if value is _UNRESOLVED:
+            value = data
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    value = _MISSING
+                    break
+                value = value[key]
+            
+            with self._lock:
+                if self._data is data:  # 期间未被重新加载
+                    self._resolved[keys] = value
+
+        return default if value is _MISSING else value
+
+    def dashscope_key(self) -> str:
+        return self.get('env', 'DASHSCOPE_API_KEY')
+
+    def fireworks_key(self) -> str:
+        return self.get('models', 'providers', 'fireworks', 'apiKey')
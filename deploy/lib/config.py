@@ -4,29 +4,121 @@
 负责端口分配、UID 分配、配置模板等
 """
 
-import yaml
 import json
+import os
+import fcntl
+import heapq
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
+
+from exceptions import ConfigError
+import registry_snapshot
+from snapshot import listening_ports
+
+
+TEMPLATE_DIR = Path(__file__).parent.parent / 'templates'
+TEMPLATE_CACHE_DIR = Path.home() / '.cache' / 'openclaw-deploy' / 'jinja2'
+
+# 进程内共享的模板环境 (首次渲染时创建)
+_template_env = None
+_template_env_lock = threading.Lock()
+
+# 未在 ports.yaml 中配置 ranges / uid_range 时的默认范围 (闭区间)
+DEFAULT_PORT_RANGES = {'l1': (19001, 19999), 'l2': (19001, 19999)}
+DEFAULT_UID_RANGE = (503, 999)
+
+
+class RangeAllocator:
+    """闭区间 [low, high] 上的分配器
+
+    空闲表是最小堆，占用情况由共享的 used 集合判定 (惰性删除)，
+    多个区间可以重叠并共享同一 used 集合。
+    """
+    
+    def __init__(self, low: int, high: int, used: Set[int], start: int = None):
+        self.low = low
+        self.high = high
+        self.used = used
+        first = max(low, start) if start else low
+        self._free = [v for v in range(first, high + 1) if v not in used]
+        heapq.heapify(self._free)
+    
+    def __contains__(self, value: int) -> bool:
+        return self.low <= value <= self.high
+    
+    def take(self, skip: Set[int] = frozenset()) -> Optional[int]:
+        """取出最小的空闲值并标记占用，无可用值时返回 None
+
+        skip 中的值 (如被其他进程监听的端口) 跳过但留在空闲表中。
+        """
+        skipped = []
+        value = None
+        while self._free:
+            candidate = heapq.heappop(self._free)
+            if candidate in self.used:
+                continue
+            if candidate in skip:
+                skipped.append(candidate)
+                continue
+            self.used.add(candidate)
+            value = candidate
+            break
+        for candidate in skipped:
+            heapq.heappush(self._free, candidate)
+        return value
+    
+    def peek(self, n: int = 1, skip: Set[int] = frozenset()) -> List[int]:
+        """查看接下来会分配的 n 个值 (不占用)"""
+        return heapq.nsmallest(n, (v for v in self._free
+                                   if v not in self.used and v not in skip))
+    
+    def give_back(self, value: int):
+        """归还到空闲表 (调用方负责从 used 中移除)"""
+        if value in self:
+            heapq.heappush(self._free, value)
 
 
 class ConfigManager:
     """配置管理器"""
     
     def __init__(self):
-        self.config_dir = Path(__file__).parent.parent / 'config'
+        self.config_dir = registry_snapshot.default_config_dir()
         self.ports_file = self.config_dir / 'ports.yaml'
         self.agents_file = self.config_dir / 'agents.yaml'
         self.defaults_file = self.config_dir / 'defaults.yaml'
+        self.journal_file = self.config_dir / 'ports.journal.jsonl'
+        self.lock_file = self.config_dir / '.ports.lock'
+        
+        # 批量部署时多个部署器共享同一实例，分配需加锁；
+        # 跨进程通过 _transaction() 的文件锁串行化
+        self._lock = threading.RLock()
+        self._dirty = False
         
-        # 加载配置
+        # 加载配置 (agents / defaults 在首次访问时加载)
+        stamp = registry_snapshot.source_stamp(self.config_dir)
         self.ports = self._load_ports()
-        self.agents = self._load_agents()
-        self.defaults = self._load_defaults()
+        self._build_indexes()
+        if registry_snapshot.read_snapshot(self.config_dir) is None:
+            registry_snapshot.write_snapshot(self.ports, self.config_dir, stamp)
+    
+    @cached_property
+    def agents(self) -> Dict:
+        return self._load_agents()
+    
+    @cached_property
+    def defaults(self) -> Dict:
+        return self._load_defaults()
     
     def _load_yaml(self, file_path: Path) -> Dict:
         """加载 YAML 文件"""
         if file_path.exists():
+            import yaml  # 延迟导入，只读命令走 JSON 快照时无需 yaml
             with open(file_path, 'r') as f:
                 return yaml.safe_load(f) or {}
         return {}
@@ -38,7 +130,15 @@ class ConfigManager:
             'next_available': {'l1': 19003, 'l2': 19004},
             'reserved': [18788, 19000]
         }
-        return self._load_yaml(self.ports_file) or default
+        ports = self._load_yaml(self.ports_file) or default
+        ports = self._replay_journal(ports)
+        
+        # 丢弃已退出进程留下的预留
+        reservations = [r for r in ports.pop('reservations', None) or []
+                        if _pid_alive(r.get('pid'))]
+        if reservations:
+            ports['reservations'] = reservations
+        return ports
     
     def _load_agents(self) -> Dict:
         """加载 Agent 配置"""
@@ -50,55 +150,216 @@ class ConfigManager:
             'default_model': 'anthropic/claude-sonnet-4-6',
             'dashscope_key': '',  # 从环境变量读取
             'shared_path': '/Users/Shared/openclaw-common',
+            'readiness_timeout': 30,  # Gateway 就绪探测超时 (秒)
+            'users_root': '/Users',  # L2 用户家目录的父目录
+            'launch_daemons_dir': '/Library/LaunchDaemons',
+            'service_manager': 'auto',  # auto / launchd / systemd
+            'hibernate_idle_timeout': 1800,  # --supervise 空闲休眠阈值 (秒)
+            'watch_interval': 60,  # --watch 探测间隔 (秒)
+            'watch_history': 120,  # --watch 每个 Agent 保留的最近结果数
+            'rollout_canary': 1,  # --rollout 第一波 (canary) 的 Agent 数
+            'rollout_growth': 2,  # --rollout 每波规模倍数
+            'rollout_max_wave': 16,  # --rollout 单波上限
+            'rollout_soak': 10,  # --rollout 每波重启后观察多久再复查 (秒)
+            'log_compress_after_days': 1,  # 部署日志超过该天数后 gzip 压缩
+            'log_retention_days': 30,  # 部署日志保留天数 (步骤日志除外)
+            'usage_interval': 30,  # 用量采样写入环形文件的最小间隔 (秒)
+            'usage_history': 2880,  # 每个 Agent 保留的用量样本数 (30s 间隔约 24 小时)
+            'top_interval': 2,  # --top 刷新间隔 (秒)
+            'capacity_policy': 'warn',  # 部署前容量检查: off / warn / refuse
+            'capacity_memory_headroom': 0.2,  # 预测内存占用须低于总内存的 (1 - 该比例)
+            'capacity_cpu_headroom': 0.25,  # 预测 CPU 占用须低于 核数×100% 的 (1 - 该比例)
+            'capacity_agent_rss_mb': 400,  # 尚无实测时每个 Agent 的内存预估 (MB)
+            'capacity_agent_cpu': 5,  # 尚无实测时每个 Agent 的 CPU 预估 (%)
         }
         config = self._load_yaml(self.defaults_file) or {}
         
         # 从环境变量读取敏感信息
-        import os
         config['dashscope_key'] = os.environ.get('DASHSCOPE_API_KEY', '')
         
         return {**default, **config}
     
-    def allocate_port(self, mode: str) -> int:
-        """分配端口"""
-        # 获取下一个可用端口
-        port = self.ports['next_available'].get(mode, 19003)
+    def _build_indexes(self):
+        """根据 self.ports 重建端口/UID 索引与各模式的空闲表"""
+        with self._lock:
+            allocated = self.ports.get('allocated', [])
+            reservations = self.ports.get('reservations', [])
+            pid = os.getpid()
+            
+            # 本进程的预留可由本进程释放/认领，其他进程的预留视为占用
+            self._pending_ports = {r['port'] for r in reservations
+                                   if r.get('port') and r.get('pid') == pid}
+            self._pending_uids = {r['uid'] for r in reservations
+                                  if r.get('uid') and r.get('pid') == pid}
+            
+            self._allocated_ports = {a['port'] for a in allocated if a.get('port')}
+            self._reserved_ports = set(self.ports.get('reserved', []))
+            self._used_ports = (self._allocated_ports | self._reserved_ports
+                                | {r['port'] for r in reservations if r.get('port')})
+            self._used_uids = ({a['uid'] for a in allocated if a.get('uid')}
+                               | {r['uid'] for r in reservations if r.get('uid')})
+            
+            ranges = {**DEFAULT_PORT_RANGES, **(self.ports.get('ranges') or {})}
+            next_available = self.ports.get('next_available') or {}
+            self._port_pools = {
+                mode: RangeAllocator(low, high, self._used_ports, next_available.get(mode))
+                for mode, (low, high) in ranges.items()
+            }
+            
+            # 501=xiafybot, 502=shuaishuai
+            low, high = self.ports.get('uid_range') or DEFAULT_UID_RANGE
+            self._uid_pool = RangeAllocator(low, high, self._used_uids)
+    
+    def _port_pool(self, mode: str) -> RangeAllocator:
+        if mode not in self._port_pools:
+            raise ConfigError(f"未知部署模式: {mode}")
+        return self._port_pools[mode]
+    
+    # ── 登记事务 ──
+    
+    @contextmanager
+    def _transaction(self):
+        """加锁的读-改-写事务
+        
+        持有进程内锁与 ports.yaml 的文件锁，从磁盘重新加载最新状态；
+        事务内通过 _journal() 先追加日志再修改内存状态，退出时原子写回。
+        """
+        with self._lock, open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.ports = self._load_ports()
+                self._build_indexes()
+                self._dirty = False
+                yield
+                if self._dirty:
+                    self._save_ports()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _journal(self, op: str, **data):
+        """追加一条变更日志 (fsync 后) 并应用到内存状态"""
+        entry = {
+            'seq': self.ports.get('journal_seq', 0) + 1,
+            'ts': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'op': op,
+            **data,
+        }
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
         
-        # 检查是否被占用
-        while self._is_port_allocated(port):
-            port += 1
+        apply_change(self.ports, entry)
+        self._build_indexes()
+        self._dirty = True
+    
+    def _replay_journal(self, ports: Dict) -> Dict:
+        """重放 ports.yaml 之后的日志 (上次写回前崩溃时恢复)"""
+        if not self.journal_file.exists():
+            return ports
         
-        return port
+        applied = ports.get('journal_seq', 0)
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时未写完的最后一行
+                if entry.get('seq', 0) > applied:
+                    apply_change(ports, entry)
+                    applied = entry['seq']
+        return ports
+    
+    # ── 分配 ──
+    
+    def allocate_port(self, mode: str) -> int:
+        """分配端口 (在注册或释放前对其他部署器保持预留)"""
+        return self.allocate_many(mode, 1)[0]
+    
+    def allocate_many(self, mode: str, n: int) -> List[int]:
+        """一次预留 n 个端口 (批量部署)，端口不足时不预留任何端口
+
+        跳过未登记但正被其他进程监听的端口 (套接字表在文件锁外读取一次)。
+        """
+        live = listening_ports()
+        with self._transaction():
+            pool = self._port_pool(mode)
+            ports = []
+            for _ in range(n):
+                port = pool.take(skip=live)
+                if port is None:
+                    busy = sum(1 for p in live if p in pool and p not in self._used_ports)
+                    raise ConfigError(
+                        f"{mode.upper()} 端口范围 {pool.low}-{pool.high} 剩余不足 {n} 个"
+                        + (f" (另有 {busy} 个被其他进程监听)" if busy else ''))
+                ports.append(port)
+            self._journal('reserve', mode=mode, ports=ports)
+        return ports
+    
+    def peek_ports(self, mode: str, n: int = 1) -> List[int]:
+        """预演用：查看接下来会分配的端口，不预留、不写盘"""
+        live = listening_ports()
+        with self._lock:
+            return self._port_pool(mode).peek(n, skip=live)
+    
+    def peek_uid(self) -> Optional[int]:
+        """预演用：查看接下来会分配的 UID"""
+        with self._lock:
+            return next(iter(self._uid_pool.peek(1)), None)
+    
+    def claim_port(self, port: int, check_listening: bool = True):
+        """预留指定端口 (--port / 续跑)，已被占用时报错；本进程已预留的端口直接通过
+
+        续跑时 Gateway 可能已在监听该端口 (check_listening=False 不检查监听)。
+        """
+        with self._transaction():
+            if port in self._pending_ports:
+                return
+            if self._is_port_allocated(port):
+                raise ConfigError(f"端口 {port} 已被占用或保留")
+            if check_listening and port in listening_ports():
+                raise ConfigError(f"端口 {port} 正被其他进程监听")
+            self._journal('reserve', ports=[port])
+    
+    def release_port(self, port: int):
+        """释放未注册的预留端口 (部署失败时)"""
+        with self._transaction():
+            if port in self._pending_ports:
+                self._journal('release', ports=[port])
     
     def _is_port_allocated(self, port: int) -> bool:
         """检查端口是否已分配"""
-        if port in self.ports.get('reserved', []):
-            return True
-        
-        for agent in self.ports.get('allocated', []):
-            if agent.get('port') == port:
-                return True
-        
-        return False
+        return port in self._used_ports
     
     def allocate_uid(self) -> int:
         """分配 UID"""
-        # 从 503 开始 (501=xiafybot, 502=shuaishuai)
-        uid = 503
-        
-        # 检查是否被占用
-        while self._is_uid_allocated(uid):
-            uid += 1
-        
+        with self._transaction():
+            uid = self._uid_pool.take()
+            if uid is None:
+                raise ConfigError(
+                    f"UID 范围 {self._uid_pool.low}-{self._uid_pool.high} 已耗尽")
+            self._journal('reserve', uids=[uid])
         return uid
     
+    def claim_uid(self, uid: int):
+        """预留指定 UID (续跑)，已被登记或预留时报错；本进程已预留的 UID 直接通过"""
+        with self._transaction():
+            if uid in self._pending_uids:
+                return
+            if self._is_uid_allocated(uid):
+                raise ConfigError(f"UID {uid} 已被占用或预留")
+            self._journal('reserve', uids=[uid])
+    
+    def release_uid(self, uid: int):
+        """释放未注册的预留 UID"""
+        with self._transaction():
+            if uid in self._pending_uids:
+                self._journal('release', uids=[uid])
+    
     def _is_uid_allocated(self, uid: int) -> bool:
         """检查 UID 是否已分配"""
-        for agent in self.ports.get('allocated', []):
-            if agent.get('uid') == uid:
-                return True
-        
-        return False
+        return uid in self._used_uids
     
     def register_agent(self, name: str, mode: str, port: int, username: str = None, uid: int = None):
         """注册 Agent"""
@@ -113,29 +374,60 @@ class ConfigManager:
         if uid:
             agent_info['uid'] = uid
         
-        # 添加到已分配列表
-        if 'allocated' not in self.ports:
-            self.ports['allocated'] = []
-        self.ports['allocated'].append(agent_info)
+        with self._transaction():
+            self._journal('register', agent=agent_info)
+    
+    def update_agent(self, name: str, **fields):
+        """修改已登记 Agent 的选项 (如 hibernate)，未登记时报错"""
+        with self._transaction():
+            if not any((a.get('name') or a.get('agent')) == name
+                       for a in self.ports.get('allocated', [])):
+                raise ConfigError(f"未找到已登记的 Agent: {name}")
+            self._journal('update', name=name, fields=fields)
+    
+    def _save_ports(self):
+        """原子写回端口配置 (临时文件 + fsync + rename)，然后清空已写回的日志"""
+        import yaml
         
-        # 更新下一个可用端口
-        next_port = port + 1
-        while self._is_port_allocated(next_port):
-            next_port += 1
-        self.ports['next_available'][mode] = next_port
+        fd, tmp = tempfile.mkstemp(dir=self.config_dir, prefix='.ports-', suffix='.yaml')
+        try:
+            # mkstemp 建出的文件为 0600，沿用原文件权限 (新建时 0644)
+            try:
+                mode = stat.S_IMODE(os.stat(self.ports_file).st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            os.fchmod(fd, mode)
+            with os.fdopen(fd, 'w') as f:
+                yaml.safe_dump(self.ports, f, default_flow_style=False, allow_unicode=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.ports_file)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
         
-        # 保存配置
-        self._save_ports()
+        self._compact_journal()
+        registry_snapshot.write_snapshot(self.ports, self.config_dir)
     
-    def _save_ports(self):
-        """保存端口配置"""
-        with open(self.ports_file, 'w') as f:
-            yaml.safe_dump(self.ports, f, default_flow_style=False)
+    def _compact_journal(self):
+        """清空已写回 ports.yaml 的日志 (调用方持有文件锁)
+
+        ports.yaml 已记录 journal_seq，日志中的条目均已包含在内；先 fsync 目录
+        使 rename 落盘，再截断日志，崩溃时不会两者皆失。
+        """
+        if not self.journal_file.exists():
+            return
+        dir_fd = os.open(self.config_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        os.truncate(self.journal_file, 0)
     
     def get_template(self, name: str) -> str:
-        """获取配置模板"""
-        template_dir = Path(__file__).parent.parent / 'templates'
-        template_path = template_dir / f'{name}.j2'
+        """获取配置模板源码"""
+        template_path = TEMPLATE_DIR / f'{name}.j2'
         
         if template_path.exists():
             with open(template_path, 'r') as f:
@@ -143,11 +435,114 @@ class ConfigManager:
         
         raise FileNotFoundError(f"Template not found: {name}")
     
+    @property
+    def claw_config(self):
+        """Claw 的 openclaw.json 解析器 (进程内共享)"""
+        from claw_config import ClawConfigResolver
+        return ClawConfigResolver.for_path(Path.home() / '.openclaw' / 'openclaw.json')
+    
+    def render_template(self, name: str, **context) -> str:
+        """渲染模板 (编译结果在进程内与磁盘上缓存)"""
+        import jinja2
+        
+        try:
+            template = template_env().get_template(f'{name}.j2')
+        except jinja2.TemplateNotFound:
+            raise FileNotFoundError(f"Template not found: {name}")
+        return template.render(**context)
+    
     def list_agents(self) -> List[Dict]:
         """列出已部署的 Agent"""
         return self.ports.get('allocated', [])
 
 
+def template_env():
+    """获取共享的 Jinja2 环境
+    
+    每个模板只编译一次；auto_reload 按文件 mtime 判断内存缓存是否过期，
+    重新编译时优先复用磁盘上的字节码 (按源码校验和失效)。
+    """
+    global _template_env
+    
+    with _template_env_lock:
+        if _template_env is None:
+            import jinja2
+            
+            try:
+                TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR))
+            except OSError:
+                bytecode_cache = None  # 缓存目录不可写时只用内存缓存
+            
+            _template_env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(str(TEMPLATE_DIR)),
+                auto_reload=True,
+                bytecode_cache=bytecode_cache,
+            )
+        return _template_env
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # 进程存在但属于其他用户
+    return True
+
+
+def apply_change(ports: Dict, entry: Dict):
+    """将一条日志应用到端口登记 (幂等，可安全重放)"""
+    reservations = ports.setdefault('reservations', [])
+    allocated = ports.setdefault('allocated', [])
+    op = entry['op']
+    
+    if op == 'reserve':
+        held = {(r.get('port'), r.get('uid')) for r in reservations}
+        for port in entry.get('ports', []):
+            if (port, None) not in held:
+                reservations.append({'port': port, 'pid': entry['pid']})
+        for uid in entry.get('uids', []):
+            if (None, uid) not in held:
+                reservations.append({'uid': uid, 'pid': entry['pid']})
+    
+    elif op == 'release':
+        ports_, uids = set(entry.get('ports', [])), set(entry.get('uids', []))
+        reservations[:] = [r for r in reservations
+                           if r.get('port') not in ports_ and r.get('uid') not in uids]
+    
+    elif op == 'register':
+        agent = entry['agent']
+        port, uid = agent['port'], agent.get('uid')
+        reservations[:] = [r for r in reservations
+                           if r.get('port') != port and (uid is None or r.get('uid') != uid)]
+        allocated[:] = [a for a in allocated
+                        if (a.get('name') or a.get('agent')) != agent['name']]
+        allocated.append(agent)
+        
+        # 更新下一个可用端口
+        used = {a.get('port') for a in allocated} | set(ports.get('reserved', []))
+        next_port = port + 1
+        while next_port in used:
+            next_port += 1
+        ports.setdefault('next_available', {})[agent['mode']] = next_port
+    
+    elif op == 'update':
+        for agent in allocated:
+            if (agent.get('name') or agent.get('agent')) == entry['name']:
+                agent.update(entry['fields'])
+    
+    else:
+        raise ConfigError(f"未知的登记日志操作: {op}")
+    
+    if not reservations:
+        del ports['reservations']
+    ports['journal_seq'] = entry['seq']
+
+
 class DeployResult:
     """部署结果"""
     
@@ -162,6 +557,9 @@ class DeployResult:
         self.gateway_running = False
         self.verify_report = None
         self.error = None
+        self.step_timings = {}
+        self.time_to_ready = None
+        self.capacity = None  # 部署前的容量预测 (capacity.CapacityPlan)
 
 
 class VerifyReport:
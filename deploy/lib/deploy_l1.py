@@ -7,6 +7,7 @@ L1 Profile 模式部署器 (v2.0 - 基于实战验证重写)
 - 增加 auth-profiles.json 复制
 - 增加 browser profile 创建
 - 增加 LaunchAgent plist 创建 (替代 Popen)
+- 服务安装经 services 后端 (launchd / systemd --user)
 - 增加 gateway token 自动生成
 - 增加 Telegram allowlist
 - 使用 --profile 参数启动 gateway
@@ -19,10 +20,18 @@ import os
 import secrets
 from pathlib import Path
 from datetime import datetime
-from jinja2 import Template
 
 from config import ConfigManager, DeployResult, VerifyReport, VerifyCheck
 from logger import DeployLogger
+from tracing import command_label
+from steps import Step, StepScheduler, undo_steps
+from journal import StepJournal
+from capacity import CapacityModel, admit, release
+from readiness import wait_until_ready
+from services import CLAW_LABEL, get_backend, l1_label
+from staging import StagedTree
+from reconcile import (LocalFiles, ReconcileResult, Resource, apply, plan,
+                       preserved_config_values, read_json)
 from exceptions import PrerequisiteError, ConfigError
 
 
@@ -39,11 +48,35 @@ class L1Deployer:
         self.workspace_dir = self.home_dir / '.openclaw' / f'workspace-{self.profile_name}'
         self.logs_dir = self.home_dir / '.openclaw' / 'deploy-logs'
         
+        # 步骤日志: --resume 从中恢复参数与已完成的步骤，--rollback 据此撤销
+        self.journal = StepJournal.for_agent(self.logs_dir, 'l1', self.profile_name)
+        self.resume = getattr(args, 'resume', False)
+        self.capacity = None  # 容量预测 (前置条件检查时生成)
+        if self.resume or getattr(args, 'rollback', False):
+            self.journal.restore_args(args)
+        elif not getattr(args, 'dry_run', False) and self.journal.load()['steps']:
+            raise PrerequisiteError(
+                f"{self.profile_name} 有未完成的部署 ({self.journal.path})\n"
+                f"   继续: deploy-agent --resume --name {self.profile_name} --mode l1\n"
+                f"   撤销: deploy-agent --rollback --name {self.profile_name} --mode l1"
+            )
+        
+        # 目录树先在相邻的暂存目录中构建，最后 rename 到位 (workspace 先，profile 后)
+        self.stage = StagedTree({
+            self.workspace_dir: self.workspace_dir.with_name(f'.{self.workspace_dir.name}.staging'),
+            self.profile_dir: self.profile_dir.with_name(f'{self.profile_dir.name}.staging'),
+        })
+        
         # Claw 的关键路径 — 绝对不能碰
         self.claw_config_dir = self.home_dir / '.openclaw'
         self.claw_port = 18789
         
-        self.logger = DeployLogger(self.logs_dir, self.profile_name, 'l1')
+        self.logger = DeployLogger(
+            self.logs_dir, self.profile_name, 'l1', profile=getattr(args, 'profile', False),
+            compress_after_days=config.defaults.get('log_compress_after_days', 1),
+            retention_days=config.defaults.get('log_retention_days', 30))
+        self.services = get_backend(config, 'user', tracer=self.logger.tracer)
+        self.service_label = l1_label(self.profile_name)
         
     def run(self):
         """执行部署"""
@@ -52,111 +85,203 @@ class L1Deployer:
         try:
             self.logger.info(f"🚀 开始部署 {self.profile_name} (L1 模式)")
             
-            # 1. 检查前置条件
-            self._log_step(1, 9, "检查前置条件")
-            self._check_prerequisites()
-            
-            # 2. 分配端口
-            self._log_step(2, 9, "分配端口")
-            result.port = self.config.allocate_port('l1')
-            self._verify_not_claw_port(result.port)
-            self.logger.info(f"   端口: {result.port}")
-            
-            # 3. 创建目录结构
-            self._log_step(3, 9, "创建目录结构")
-            self._create_directories()
-            
-            # 4. 生成配置文件
-            self._log_step(4, 9, "生成 openclaw.json")
-            self._generate_config(result.port)
-            
-            # 5. 复制 auth-profiles
-            self._log_step(5, 9, "复制 auth-profiles")
-            self._copy_auth_profiles()
-            
-            # 6. 配置共享层 symlink
-            self._log_step(6, 9, "配置共享层 symlink")
-            self._setup_symlinks()
-            
-            # 7. 创建 browser profile
-            self._log_step(7, 9, "创建 browser profile")
-            self._create_browser_profile()
-            
-            # 8. 创建 LaunchAgent 并启动
-            self._log_step(8, 9, "创建 LaunchAgent 并启动 Gateway")
-            self._create_and_start_launchagent(result.port)
-            result.gateway_running = True
-            
-            # 9. 验证
-            self._log_step(9, 9, "验证部署")
-            self._verify_deployment(result.port)
+            scheduler = StepScheduler(self._build_steps(result), self.logger,
+                                      journal=self.journal)
+            if self.resume:
+                scheduler.resume(self.journal.load()['steps'])
+            else:
+                self.journal.begin({'role': self.args.role, 'bot_token': self.args.bot_token,
+                                    'port': getattr(self.args, 'port', None)})
+            try:
+                with self.logger.span(f"部署 {self.profile_name}", 'deploy', mode='l1'):
+                    scheduler.run()
+            finally:
+                result.step_timings = scheduler.timings
+                result.capacity = self.capacity
+                self.logger.export_trace()
             
             # 注册 Agent
             self.config.register_agent(self.profile_name, 'l1', result.port)
+            self.journal.remove()
             
             self.logger.info(f"\n✅ {self.profile_name} 部署完成！")
             self.logger.info(f"   端口: {result.port}")
             self.logger.info(f"   配置: {self.profile_dir}/openclaw.json")
             self.logger.info(f"   工作区: {self.workspace_dir}")
             self.logger.info(f"   日志: {self.logger.get_log_path()}")
+            self.logger.info(f"   追踪: {self.logger.get_trace_path()}")
             self.logger.info(f"\n📱 在 Telegram 给 Bot 发 /start 开始配对")
             
         except Exception as e:
             result.success = False
             result.error = str(e)
+            # 端口与已完成的步骤保留在步骤日志中，由 --resume 继续或 rollback() 撤销
             self.logger.info(f"\n❌ 部署失败: {e}")
             self.logger.info(f"   日志: {self.logger.get_log_path()}")
+            self.logger.info(f"   追踪: {self.logger.get_trace_path()}")
             raise
+        finally:
+            release(self.profile_name)
+            self.logger.close()
         
         return result
     
+    def _build_steps(self, result: DeployResult) -> list:
+        """声明部署步骤及其依赖"""
+        def allocate_port():
+            if getattr(self.args, 'port', None):
+                self.config.claim_port(self.args.port)
+                result.port = self.args.port
+            else:
+                result.port = self.config.allocate_port('l1')
+            self._verify_not_claw_port(result.port)
+            self.logger.info(f"   端口: {result.port}")
+            return {'port': result.port}
+        
+        def restore_port(outputs):
+            # 预留随上次部署进程退出而失效，续跑前重新认领 (期间可能已分给其他部署)
+            try:
+                self.config.claim_port(outputs['port'], check_listening=False)
+            except ConfigError as e:
+                raise ConfigError(
+                    f"{e}，无法续跑\n"
+                    f"   撤销: deploy-agent --rollback --name {self.profile_name} --mode l1")
+            result.port = outputs['port']
+        
+        def start_gateway():
+            self._install_and_start_service(result.port)
+            result.gateway_running = True
+        
+        # 暂存目录中的产出: 暂存目录或已安装的正式目录仍在即有效
+        staged = lambda outputs: self.stage.reattach()
+        
+        return [
+            Step('prerequisites', "检查前置条件", self._check_prerequisites),
+            Step('port', "分配端口", allocate_port, deps=['prerequisites'],
+                 restore=restore_port,
+                 undo=lambda outputs: self.config.release_port(outputs['port'])),
+            # directories → symlinks 均写入暂存目录，install 一次 rename 到位
+            Step('directories', "创建目录结构 (暂存)", self._create_directories,
+                 deps=['prerequisites'], restore=staged, undo=self._undo_tree),
+            Step('config', "生成 openclaw.json",
+                 lambda: self._generate_config(result.port),
+                 deps=['port', 'directories'], restore=staged),
+            Step('workspace', "生成 workspace 文件", self._generate_workspace_files,
+                 deps=['directories'], restore=staged),
+            Step('auth', "复制 auth-profiles", self._copy_auth_profiles,
+                 deps=['directories'], restore=staged),
+            Step('symlinks', "配置共享层 symlink", self._setup_symlinks,
+                 deps=['directories'], restore=staged),
+            Step('install', "安装 Profile 与 workspace", self._install_tree,
+                 deps=['config', 'workspace', 'auth', 'symlinks'],
+                 restore=lambda outputs: self.stage.complete, undo=self._undo_tree),
+            # openclaw CLI 会读写 profile 的 openclaw.json，需等安装到位后执行
+            Step('browser', "创建 browser profile", self._create_browser_profile,
+                 deps=['install']),
+            Step('gateway', f"创建 {self.services.display_name} 并启动 Gateway", start_gateway,
+                 deps=['install', 'browser'], undo=self._undo_service),
+            Step('verify', "验证部署", lambda: self._verify_deployment(result),
+                 deps=['gateway']),
+        ]
+    
     def dry_run(self):
         """预演模式"""
-        port = self.config.allocate_port('l1')
+        port = getattr(self.args, 'port', None) or self.config.peek_ports('l1')[0]
         self.logger.info("预演部署步骤:")
         steps = [
             "检查前置条件 (OpenClaw 已安装、共享层存在、Profile 不存在)",
             f"分配端口: {port}",
-            f"创建目录: {self.profile_dir} + {self.workspace_dir}",
+            f"在暂存目录中创建: {self.profile_dir} + {self.workspace_dir}",
             "生成 openclaw.json (从模板，含完整模型配置)",
+            "生成 workspace 文件 (IDENTITY / MEMORY / USER)",
             f"复制 auth-profiles.json (从 Claw)",
             "配置共享层 symlink (skills + protocols + knowledge)",
+            "安装: 暂存目录 rename 到正式位置",
             f"创建 browser profile: {self.profile_name}-browser",
-            f"创建 LaunchAgent: ai.openclaw.gateway.{self.profile_name}",
+            f"创建 {self.services.display_name}: {self.service_label}",
             "验证: HTTP probe 端口响应",
         ]
         for i, step in enumerate(steps, 1):
             self.logger.info(f"  {i}. {step}")
+        if self.config.defaults.get('capacity_policy', 'warn') != 'off':
+            plan = CapacityModel(self.config.defaults, self.config.config_dir).plan(self.profile_name)
+            for line in plan.lines():
+                self.logger.info(line)
         self.logger.info("\n✅ 预演完成 (未实际执行)")
     
     def rollback(self):
-        """回滚"""
+        """回滚
+
+        有步骤日志 (部署未完成) 时按日志逆序撤销已完成的步骤；
+        否则视为已完成的部署，整体卸载。
+        """
         self.logger.info(f"🔄 回滚 L1 部署: {self.profile_name}")
         
-        # 1. 停止并卸载 LaunchAgent
-        plist_path = self.home_dir / 'Library' / 'LaunchAgents' / f'ai.openclaw.gateway.{self.profile_name}.plist'
-        if plist_path.exists():
-            subprocess.run(['launchctl', 'unload', str(plist_path)], capture_output=True)
-            plist_path.unlink()
-            self.logger.info("   已卸载 LaunchAgent")
-        
-        # 2. 杀残留进程
-        subprocess.run(
-            ['pkill', '-f', f'--profile {self.profile_name} gateway'],
-            capture_output=True
-        )
-        
-        # 3. 删除 Profile 目录
-        if self.profile_dir.exists():
-            shutil.rmtree(self.profile_dir)
-            self.logger.info(f"   已删除 {self.profile_dir}")
-        
-        # 4. 删除 workspace
-        if self.workspace_dir.exists():
-            shutil.rmtree(self.workspace_dir)
-            self.logger.info(f"   已删除 {self.workspace_dir}")
-        
-        self.logger.info("✅ 回滚完成")
+        try:
+            if self.journal.exists():
+                if undo_steps(self._build_steps(DeployResult(False, 'l1', self.profile_name)),
+                              self.journal, self.logger):
+                    self.logger.info("✅ 回滚完成")
+                else:
+                    self.logger.info("⚠️  部分步骤未能撤销，修复后再次运行 --rollback")
+                return
+            
+            # 1. 停止并卸载服务，杀残留进程
+            self._undo_service()
+            
+            # 2. 删除 Profile 目录
+            if self.profile_dir.exists():
+                shutil.rmtree(self.profile_dir)
+                self.logger.info(f"   已删除 {self.profile_dir}")
+            
+            # 3. 删除 workspace
+            if self.workspace_dir.exists():
+                shutil.rmtree(self.workspace_dir)
+                self.logger.info(f"   已删除 {self.workspace_dir}")
+            
+            self.logger.info("✅ 回滚完成")
+        finally:
+            self.logger.close()
+    
+    def reconcile(self, dry_run: bool = False) -> ReconcileResult:
+        """增量收敛: 按当前模板比对已部署的文件，只写入有差异的项
+
+        不重启服务；result.changes 中含需要重启的项时由调用方统一重启。
+        """
+        port = self.args.port
+        if not self.profile_dir.exists():
+            raise PrerequisiteError(f"Profile 不存在: {self.profile_dir} (尚未部署)")
+        self._verify_not_claw_port(port)
+        
+        result = ReconcileResult(self.profile_name, 'l1', port)
+        files = LocalFiles(self.logger)
+        config_path = self.profile_dir / 'openclaw.json'
+        try:
+            with self.logger.span(f"收敛 {self.profile_name}", 'reconcile', mode='l1'):
+                preserved = preserved_config_values(read_json(files, config_path))
+                unit = self._render_unit(port)
+                auth_src, auth_dst = self._auth_profiles_paths()
+                resources = [
+                    Resource('json', config_path,
+                             json.loads(self._render_config(port, **preserved)), restart=True),
+                    Resource('file', unit.path, unit.content, restart=True,
+                             install=lambda: self.services.install([unit])),
+                    Resource('file', auth_dst, auth_src.read_text()),
+                    *[Resource('seed', path, content) for path, content in self._workspace_files()],
+                    *[Resource('symlink', dst, src) for src, dst in self._symlink_pairs()],
+                ]
+                
+                result.changes = plan(resources, files)
+                for change in result.changes:
+                    self.logger.debug(f"收敛 {change.action}: {change.resource.path}")
+                if not dry_run:
+                    apply(result.changes, files)
+        finally:
+            self.logger.export_trace()
+            self.logger.close()
+        
+        result.backend, result.unit = self.services, unit
+        return result
     
     # ── Safety guards ──
     
@@ -165,15 +290,46 @@ class L1Deployer:
         if port == self.claw_port:
             raise ConfigError(f"端口 {port} 是 Claw 的端口，禁止使用！")
     
-    def _verify_not_claw_service(self, plist_name: str):
+    def _verify_not_claw_service(self, label: str):
         """确保不会操作 Claw 的 LaunchAgent"""
-        if plist_name == 'ai.openclaw.gateway.plist':
+        if label == CLAW_LABEL:
             raise ConfigError("禁止操作 Claw 的 LaunchAgent！")
     
-    # ── Step implementations ──
+    # ── Helpers ──
+    
+    def _run(self, command: list, **kwargs):
+        """执行子进程 (记录 span)"""
+        with self.logger.span(command_label(command), 'subprocess'):
+            return subprocess.run(command, **kwargs)
+    
+    def _write_file(self, path: Path, content: str):
+        """写入文件 (记录 span)"""
+        with self.logger.span('write', 'file', path=str(path)):
+            Path(path).write_text(content)
+    
+    # ── Undo ──
     
-    def _log_step(self, num: int, total: int, msg: str):
-        self.logger.info(f"[{num}/{total}] {msg}...")
+    def _undo_tree(self, outputs: dict = None):
+        """删除暂存目录与本次已安装的 Profile / workspace"""
+        self.stage.reattach()
+        installed = list(self.stage.installed)
+        self.stage.undo()
+        for path in installed:
+            self.logger.info(f"   已删除 {path}")
+    
+    def _undo_service(self, outputs: dict = None):
+        """卸载服务单元并杀残留进程"""
+        unit = self.services.unit(self.service_label)
+        if unit.path.exists():
+            self.services.remove([unit])
+            self.logger.info(f"   已卸载 {self.services.display_name}")
+        
+        self._run(
+            ['pkill', '-f', f'--profile {self.profile_name} gateway'],
+            capture_output=True
+        )
+    
+    # ── Step implementations ──
     
     def _check_prerequisites(self):
         if not shutil.which('openclaw'):
@@ -189,114 +345,132 @@ class L1Deployer:
                 f"   如需重新部署，先运行: deploy-agent --rollback --name {self.profile_name} --mode l1"
             )
         
+        self._check_capacity()
         self.logger.debug("前置条件检查通过")
     
+    def _check_capacity(self):
+        """容量检查: 按实测占用预测部署后的内存 / CPU，超出余量时警告或拒绝 (capacity_policy)"""
+        self.capacity = admit(self.config.defaults, self.profile_name,
+                              ignore=getattr(self.args, 'ignore_capacity', False),
+                              config_dir=self.config.config_dir)
+        if self.capacity is None:
+            return
+        log = self.logger.warning if self.capacity.problems else self.logger.info
+        for line in self.capacity.lines():
+            log(f"   {line}")
+    
     def _create_directories(self):
-        self.profile_dir.mkdir(parents=True, exist_ok=True)
-        (self.profile_dir / 'logs').mkdir(exist_ok=True)
-        
-        self.workspace_dir.mkdir(parents=True, exist_ok=True)
-        (self.workspace_dir / 'memory').mkdir(exist_ok=True)
-        (self.workspace_dir / 'docs').mkdir(exist_ok=True)
-        (self.workspace_dir / 'skills').mkdir(exist_ok=True)
-        
-        self.logger.debug(f"目录已创建: {self.profile_dir}, {self.workspace_dir}")
+        self.stage.prepare()
+        for path in (self.profile_dir / 'logs',
+                     self.profile_dir / 'agents' / 'main' / 'agent',
+                     self.workspace_dir / 'memory',
+                     self.workspace_dir / 'docs',
+                     self.workspace_dir / 'skills'):
+            self.stage.path(path).mkdir(parents=True, exist_ok=True)
+        
+        self.logger.debug(f"暂存目录已创建: {', '.join(map(str, self.stage.roots.values()))}")
+    
+    def _install_tree(self):
+        """把暂存目录 rename 到正式位置"""
+        with self.logger.span('rename', 'file', path=str(self.profile_dir)):
+            self.stage.install()
+        self.logger.debug(f"目录已安装: {self.profile_dir}, {self.workspace_dir}")
     
     def _generate_config(self, port: int):
-        template_str = self.config.get_template('openclaw.json')
-        template = Template(template_str)
-        
-        # 读取 API keys
-        dashscope_key = self.config.defaults.get('dashscope_key', '')
-        if not dashscope_key:
-            # 从 Claw 的 config 读取
-            claw_config_path = self.claw_config_dir / 'openclaw.json'
-            if claw_config_path.exists():
-                with open(claw_config_path) as f:
-                    claw_config = json.load(f)
-                dashscope_key = claw_config.get('env', {}).get('DASHSCOPE_API_KEY', '')
-        
-        fireworks_key = self._get_fireworks_key()
-        
-        config_data = template.render(
+        config_path = self.profile_dir / 'openclaw.json'
+        self._write_file(self.stage.path(config_path), self._render_config(port))
+        
+        self.logger.debug(f"配置已生成: {config_path}")
+    
+    def _render_config(self, port: int, gateway_token: str = None,
+                       bot_token: str = None, deploy_time: str = None,
+                       last_touched_version: str = None) -> str:
+        """渲染 openclaw.json (收敛时传入沿用的 token、部署时间与 CLI 版本标记)"""
+        # 读取 API keys (环境变量优先，否则从 Claw 的 config 读取)
+        claw_config = self.config.claw_config
+        dashscope_key = (self.config.defaults.get('dashscope_key', '')
+                         or claw_config.dashscope_key())
+        fireworks_key = claw_config.fireworks_key()
+        
+        return self.config.render_template(
+            'openclaw.json',
             agent_name=self.profile_name,
             port=port,
-            bot_token=self.args.bot_token or '',
+            bot_token=self.args.bot_token or bot_token or '',
             default_model=self.config.defaults.get('default_model', 'anthropic/claude-sonnet-4-6'),
             dashscope_key=dashscope_key,
             fireworks_key=fireworks_key,
             workspace_path=str(self.workspace_dir),
-            gateway_token=secrets.token_hex(24),
+            gateway_token=gateway_token or secrets.token_hex(24),
             home_dir=str(self.home_dir),
-            deploy_time=datetime.now().isoformat(),
+            deploy_time=deploy_time or datetime.now().isoformat(),
+            last_touched_version=last_touched_version,
         )
-        
-        config_path = self.profile_dir / 'openclaw.json'
-        with open(config_path, 'w') as f:
-            f.write(config_data)
-        
-        self.logger.debug(f"配置已生成: {config_path}")
-        
-        # 生成 workspace 核心文件
-        self._generate_workspace_files()
-    
-    def _get_fireworks_key(self) -> str:
-        """从 Claw 配置读取 Fireworks API Key"""
-        claw_config_path = self.claw_config_dir / 'openclaw.json'
-        if claw_config_path.exists():
-            with open(claw_config_path) as f:
-                claw_config = json.load(f)
-            providers = claw_config.get('models', {}).get('providers', {})
-            return providers.get('fireworks', {}).get('apiKey', '')
-        return ''
     
     def _generate_workspace_files(self):
         """生成 workspace 核心 .md 文件"""
+        for path, content in self._workspace_files():
+            self._write_file(self.stage.path(path), content)
+        
+        self.logger.debug("Workspace 文件已生成")
+    
+    def _workspace_files(self) -> list:
+        """workspace 核心文件 [(路径, 内容)]"""
         role = self.args.role or 'AI Assistant'
         
         # IDENTITY.md
-        identity_template = self.config.get_template('IDENTITY.md')
-        identity = Template(identity_template).render(
+        identity = self.config.render_template(
+            'IDENTITY.md',
             agent_name=self.profile_name,
             role=role,
             mode='l1',
             role_description=role,
             deploy_time=datetime.now().strftime('%Y-%m-%d %H:%M'),
         )
-        (self.workspace_dir / 'IDENTITY.md').write_text(identity)
         
-        # MEMORY.md (空)
-        (self.workspace_dir / 'MEMORY.md').write_text(
-            f"# MEMORY.md - {self.profile_name}\n\n<!-- 按时间倒序记录 -->\n"
-        )
-        
-        # USER.md (精简版)
-        (self.workspace_dir / 'USER.md').write_text(
-            f"# USER.md\n\n"
-            f"- **Name:** Mr Xia / 夏总\n"
-            f"- **Company:** Peblla — 美国餐饮行业 SaaS 科技公司\n"
-            f"- **Role:** CEO, 联合创始人\n"
-            f"- **Timezone:** Asia/Shanghai (GMT+8)\n\n"
-            f"## 沟通偏好\n"
-            f"- 直接、结论优先\n"
-            f"- 中文为主，保留必要英文术语\n"
-        )
-        
-        self.logger.debug("Workspace 文件已生成")
+        return [
+            (self.workspace_dir / 'IDENTITY.md', identity),
+            # MEMORY.md (空)
+            (self.workspace_dir / 'MEMORY.md',
+             f"# MEMORY.md - {self.profile_name}\n\n<!-- 按时间倒序记录 -->\n"),
+            # USER.md (精简版)
+            (self.workspace_dir / 'USER.md',
+             f"# USER.md\n\n"
+             f"- **Name:** Mr Xia / 夏总\n"
+             f"- **Company:** Peblla — 美国餐饮行业 SaaS 科技公司\n"
+             f"- **Role:** CEO, 联合创始人\n"
+             f"- **Timezone:** Asia/Shanghai (GMT+8)\n\n"
+             f"## 沟通偏好\n"
+             f"- 直接、结论优先\n"
+             f"- 中文为主，保留必要英文术语\n"),
+        ]
     
     def _copy_auth_profiles(self):
         """从 Claw 复制 auth-profiles.json"""
+        src, dst = self._auth_profiles_paths()
+        with self.logger.span('copy', 'file', path=str(dst)):
+            shutil.copy(src, self.stage.path(dst))
+        
+        self.logger.debug(f"auth-profiles.json 已复制")
+    
+    def _auth_profiles_paths(self) -> tuple:
+        """auth-profiles.json 的 (Claw 源文件, 目标路径)"""
         src = self.claw_config_dir / 'agents' / 'main' / 'agent' / 'auth-profiles.json'
         if not src.exists():
             raise ConfigError(f"Claw auth-profiles 不存在: {src}")
-        
-        dst_dir = self.profile_dir / 'agents' / 'main' / 'agent'
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        shutil.copy(src, dst_dir / 'auth-profiles.json')
-        
-        self.logger.debug(f"auth-profiles.json 已复制")
+        return src, self.profile_dir / 'agents' / 'main' / 'agent' / 'auth-profiles.json'
     
     def _setup_symlinks(self):
+        for src_path, dst_path in self._symlink_pairs():
+            staged = self.stage.path(dst_path)
+            staged.parent.mkdir(parents=True, exist_ok=True)
+            if staged.is_symlink():
+                staged.unlink()  # 续跑时重新执行
+            staged.symlink_to(src_path)
+            self.logger.debug(f"symlink: {dst_path.relative_to(self.workspace_dir)} → {src_path}")
+    
+    def _symlink_pairs(self) -> list:
+        """共享层 symlink [(源, 目标)]，跳过源不存在的项"""
         shared = Path(self.config.defaults['shared_path'])
         
         symlinks = [
@@ -307,24 +481,20 @@ class L1Deployer:
             ('knowledge', 'knowledge'),
         ]
         
+        pairs = []
         for src_rel, dst_rel in symlinks:
             src_path = shared / src_rel
-            dst_path = self.workspace_dir / dst_rel
-            
             if src_path.exists():
-                dst_path.parent.mkdir(parents=True, exist_ok=True)
-                if dst_path.exists() or dst_path.is_symlink():
-                    dst_path.unlink()
-                dst_path.symlink_to(src_path)
-                self.logger.debug(f"symlink: {dst_rel} → {src_path}")
+                pairs.append((src_path, self.workspace_dir / dst_rel))
             else:
                 self.logger.debug(f"跳过 (源不存在): {src_path}")
+        return pairs
     
     def _create_browser_profile(self):
         """创建独立 browser profile"""
         profile_name = f"{self.profile_name}-browser"
         
-        result = subprocess.run(
+        result = self._run(
             ['openclaw', '--profile', self.profile_name,
              'browser', 'create-profile', '--name', profile_name],
             capture_output=True, text=True
@@ -340,65 +510,50 @@ class L1Deployer:
                 if 'port' in line:
                     self.logger.info(f"   {line.strip()}")
     
-    def _create_and_start_launchagent(self, port: int):
-        """创建 LaunchAgent plist 并启动"""
-        plist_name = f"ai.openclaw.gateway.{self.profile_name}.plist"
+    def _install_and_start_service(self, port: int):
+        """创建 Gateway 服务单元 (LaunchAgent plist / systemd unit) 并启动"""
+        unit = self._render_unit(port)
         
-        # 安全检查
-        self._verify_not_claw_service(plist_name)
+        # 与同时部署的其他 Agent 合并为一次 launchctl/systemctl 调用
+        try:
+            self.services.apply([unit])
+        except Exception as e:
+            raise ConfigError(f"{self.services.display_name} 加载失败: {e}")
         
-        template_str = self.config.get_template('launchagent.plist')
-        template = Template(template_str)
+        self.logger.debug(f"{self.services.display_name} 已加载: {unit.path}")
+    
+    def _render_unit(self, port: int):
+        """渲染 Gateway 服务单元"""
+        # 安全检查
+        self._verify_not_claw_service(self.service_label)
         
-        plist_content = template.render(
+        return self.services.render_unit(
+            self.config, self.service_label,
             agent_name=self.profile_name,
             port=str(port),
             home_dir=str(self.home_dir),
             profile_dir=str(self.profile_dir),
         )
-        
-        plist_path = self.home_dir / 'Library' / 'LaunchAgents' / plist_name
-        with open(plist_path, 'w') as f:
-            f.write(plist_content)
-        
-        self.logger.debug(f"LaunchAgent 已创建: {plist_path}")
-        
-        # 加载并启动
-        result = subprocess.run(
-            ['launchctl', 'load', str(plist_path)],
-            capture_output=True, text=True
-        )
-        
-        if result.returncode != 0:
-            raise ConfigError(f"LaunchAgent 加载失败: {result.stderr}")
-        
-        self.logger.debug("LaunchAgent 已加载")
-        
-        # 等待启动
-        import time
-        time.sleep(3)
     
-    def _verify_deployment(self, port: int):
-        """验证部署是否成功"""
-        import urllib.request
-        
-        try:
-            url = f"http://127.0.0.1:{port}/"
-            req = urllib.request.Request(url, method='GET')
-            with urllib.request.urlopen(req, timeout=5) as resp:
-                if resp.status == 200:
-                    self.logger.info(f"   ✅ Gateway 端口 {port} 响应正常")
-                    return
-        except Exception as e:
-            pass
-        
-        # 检查 LaunchAgent 退出码
-        result = subprocess.run(
-            ['launchctl', 'list'],
-            capture_output=True, text=True
-        )
-        for line in result.stdout.splitlines():
-            if self.profile_name in line:
-                self.logger.info(f"   LaunchAgent 状态: {line.strip()}")
-        
-        self.logger.info(f"   ⚠️ Gateway 未响应，查看日志: {self.profile_dir}/logs/gateway.err.log")
+    def _verify_deployment(self, result: DeployResult):
+        """验证部署是否成功 (轮询直到 Gateway 就绪或超时)"""
+        port = result.port
+        with self.logger.span('wait_until_ready', 'probe', port=port):
+            readiness = wait_until_ready(
+                port, timeout=self.config.defaults.get('readiness_timeout', 30))
+        
+        if readiness.ready:
+            result.time_to_ready = readiness.elapsed
+            self.logger.info(f"   ✅ Gateway 端口 {port} 响应正常 "
+                             f"(就绪耗时 {readiness.elapsed:.2f}s, {readiness.attempts} 次探测)")
+            return
+        
+        self.logger.debug(f"就绪探测失败 ({readiness.stage}): {readiness.error}")
+        
+        # 检查服务状态 (launchd 退出码 / systemd 活动状态)
+        status = self.services.status(self.service_label)
+        if status:
+            self.logger.info(f"   {self.services.display_name} 状态: {status}")
+        
+        self.logger.info(f"   ⚠️ Gateway 未响应，查看日志: "
+                         f"{self.services.gateway_logs(self.profile_name, self.profile_dir)[1]}")
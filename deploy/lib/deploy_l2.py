@@ -13,40 +13,98 @@ L2 独立用户模式部署器 (v2.0 - 基于实战验证重写)
 """
 
 import subprocess
+import getpass
 import shutil
 import json
-import os
-import time
 import secrets
 import tempfile
+import threading
 from pathlib import Path
 from datetime import datetime
-from jinja2 import Template
 
 from config import ConfigManager, DeployResult
 from logger import DeployLogger
+from tracing import command_label
+from steps import Step, StepScheduler, undo_steps
+from journal import StepJournal
+from capacity import CapacityModel, admit, release
+from readiness import wait_until_ready
+from services import get_backend, l2_label
+from staging import StagedTree, archive_tree
+from reconcile import (PrivilegedFiles, ReconcileResult, Resource, apply, plan,
+                       preserved_config_values, read_json)
+from privhelper import PrivilegedHelper
 from exceptions import (
     PrerequisiteError, ConfigError, PermissionError,
 )
 
+# 批量部署时多个 L2 部署器并发运行，交互式输入 (passwd) 必须串行
+_TTY_LOCK = threading.Lock()
+
 
 class L2Deployer:
     """L2 独立用户模式部署器"""
     
-    def __init__(self, config: ConfigManager, args, sudo_password: str):
+    def __init__(self, config: ConfigManager, args, sudo_password: str,
+                 privileged=None):
         self.config = config
         self.args = args
         self.sudo_password = sudo_password
+        # 调用方可传入共享的特权助手 (例如 fleet 收敛时多个部署器共用一个)
+        self._shared_privileged = privileged
+        self._helper = None
+        self._helper_lock = threading.Lock()
         self.username = args.username
         self.home_dir = Path.home()
-        self.uid = args.uid if hasattr(args, 'uid') and args.uid else config.allocate_uid()
-        self.user_home = Path('/Users') / self.username
+        self.logs_dir = self.home_dir / '.openclaw' / 'deploy-logs'
+        
+        # 步骤日志: --resume 从中恢复参数 (含 UID) 与已完成的步骤，--rollback 据此撤销
+        self.journal = StepJournal.for_agent(self.logs_dir, 'l2', self.username)
+        self.resume = getattr(args, 'resume', False)
+        self.capacity = None  # 容量预测 (前置条件检查时生成)
+        rollback = getattr(args, 'rollback', False)
+        if self.resume or rollback:
+            self.journal.restore_args(args)
+        elif not getattr(args, 'dry_run', False) and self.journal.load()['steps']:
+            raise PrerequisiteError(
+                f"{self.username} 有未完成的部署 ({self.journal.path})\n"
+                f"   继续: deploy-agent --resume --username {self.username} --mode l2\n"
+                f"   撤销: deploy-agent --rollback --username {self.username} --mode l2"
+            )
+        
+        self._uid_reserved = False
+        if getattr(args, 'uid', None) and self.resume:
+            # 步骤日志中的 UID 预留随上次部署进程退出而失效，重新认领
+            self.uid = args.uid
+            try:
+                config.claim_uid(self.uid)
+            except ConfigError as e:
+                raise ConfigError(f"{e}，无法续跑\n{self._rollback_hint}")
+        elif getattr(args, 'uid', None):
+            self.uid = args.uid
+        elif getattr(args, 'dry_run', False):
+            self.uid = config.peek_uid()
+        elif rollback:
+            self.uid = None  # 回滚已完成的部署按用户名操作，不需要 UID
+        else:
+            self.uid = config.allocate_uid()
+            self._uid_reserved = True
+        self.user_home = Path(config.defaults['users_root']) / self.username
+        self.openclaw_dir = self.user_home / '.openclaw'
+        # .openclaw 目录树在本地暂存目录中构建 (创建目录结构时建立)，
+        # 最后经特权助手一次解包到家目录
+        self.stage = None
         
         # Claw 安全检查
         self.claw_port = 18789
         
-        self.logs_dir = self.home_dir / '.openclaw' / 'deploy-logs'
-        self.logger = DeployLogger(self.logs_dir, self.username, 'l2')
+        self.logger = DeployLogger(
+            self.logs_dir, self.username, 'l2', profile=getattr(args, 'profile', False),
+            compress_after_days=config.defaults.get('log_compress_after_days', 1),
+            retention_days=config.defaults.get('log_retention_days', 30))
+        self.services = get_backend(config, 'system', privileged=self._privileged,
+                                    tracer=self.logger.tracer)
+        self.service_label = l2_label(self.username)
         
     def run(self):
         """执行部署"""
@@ -57,115 +115,225 @@ class L2Deployer:
         try:
             self.logger.info(f"🚀 开始部署 {self.username} (L2 模式)")
             
-            # 1. 检查前置条件
-            self._log_step(1, 10, "检查前置条件")
-            self._check_prerequisites()
-            
-            # 2. 分配端口
-            self._log_step(2, 10, "分配端口")
-            result.port = self.config.allocate_port('l2')
-            self._verify_not_claw_port(result.port)
-            self.logger.info(f"   端口: {result.port}")
-            
-            # 3. 创建 macOS 用户
-            self._log_step(3, 10, "创建 macOS 用户")
-            self._create_user()
-            
-            # 4. 安装依赖
-            self._log_step(4, 10, "安装依赖")
-            self._install_dependencies()
-            
-            # 5. 生成配置文件
-            self._log_step(5, 10, "生成配置文件")
-            self._generate_config(result.port)
-            
-            # 6. 复制 auth-profiles
-            self._log_step(6, 10, "复制 auth-profiles")
-            self._copy_auth_profiles()
-            
-            # 7. 配置共享层 symlink
-            self._log_step(7, 10, "配置共享层 symlink")
-            self._setup_symlinks()
-            
-            # 8. 创建 browser profile
-            self._log_step(8, 10, "创建 browser profile")
-            self._create_browser_profile()
-            
-            # 9. 配置 LaunchDaemon 并启动
-            self._log_step(9, 10, "配置 LaunchDaemon 并启动")
-            self._setup_and_start_launchdaemon(result.port)
-            result.gateway_running = True
-            
-            # 10. 验证
-            self._log_step(10, 10, "验证部署")
-            self._verify_deployment(result.port)
+            scheduler = StepScheduler(self._build_steps(result), self.logger,
+                                      journal=self.journal)
+            if self.resume:
+                scheduler.resume(self.journal.load()['steps'])
+            else:
+                self.journal.begin(
+                    {'role': self.args.role, 'bot_token': self.args.bot_token,
+                     'port': getattr(self.args, 'port', None), 'uid': self.uid},
+                    reserved={'uid': self.uid} if self._uid_reserved else None)
+            try:
+                with self.logger.span(f"部署 {self.username}", 'deploy', mode='l2'):
+                    scheduler.run()
+            finally:
+                result.step_timings = scheduler.timings
+                result.capacity = self.capacity
+                self._close_helper()
+                self.logger.export_trace()
             
             # 注册 Agent
             self.config.register_agent(
                 self.username, 'l2', result.port,
                 username=self.username, uid=self.uid
             )
+            self.journal.remove()
             
             self.logger.info(f"\n✅ {self.username} 部署完成！")
             self.logger.info(f"   用户: {self.username} (UID {self.uid})")
             self.logger.info(f"   端口: {result.port}")
             self.logger.info(f"   家目录: {self.user_home}")
             self.logger.info(f"   日志: {self.logger.get_log_path()}")
+            self.logger.info(f"   追踪: {self.logger.get_trace_path()}")
             self.logger.info(f"\n📱 在 Telegram 给 Bot 发 /start 开始配对")
             
         except Exception as e:
             result.success = False
             result.error = str(e)
+            # 端口、UID 与已完成的步骤保留在步骤日志中，由 --resume 继续或 rollback() 撤销
             self.logger.info(f"\n❌ 部署失败: {e}")
             self.logger.info(f"   日志: {self.logger.get_log_path()}")
+            self.logger.info(f"   追踪: {self.logger.get_trace_path()}")
             raise
+        finally:
+            release(self.username)
+            self.logger.close()
         
         return result
     
+    def _build_steps(self, result: DeployResult) -> list:
+        """声明部署步骤及其依赖"""
+        def allocate_port():
+            if getattr(self.args, 'port', None):
+                self.config.claim_port(self.args.port)
+                result.port = self.args.port
+            else:
+                result.port = self.config.allocate_port('l2')
+            self._verify_not_claw_port(result.port)
+            self.logger.info(f"   端口: {result.port}")
+            return {'port': result.port}
+        
+        def restore_port(outputs):
+            # 预留随上次部署进程退出而失效，续跑前重新认领 (期间可能已分给其他部署)
+            try:
+                self.config.claim_port(outputs['port'], check_listening=False)
+            except ConfigError as e:
+                raise ConfigError(f"{e}，无法续跑\n{self._rollback_hint}")
+            result.port = outputs['port']
+        
+        def start_gateway():
+            self._install_and_start_service(result.port)
+            result.gateway_running = True
+        
+        def restore_stage(outputs):
+            # 本地暂存目录可能已被清理 (如重启后 /tmp 清空)，此时从创建目录起重做
+            self.stage = StagedTree({self.openclaw_dir: Path(outputs['staging'])})
+            return self.stage.reattach()
+        
+        staged = lambda outputs: self.stage.reattach()
+        
+        return [
+            Step('prerequisites', "检查前置条件", self._check_prerequisites),
+            Step('port', "分配端口", allocate_port, deps=['prerequisites'],
+                 restore=restore_port,
+                 undo=lambda outputs: self.config.release_port(outputs['port'])),
+            Step('user', "创建 macOS 用户", self._create_user, deps=['prerequisites'],
+                 undo=self._undo_user),
+            Step('dependencies', "安装依赖", self._install_dependencies, deps=['user']),
+            # directories → symlinks 在本地暂存目录中进行，不需要 root，与创建用户并行
+            Step('directories', "创建目录结构 (暂存)", self._create_directories,
+                 deps=['prerequisites'], restore=restore_stage,
+                 undo=lambda outputs: shutil.rmtree(outputs['staging'], ignore_errors=True)),
+            Step('config', "生成配置文件", lambda: self._generate_config(result.port),
+                 deps=['port', 'directories'], restore=staged),
+            Step('workspace', "生成 workspace 文件", self._generate_workspace_files,
+                 deps=['directories'], restore=staged),
+            Step('auth', "复制 auth-profiles", self._copy_auth_profiles,
+                 deps=['directories'], restore=staged),
+            Step('symlinks', "配置共享层 symlink", self._setup_symlinks,
+                 deps=['directories'], restore=staged),
+            Step('install', "安装 .openclaw 目录树", self._install_tree,
+                 deps=['user', 'config', 'workspace', 'auth', 'symlinks'],
+                 restore=lambda outputs: self.stage.complete,
+                 undo=lambda outputs: self._privileged().remove(self.openclaw_dir, recursive=True)),
+            # openclaw CLI 会读写用户的 openclaw.json，需等安装到位后执行
+            Step('browser', "创建 browser profile", self._create_browser_profile,
+                 deps=['dependencies', 'install']),
+            Step('gateway', f"配置 {self.services.display_name} 并启动", start_gateway,
+                 deps=['dependencies', 'install', 'browser'], undo=self._undo_service),
+            Step('verify', "验证部署", lambda: self._verify_deployment(result),
+                 deps=['gateway']),
+        ]
+    
     def dry_run(self):
         """预演模式"""
-        port = self.config.allocate_port('l2')
+        port = getattr(self.args, 'port', None) or self.config.peek_ports('l2')[0]
         self.logger.info("预演部署步骤:")
         steps = [
             "检查前置条件 (OpenClaw 已安装、共享层存在、用户不存在)",
             f"分配端口: {port}",
             f"创建 macOS 用户: {self.username} (UID {self.uid})",
             "安装 NodeJS + OpenClaw",
+            f"在本地暂存目录中构建: {self.openclaw_dir} + workspace",
             "生成 openclaw.json (从模板，含完整模型配置)",
+            "生成 workspace 文件 (IDENTITY / MEMORY / USER)",
             "复制 auth-profiles.json (从 Claw)",
             "配置共享层 symlink (skills + protocols + knowledge)",
+            f"安装: 打包交给特权助手，解包到 {self.openclaw_dir} 并设定属主",
             f"创建 browser profile: {self.username}-browser",
-            f"配置 LaunchDaemon: ai.openclaw.{self.username}.gateway",
+            f"配置 {self.services.display_name}: {self.service_label}",
             "验证: HTTP probe 端口响应",
         ]
         for i, step in enumerate(steps, 1):
             self.logger.info(f"  {i}. {step}")
+        if self.config.defaults.get('capacity_policy', 'warn') != 'off':
+            plan = CapacityModel(self.config.defaults, self.config.config_dir).plan(self.username)
+            for line in plan.lines():
+                self.logger.info(line)
         self.logger.info("\n✅ 预演完成 (未实际执行)")
     
     def rollback(self):
-        """回滚"""
+        """回滚
+
+        有步骤日志 (部署未完成) 时按日志逆序撤销已完成的步骤 —
+        用户由本次部署创建，日志可证明，因此一并删除；
+        否则视为已完成的部署，只卸载服务，用户留待手动删除。
+        """
         self.logger.info(f"🔄 回滚 L2 部署: {self.username}")
         
-        # 1. 停止服务
         try:
-            self._run_sudo(['launchctl', 'bootout', 'system',
-                           f'ai.openclaw.{self.username}.gateway'])
-            self.logger.info("   已停止 Gateway 服务")
-        except Exception:
-            pass
-        
-        # 2. 删除 LaunchDaemon
-        plist = Path('/Library/LaunchDaemons') / f'ai.openclaw.{self.username}.gateway.plist'
-        if plist.exists():
+            if self.journal.exists():
+                self._rollback_journal()
+                return
+            
+            # 1. 停止服务并删除单元文件
             try:
-                self._run_sudo(['rm', '-f', str(plist)])
-                self.logger.info(f"   已删除 LaunchDaemon")
+                self._undo_service()
             except Exception:
                 pass
-        
-        self.logger.info(f"\n⚠️  用户 {self.username} 未自动删除 (安全考虑)")
-        self.logger.info(f"   手动删除用户: sudo dscl . -delete /Users/{self.username}")
-        self.logger.info(f"   手动删除家目录: sudo rm -rf /Users/{self.username}")
+            
+            self.logger.info(f"\n⚠️  用户 {self.username} 未自动删除 (安全考虑)")
+            self.logger.info(f"   手动删除用户: sudo dscl . -delete /Users/{self.username}")
+            self.logger.info(f"   手动删除家目录: sudo rm -rf {self.user_home}")
+        finally:
+            self._close_helper()
+            self.logger.close()
+    
+    def _rollback_journal(self):
+        """按步骤日志撤销，并释放本次预留的 UID"""
+        reserved = self.journal.load()['reserved']
+        if not undo_steps(self._build_steps(DeployResult(False, 'l2', self.username)),
+                          self.journal, self.logger):
+            self.logger.info("⚠️  部分步骤未能撤销，修复后再次运行 --rollback")
+            return
+        if reserved.get('uid'):
+            self.config.release_uid(reserved['uid'])
+        self.logger.info("✅ 回滚完成")
+    
+    def reconcile(self, dry_run: bool = False) -> ReconcileResult:
+        """增量收敛: 按当前模板比对已部署的文件，只写入有差异的项
+
+        文件比对与写入经特权助手完成；不重启服务，由调用方统一重启。
+        """
+        port = self.args.port
+        self._verify_not_claw_port(port)
+        
+        result = ReconcileResult(self.username, 'l2', port)
+        files = PrivilegedFiles(self._privileged, self._owner)
+        config_path = self.user_home / '.openclaw' / 'openclaw.json'
+        try:
+            with self.logger.span(f"收敛 {self.username}", 'reconcile', mode='l2'):
+                home = files.inspect([str(self.user_home)])['paths'][str(self.user_home)]
+                if home['type'] == 'missing':
+                    raise PrerequisiteError(f"家目录不存在: {self.user_home} (尚未部署)")
+                preserved = preserved_config_values(read_json(files, config_path))
+                unit = self._render_unit(port)
+                auth_src, auth_dst = self._auth_profiles_paths()
+                resources = [
+                    # openclaw.json 与 auth-profiles 含 API key / token，只允许 Agent 用户读取
+                    Resource('json', config_path,
+                             json.loads(self._render_config(port, **preserved)), restart=True,
+                             mode=0o600),
+                    Resource('file', unit.path, unit.content, restart=True,
+                             install=lambda: self.services.install([unit])),
+                    Resource('file', auth_dst, auth_src.read_text(), mode=0o600),
+                    *[Resource('seed', path, content) for path, content in self._workspace_files()],
+                    *[Resource('symlink', dst, src) for src, dst in self._symlink_pairs()],
+                ]
+                
+                result.changes = plan(resources, files)
+                for change in result.changes:
+                    self.logger.debug(f"收敛 {change.action}: {change.resource.path}")
+                if not dry_run:
+                    apply(result.changes, files)
+        finally:
+            self._close_helper()
+            self.logger.export_trace()
+            self.logger.close()
+        
+        result.backend, result.unit = self.services, unit
+        return result
     
     # ── Safety guards ──
     
@@ -175,38 +343,60 @@ class L2Deployer:
     
     # ── Helpers ──
     
-    def _log_step(self, num: int, total: int, msg: str):
-        self.logger.info(f"[{num}/{total}] {msg}...")
+    @property
+    def _owner(self) -> str:
+        return f'{self.username}:staff'
     
-    def _run_sudo(self, command: list, capture_output: bool = True):
-        """执行 sudo 命令"""
-        try:
-            result = subprocess.run(
-                ['sudo', '-S'] + command,
-                input=self.sudo_password.encode(),
-                capture_output=capture_output,
-                check=True,
-                timeout=300
-            )
-            return result
-        except subprocess.TimeoutExpired:
-            raise PermissionError(f"命令超时: {' '.join(command)}")
-        except subprocess.CalledProcessError as e:
-            raise PermissionError(f"命令失败: {e.stderr.decode() if e.stderr else str(e)}")
-    
-    def _write_as_user(self, content: str, dest_path: str):
-        """以 sudo 写入文件并 chown 给目标用户"""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.tmp') as f:
-            f.write(content)
-            tmp = f.name
-        self._run_sudo(['cp', tmp, dest_path])
-        self._run_sudo(['chown', f'{self.username}:staff', dest_path])
-        os.unlink(tmp)
-    
-    def _mkdir_as_user(self, path: str):
-        """以 sudo 创建目录并 chown"""
-        self._run_sudo(['mkdir', '-p', path])
-        self._run_sudo(['chown', f'{self.username}:staff', path])
+    @property
+    def _rollback_hint(self) -> str:
+        return f"   撤销: deploy-agent --rollback --username {self.username} --mode l2"
+    
+    def _privileged(self) -> PrivilegedHelper:
+        """获取特权助手 (首次使用时启动，整个部署只认证一次)"""
+        if self._shared_privileged is not None:
+            return self._shared_privileged()
+        with self._helper_lock:
+            if self._helper is None:
+                self._helper = PrivilegedHelper(self.sudo_password, tracer=self.logger.tracer)
+                with self.logger.span('sudo 认证', 'privileged'):
+                    self._helper.start()
+                self.logger.debug("特权助手已启动")
+            return self._helper
+    
+    def _close_helper(self):
+        with self._helper_lock:
+            if self._helper is not None:
+                self._helper.close()
+                self._helper = None
+    
+    def _run(self, command: list, **kwargs):
+        """执行子进程 (记录 span)"""
+        with self.logger.span(command_label(command), 'subprocess'):
+            return subprocess.run(command, **kwargs)
+    
+    def _run_sudo(self, command: list):
+        """以 root 执行命令 (经特权助手)"""
+        return self._privileged().run(command)
+    
+    def _write_staged(self, path: Path, content: str):
+        """写入暂存目录中与 path 对应的文件 (记录 span)"""
+        with self.logger.span('write', 'file', path=str(path)):
+            self.stage.path(path).write_text(content)
+    
+    # ── Undo ──
+    
+    def _undo_user(self, outputs: dict = None):
+        """删除本次创建的用户及其家目录"""
+        self._run_sudo(['dscl', '.', '-delete', f'/Users/{self.username}'])
+        self._privileged().remove(self.user_home, recursive=True)
+        self.logger.info(f"   已删除用户 {self.username} 与家目录 {self.user_home}")
+    
+    def _undo_service(self, outputs: dict = None):
+        """停止服务并删除单元文件"""
+        unit = self.services.unit(self.service_label)
+        if unit.path.exists():
+            self.services.remove([unit])
+            self.logger.info(f"   已停止 Gateway 服务并删除 {self.services.display_name}")
     
     # ── Step implementations ──
     
@@ -219,8 +409,8 @@ class L2Deployer:
             raise PrerequisiteError(f"共享层不存在: {shared_path}")
         
         # 检查用户是否已存在
-        result = subprocess.run(['dscl', '.', '-list', '/Users'],
-                               capture_output=True, text=True)
+        result = self._run(['dscl', '.', '-list', '/Users'],
+                           capture_output=True, text=True)
         if self.username in result.stdout.split('\n'):
             raise PrerequisiteError(
                 f"用户已存在: {self.username}\n"
@@ -228,15 +418,27 @@ class L2Deployer:
             )
         
         # 检查 UID
-        result = subprocess.run(['dscl', '.', '-list', '/Users', 'UniqueID'],
-                               capture_output=True, text=True)
+        result = self._run(['dscl', '.', '-list', '/Users', 'UniqueID'],
+                           capture_output=True, text=True)
         for line in result.stdout.strip().split('\n'):
             parts = line.split()
             if len(parts) == 2 and parts[1] == str(self.uid):
                 raise PrerequisiteError(f"UID {self.uid} 已被 {parts[0]} 占用")
         
+        self._check_capacity()
         self.logger.debug("前置条件检查通过")
     
+    def _check_capacity(self):
+        """容量检查: 按实测占用预测部署后的内存 / CPU，超出余量时警告或拒绝 (capacity_policy)"""
+        self.capacity = admit(self.config.defaults, self.username,
+                              ignore=getattr(self.args, 'ignore_capacity', False),
+                              config_dir=self.config.config_dir)
+        if self.capacity is None:
+            return
+        log = self.logger.warning if self.capacity.problems else self.logger.info
+        for line in self.capacity.lines():
+            log(f"   {line}")
+    
     def _create_user(self):
         """创建 macOS 用户"""
         commands = [
@@ -257,8 +459,30 @@ class L2Deployer:
         self.logger.info(f"   用户: {self.username} (UID {self.uid})")
         
         # 设置密码
-        self.logger.info("   请设置用户密码:")
-        subprocess.run(['sudo', 'passwd', self.username])
+        with self.logger.span('等待输入密码', 'interactive'), _TTY_LOCK:
+            self.logger.info(f"   请设置用户密码 ({self.username}):")
+            self.logger.flush()
+            password = self._prompt_user_password()
+        self._set_user_password(password)
+        return {'uid': self.uid}
+    
+    def _set_user_password(self, password: str):
+        """设置用户密码: 经 stdin 交给 dscl 交互模式，密码不出现在命令行参数中 (ps 可见)"""
+        escaped = ''.join('\\' + c if c in ' \t\\"\'' else c for c in password)
+        result = self._privileged().run(['dscl', '.'], check=False,
+                                        input=f'passwd /Users/{self.username} {escaped}\n')
+        # 交互模式下单条命令失败时退出码仍为 0，以输出中的 DS Error 判断
+        output = f"{result['stdout']}\n{result['stderr']}"
+        if result['returncode'] != 0 or 'DS Error' in output:
+            raise PermissionError(f"设置用户密码失败 ({self.username})")
+    
+    def _prompt_user_password(self) -> str:
+        """交互式读取新用户密码 (两次确认)"""
+        while True:
+            password = getpass.getpass("   新密码：")
+            if password and password == getpass.getpass("   再次输入："):
+                return password
+            self.logger.info("   两次输入不一致或为空，请重试")
     
     def _install_dependencies(self):
         """安装依赖 (复用宿主机 node/openclaw)"""
@@ -266,107 +490,127 @@ class L2Deployer:
         # 验证 openclaw 对目标用户可访问
         self.logger.debug("L2 复用宿主机 node/openclaw (通过 PATH)")
     
+    def _create_directories(self):
+        """在本地暂存目录中创建 .openclaw 与 workspace 目录结构"""
+        staging = Path(tempfile.mkdtemp(prefix=f'openclaw-stage-{self.username}-'))
+        self.stage = StagedTree({self.openclaw_dir: staging})
+        workspace = self.openclaw_dir / 'workspace'
+        for path in (workspace / 'memory', workspace / 'docs', workspace / 'skills',
+                     self.openclaw_dir / 'agents' / 'main' / 'agent',
+                     self.openclaw_dir / 'logs'):
+            self.stage.path(path).mkdir(parents=True, exist_ok=True)
+        
+        self.logger.debug(f"暂存目录已创建: {staging}")
+        return {'staging': str(staging)}
+    
+    def _install_tree(self):
+        """打包暂存目录，经特权助手一次解包到家目录并设定属主"""
+        def install(final: Path, staging: Path):
+            self._privileged().install_tree(final, archive_tree(staging), owner=self._owner)
+        
+        self.stage.install(install)
+        self.logger.debug(f"目录树已安装: {self.openclaw_dir}")
+    
     def _generate_config(self, port: int):
         """生成 openclaw.json"""
-        template_str = self.config.get_template('openclaw.json')
-        template = Template(template_str)
+        self._write_staged(self.openclaw_dir / 'openclaw.json', self._render_config(port))
         
+        self.logger.debug("配置已生成")
+    
+    def _render_config(self, port: int, gateway_token: str = None,
+                       bot_token: str = None, deploy_time: str = None,
+                       last_touched_version: str = None) -> str:
+        """渲染 openclaw.json (收敛时传入沿用的 token、部署时间与 CLI 版本标记)"""
         # 读取 API keys from Claw
-        claw_config_path = self.home_dir / '.openclaw' / 'openclaw.json'
-        dashscope_key = ''
-        fireworks_key = ''
-        if claw_config_path.exists():
-            with open(claw_config_path) as f:
-                claw_config = json.load(f)
-            dashscope_key = claw_config.get('env', {}).get('DASHSCOPE_API_KEY', '')
-            fireworks_key = (claw_config.get('models', {}).get('providers', {})
-                           .get('fireworks', {}).get('apiKey', ''))
+        claw_config = self.config.claw_config
+        dashscope_key = claw_config.dashscope_key()
+        fireworks_key = claw_config.fireworks_key()
         
         workspace_path = str(self.user_home / '.openclaw' / 'workspace')
         
-        config_data = template.render(
+        return self.config.render_template(
+            'openclaw.json',
             agent_name=self.username,
             port=port,
-            bot_token=self.args.bot_token or '',
+            bot_token=self.args.bot_token or bot_token or '',
             default_model=self.config.defaults.get('default_model', 'anthropic/claude-sonnet-4-6'),
             dashscope_key=dashscope_key,
             fireworks_key=fireworks_key,
             workspace_path=workspace_path,
-            gateway_token=secrets.token_hex(24),
+            gateway_token=gateway_token or secrets.token_hex(24),
             home_dir=str(self.user_home),
-            deploy_time=datetime.now().isoformat(),
+            deploy_time=deploy_time or datetime.now().isoformat(),
+            last_touched_version=last_touched_version,
         )
-        
-        # 创建目录结构
-        openclaw_dir = str(self.user_home / '.openclaw')
-        self._mkdir_as_user(openclaw_dir)
-        self._mkdir_as_user(workspace_path)
-        self._mkdir_as_user(f"{workspace_path}/memory")
-        self._mkdir_as_user(f"{workspace_path}/docs")
-        self._mkdir_as_user(f"{workspace_path}/skills")
-        self._mkdir_as_user(f"{openclaw_dir}/agents/main/agent")
-        self._mkdir_as_user(f"{openclaw_dir}/logs")
-        
-        # 写入 openclaw.json
-        config_path = str(self.user_home / '.openclaw' / 'openclaw.json')
-        self._write_as_user(config_data, config_path)
-        
-        # 生成 workspace 文件
-        self._generate_workspace_files()
-        
-        self.logger.debug("配置已生成")
     
     def _generate_workspace_files(self):
         """生成 workspace 核心文件"""
-        ws = str(self.user_home / '.openclaw' / 'workspace')
+        for path, content in self._workspace_files():
+            self._write_staged(path, content)
+    
+    def _workspace_files(self) -> list:
+        """workspace 核心文件 [(路径, 内容)]"""
+        ws = self.user_home / '.openclaw' / 'workspace'
         role = self.args.role or 'AI Assistant'
+        files = []
         
         # IDENTITY.md
         try:
-            identity_template = self.config.get_template('IDENTITY.md')
-            identity = Template(identity_template).render(
+            identity = self.config.render_template(
+                'IDENTITY.md',
                 agent_name=self.username,
                 role=role,
                 mode='l2',
                 role_description=role,
                 deploy_time=datetime.now().strftime('%Y-%m-%d %H:%M'),
             )
-            self._write_as_user(identity, f"{ws}/IDENTITY.md")
+            files.append((ws / 'IDENTITY.md', identity))
         except FileNotFoundError:
             self.logger.debug("IDENTITY.md 模板不存在，跳过")
         
         # MEMORY.md
-        self._write_as_user(
-            f"# MEMORY.md - {self.username}\n\n<!-- 按时间倒序记录 -->\n",
-            f"{ws}/MEMORY.md"
-        )
+        files.append((ws / 'MEMORY.md',
+                      f"# MEMORY.md - {self.username}\n\n<!-- 按时间倒序记录 -->\n"))
         
         # USER.md
-        self._write_as_user(
-            f"# USER.md\n\n"
-            f"- **Name:** Mr Xia / 夏总\n"
-            f"- **Company:** Peblla — 美国餐饮行业 SaaS 科技公司\n"
-            f"- **Role:** CEO, 联合创始人\n"
-            f"- **Timezone:** Asia/Shanghai (GMT+8)\n",
-            f"{ws}/USER.md"
-        )
+        files.append((ws / 'USER.md',
+                      f"# USER.md\n\n"
+                      f"- **Name:** Mr Xia / 夏总\n"
+                      f"- **Company:** Peblla — 美国餐饮行业 SaaS 科技公司\n"
+                      f"- **Role:** CEO, 联合创始人\n"
+                      f"- **Timezone:** Asia/Shanghai (GMT+8)\n"))
+        return files
     
     def _copy_auth_profiles(self):
         """从 Claw 复制 auth-profiles.json"""
+        src, dst = self._auth_profiles_paths()
+        with self.logger.span('copy', 'file', path=str(dst)):
+            shutil.copy(src, self.stage.path(dst))
+        
+        self.logger.debug("auth-profiles.json 已复制")
+    
+    def _auth_profiles_paths(self) -> tuple:
+        """auth-profiles.json 的 (Claw 源文件, 目标路径)"""
         src = self.home_dir / '.openclaw' / 'agents' / 'main' / 'agent' / 'auth-profiles.json'
         if not src.exists():
             raise ConfigError(f"Claw auth-profiles 不存在: {src}")
-        
-        dst = str(self.user_home / '.openclaw' / 'agents' / 'main' / 'agent' / 'auth-profiles.json')
-        self._run_sudo(['cp', str(src), dst])
-        self._run_sudo(['chown', f'{self.username}:staff', dst])
-        
-        self.logger.debug("auth-profiles.json 已复制")
+        return src, self.user_home / '.openclaw' / 'agents' / 'main' / 'agent' / 'auth-profiles.json'
     
     def _setup_symlinks(self):
         """配置共享层 symlink"""
-        shared = self.config.defaults['shared_path']
-        ws = str(self.user_home / '.openclaw' / 'workspace')
+        ws = self.user_home / '.openclaw' / 'workspace'
+        for src_path, dst_path in self._symlink_pairs():
+            staged = self.stage.path(dst_path)
+            staged.parent.mkdir(parents=True, exist_ok=True)
+            if staged.is_symlink():
+                staged.unlink()  # 续跑时重新执行
+            staged.symlink_to(src_path)
+            self.logger.debug(f"symlink: {dst_path.relative_to(ws)} → {src_path}")
+    
+    def _symlink_pairs(self) -> list:
+        """共享层 symlink [(源, 目标)]，跳过源不存在的项"""
+        shared = Path(self.config.defaults['shared_path'])
+        ws = self.user_home / '.openclaw' / 'workspace'
         
         symlinks = [
             ('skills/summarize', 'skills/summarize'),
@@ -376,76 +620,60 @@ class L2Deployer:
             ('knowledge', 'knowledge'),
         ]
         
-        for src_rel, dst_rel in symlinks:
-            src_path = f"{shared}/{src_rel}"
-            dst_path = f"{ws}/{dst_rel}"
-            
-            if Path(src_path).exists():
-                # 确保父目录存在
-                parent = str(Path(dst_path).parent)
-                self._mkdir_as_user(parent)
-                # 删除已有 symlink
-                self._run_sudo(['rm', '-f', dst_path])
-                self._run_sudo(['ln', '-s', src_path, dst_path])
-                self._run_sudo(['chown', '-h', f'{self.username}:staff', dst_path])
-                self.logger.debug(f"symlink: {dst_rel} → {src_path}")
+        return [(shared / src_rel, ws / dst_rel) for src_rel, dst_rel in symlinks
+                if (shared / src_rel).exists()]
     
     def _create_browser_profile(self):
         """创建独立 browser profile"""
         profile_name = f"{self.username}-browser"
         
-        # L2 用户需要用 sudo 以该用户身份创建
-        result = subprocess.run(
-            ['sudo', '-u', self.username,
-             'openclaw', 'browser', 'create-profile', '--name', profile_name],
-            capture_output=True, text=True,
-            env={**os.environ, 'HOME': str(self.user_home)}
+        # L2 用户需要以该用户身份创建 (特权助手降权执行)
+        result = self._privileged().run(
+            ['openclaw', 'browser', 'create-profile', '--name', profile_name],
+            user=self.username, env={'HOME': str(self.user_home)}, check=False,
         )
         
-        if result.returncode != 0:
-            self.logger.info(f"   ⚠️ browser profile 创建失败: {result.stderr.strip()}")
+        if result['returncode'] != 0:
+            self.logger.info(f"   ⚠️ browser profile 创建失败: {result['stderr'].strip()}")
             self.logger.info(f"   可手动执行 (以 {self.username} 身份)")
         else:
             self.logger.debug(f"browser profile 已创建: {profile_name}")
-            for line in result.stdout.splitlines():
+            for line in result['stdout'].splitlines():
                 if 'port' in line:
                     self.logger.info(f"   {line.strip()}")
     
-    def _setup_and_start_launchdaemon(self, port: int):
-        """配置 LaunchDaemon 并启动"""
-        template_str = self.config.get_template('launchdaemon.plist')
-        template = Template(template_str)
+    def _install_and_start_service(self, port: int):
+        """配置 Gateway 系统服务 (LaunchDaemon / systemd unit) 并启动"""
+        unit = self._render_unit(port)
+        
+        # 与同时部署的其他 Agent 合并为一次 launchctl/systemctl 调用
+        self.services.apply([unit])
         
-        plist_content = template.render(
+        self.logger.debug(f"{self.services.display_name} 已启动")
+    
+    def _render_unit(self, port: int):
+        """渲染 Gateway 服务单元"""
+        return self.services.render_unit(
+            self.config, self.service_label,
             username=self.username,
             port=str(port),
+            home_dir=str(self.user_home),
         )
-        
-        plist_name = f'ai.openclaw.{self.username}.gateway.plist'
-        plist_path = f'/Library/LaunchDaemons/{plist_name}'
-        
-        self._write_as_user(plist_content, plist_path)
-        self._run_sudo(['chown', 'root:wheel', plist_path])
-        self._run_sudo(['chmod', '644', plist_path])
-        
-        # 启动
-        self._run_sudo(['launchctl', 'bootstrap', 'system', plist_path])
-        
-        time.sleep(3)
-        self.logger.debug("LaunchDaemon 已启动")
     
-    def _verify_deployment(self, port: int):
-        """验证部署"""
-        import urllib.request
-        
-        try:
-            url = f"http://127.0.0.1:{port}/"
-            req = urllib.request.Request(url, method='GET')
-            with urllib.request.urlopen(req, timeout=5) as resp:
-                if resp.status == 200:
-                    self.logger.info(f"   ✅ Gateway 端口 {port} 响应正常")
-                    return
-        except Exception:
-            pass
-        
-        self.logger.info(f"   ⚠️ Gateway 未响应，查看日志: /tmp/openclaw-{self.username}/openclaw.err")
+    def _verify_deployment(self, result: DeployResult):
+        """验证部署 (轮询直到 Gateway 就绪或超时)"""
+        port = result.port
+        with self.logger.span('wait_until_ready', 'probe', port=port):
+            readiness = wait_until_ready(
+                port, timeout=self.config.defaults.get('readiness_timeout', 30))
+        
+        if readiness.ready:
+            result.time_to_ready = readiness.elapsed
+            self.logger.info(f"   ✅ Gateway 端口 {port} 响应正常 "
+                             f"(就绪耗时 {readiness.elapsed:.2f}s, {readiness.attempts} 次探测)")
+            return
+        
+        self.logger.debug(f"就绪探测失败 ({readiness.stage}): {readiness.error}")
+        
+        self.logger.info(f"   ⚠️ Gateway 未响应，查看日志: "
+                         f"{self.services.gateway_logs(self.username)[1]}")
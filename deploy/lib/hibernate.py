@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+空闲 Agent 休眠
+监视各 Gateway 的入站连接，空闲超过 idle_timeout 的 Gateway 被停止 (服务卸载)，
+其端口改由轻量激活代理监听；第一个入站连接到达时重新启动 Gateway，
+就绪后把等待中的连接转交给它，客户端无感知。
+
+交接过程:
+    休眠  停止服务 → 等端口释放 → 代理监听端口
+    唤醒  代理接受连接 → 关闭监听 → 启动服务 → 等待就绪 → 转发已接受的连接
+
+代理关闭监听到 Gateway 重新绑定之间的新连接会被拒绝 (通常在 1 秒以内)，
+客户端按常规重连即可。依赖 Telegram 长轮询等出站连接的 Agent 休眠后收不到消息
+(空闲判定只看入站连接，这类 Agent 总显得空闲)，因此休眠需按 Agent 显式启用:
+登记中 hibernate: true 的 Agent 才会被监督 (deploy-agent --hibernate on --name ...)。
+
+状态文件记录监督器 PID，监督器崩溃后遗留的状态不再生效。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from readiness import wait_until_ready
+from registry_snapshot import write_json_atomic
+from services import ServiceBackend, ServiceUnit, agent_unit
+from snapshot import established_connections
+
+
+STATUS_NAME = '.hibernate.status.json'
+
+DEFAULT_IDLE_TIMEOUT = 1800     # 秒
+DEFAULT_INTERVAL = 30           # 采样间隔 (秒)
+PORT_RELEASE_TIMEOUT = 10       # 停止服务后等待端口释放 (秒)
+HOLD_BACKLOG = 64
+PIPE_BUFFER = 64 * 1024
+
+
+class ActivationProxy:
+    """休眠期间占住 Gateway 端口的激活代理
+
+    收到第一个连接后调用 on_activate(conns)，由调用方负责启动 Gateway
+    并转发这些连接；代理随即结束。
+    """
+
+    def __init__(self, port: int, on_activate: Callable[[List[socket.socket]], None],
+                 host: str = '127.0.0.1'):
+        self.port = port
+        self.host = host
+        self.on_activate = on_activate
+        self._listener: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    def start(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(HOLD_BACKLOG)
+        self._listener = listener
+        self._thread = threading.Thread(target=self._serve, daemon=True,
+                                        name=f'activation-{self.port}')
+        self._thread.start()
+
+    def close(self):
+        """停止监听 (不触发激活)"""
+        self._closed.set()
+        if self._listener is not None:
+            # 仅 close() 不会唤醒阻塞在 accept() 的线程，端口也不会释放
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+
+    def _serve(self):
+        try:
+            conn, _ = self._listener.accept()
+        except OSError:
+            return  # close() 关闭了监听套接字
+        if self._closed.is_set():
+            conn.close()
+            return
+
+        # 收下 backlog 中已完成握手的连接，然后交出端口
+        held = [conn]
+        self._listener.setblocking(False)
+        while True:
+            try:
+                extra, _ = self._listener.accept()
+            except OSError:
+                break
+            extra.setblocking(True)
+            held.append(extra)
+        self._listener.close()
+        self.on_activate(held)
+
+
+def splice(client: socket.socket, port: int, host: str = '127.0.0.1'):
+    """把已接受的客户端连接转发到 Gateway (双向，直到任一侧关闭)"""
+    try:
+        upstream = socket.create_connection((host, port), timeout=10)
+        upstream.settimeout(None)
+    except OSError:
+        client.close()
+        return
+
+    def pump(src: socket.socket, dst: socket.socket):
+        try:
+            while True:
+                data = src.recv(PIPE_BUFFER)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=pump, args=(client, upstream), daemon=True),
+               threading.Thread(target=pump, args=(upstream, client), daemon=True)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    client.close()
+    upstream.close()
+
+
+class HibernatingAgent:
+    """单个 Agent 的休眠状态"""
+
+    def __init__(self, name: str, port: int, backend: ServiceBackend, unit: ServiceUnit):
+        self.name = name
+        self.port = port
+        self.backend = backend
+        self.unit = unit
+        self.state = 'awake'        # awake / hibernating / waking
+        self.last_active = time.monotonic()
+        self.proxy: Optional[ActivationProxy] = None
+        self.wakeups = 0
+        self.lock = threading.Lock()
+
+
+class HibernationSupervisor:
+    """空闲休眠监督器"""
+
+    def __init__(self, agents: List[Dict], backend_for: Callable[[str], ServiceBackend],
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 interval: float = DEFAULT_INTERVAL,
+                 readiness_timeout: float = 30, status_path: Path = None,
+                 echo: Callable[[str], None] = print):
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.readiness_timeout = readiness_timeout
+        self.echo = echo
+        self.status_path = status_path
+        self._stop = threading.Event()
+        self.agents: Dict[str, HibernatingAgent] = {}
+
+        for agent in agents:
+            if not hibernation_enabled(agent):
+                continue
+            entry = agent_unit(backend_for, agent)
+            if entry is None:
+                continue  # Claw 不参与休眠
+            name = agent.get('name') or agent.get('agent')
+            self.agents[name] = HibernatingAgent(name, agent['port'], *entry)
+
+    def run(self):
+        """前台运行，直到 stop() 或 Ctrl-C；退出时唤醒全部休眠中的 Agent"""
+        self.echo(f"💤 休眠监督: {len(self.agents)} 个 Agent，"
+                  f"空闲 {self.idle_timeout:.0f}s 后休眠，每 {self.interval:.0f}s 采样")
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                self._stop.wait(self.interval)
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+    def tick(self):
+        """采样一次：刷新活跃时间，休眠超时的 Agent"""
+        awake = [a for a in self.agents.values() if a.state == 'awake']
+        if not awake:
+            return
+        counts = established_connections(a.port for a in awake)
+        now = time.monotonic()
+        for agent in awake:
+            if counts.get(agent.port):
+                agent.last_active = now
+            elif now - agent.last_active >= self.idle_timeout:
+                self.hibernate(agent)
+
+    def hibernate(self, agent: HibernatingAgent):
+        """停止 Gateway 并由激活代理接管端口"""
+        with agent.lock:
+            if agent.state != 'awake':
+                return
+            try:
+                agent.backend.stop([agent.unit])
+                agent.proxy = ActivationProxy(
+                    agent.port, lambda conns, a=agent: self._wake(a, conns))
+                self._bind_when_released(agent.proxy)
+            except Exception as e:
+                # 代理没能接管端口时立刻恢复服务，保证 Agent 可达
+                self.echo(f"⚠️  {agent.name} 休眠失败，恢复运行: {e}")
+                agent.backend.start([agent.unit], check=False)
+                agent.last_active = time.monotonic()
+                return
+            agent.state = 'hibernating'
+        self._write_status()
+        self.echo(f"💤 {agent.name} (:{agent.port}) 已休眠")
+
+    def _wake(self, agent: HibernatingAgent, conns: List[socket.socket]):
+        """激活代理收到连接：启动 Gateway 并转发等待中的连接"""
+        with agent.lock:
+            agent.state = 'waking'
+            agent.proxy = None
+            start = time.monotonic()
+            try:
+                agent.backend.start([agent.unit])
+                readiness = wait_until_ready(agent.port, timeout=self.readiness_timeout)
+            except Exception as e:
+                readiness = None
+                self.echo(f"❌ {agent.name} 唤醒失败: {e}")
+            agent.state = 'awake'
+            agent.last_active = time.monotonic()
+            agent.wakeups += 1
+        self._write_status()
+
+        if readiness is not None and readiness.ready:
+            self.echo(f"⏰ {agent.name} (:{agent.port}) 已唤醒 "
+                      f"({time.monotonic() - start:.2f}s, {len(conns)} 个等待连接)")
+        for conn in conns:
+            threading.Thread(target=splice, args=(conn, agent.port), daemon=True).start()
+
+    def _bind_when_released(self, proxy: ActivationProxy):
+        """服务停止是异步的，重试绑定直到 Gateway 释放端口"""
+        deadline = time.monotonic() + PORT_RELEASE_TIMEOUT
+        while True:
+            try:
+                proxy.start()
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def shutdown(self):
+        """唤醒全部休眠中的 Agent (监督器退出后端口不能无人监听)"""
+        for agent in self.agents.values():
+            with agent.lock:
+                if agent.state != 'hibernating':
+                    continue
+                agent.proxy.close()
+                agent.proxy = None
+                agent.backend.start([agent.unit], check=False)
+                agent.state = 'awake'
+            self.echo(f"⏰ {agent.name} 已恢复运行")
+        self._write_status()
+
+    def status(self) -> List[Dict]:
+        """各 Agent 的休眠状态"""
+        now = time.monotonic()
+        return [{'name': a.name, 'port': a.port, 'state': a.state,
+                 'idle': now - a.last_active, 'wakeups': a.wakeups}
+                for a in self.agents.values()]
+
+    def _write_status(self):
+        """写出状态文件，供 --watch 等跳过休眠中的 Agent (探测会唤醒它们)"""
+        if self.status_path is None:
+            return
+        try:
+            write_json_atomic(self.status_path, {'pid': os.getpid(), 'agents': self.status()})
+        except OSError as e:
+            self.echo(f"⚠️  状态文件写入失败: {e}")
+
+
+def hibernation_enabled(agent: Dict) -> bool:
+    """Agent 是否已在登记中启用休眠 (hibernate: true)"""
+    return agent.get('hibernate') is True
+
+
+def read_hibernating(config_dir: Path) -> set:
+    """休眠监督器登记为休眠中的 Agent 名称 (监督器已退出时为空)"""
+    try:
+        with open(Path(config_dir) / STATUS_NAME, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if not _pid_alive(data.get('pid')):
+        return set()
+    return {a['name'] for a in data.get('agents', []) if a.get('state') == 'hibernating'}
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # 进程存在但属于其他用户
+    return True
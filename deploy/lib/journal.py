@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+部署步骤日志 (deploy-agent --resume / --rollback)
+每完成一个步骤就把它的产出 (端口、UID、暂存路径等) 追加写入 JSON-lines 文件并 fsync，
+部署中途失败或进程被杀后:
+
+    --resume    跳过已完成的步骤 (恢复其产出)，从第一个未完成的步骤继续
+    --rollback  按完成的逆序逐个撤销已完成的步骤，只撤销确实做过的事
+
+记录格式 (每行一个 JSON):
+    {"op": "begin", "ts": ..., "args": {...}, "reserved": {"uid": 502}}
+    {"op": "done", "ts": ..., "step": "port", "outputs": {"port": 19003}}
+    {"op": "undone", "ts": ..., "step": "port"}
+
+begin 记录部署参数 (续跑时沿用) 与本次预留的资源；部署成功或回滚完成后删除日志。
+日志含 bot token，以 0600 权限创建。
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+
+class StepJournal:
+    """单个 Agent 的部署步骤日志 (线程安全，步骤在调度器的工作线程中完成)"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_agent(cls, log_dir: Path, mode: str, name: str) -> 'StepJournal':
+        """部署日志目录中该 Agent 的步骤日志"""
+        return cls(Path(log_dir) / f'deploy-{mode}-{name}.journal.jsonl')
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def begin(self, args: Dict, reserved: Dict = None):
+        """开始新的部署 (截断旧日志)"""
+        self._append({'op': 'begin', 'args': args, 'reserved': reserved or {}}, truncate=True)
+
+    def record(self, step: str, outputs: Dict = None):
+        """记录步骤完成及其产出"""
+        self._append({'op': 'done', 'step': step, 'outputs': outputs or {}})
+
+    def undone(self, step: str):
+        """记录步骤已撤销 (回滚中断后再次 --rollback 不会重复撤销)"""
+        self._append({'op': 'undone', 'step': step})
+
+    def _append(self, entry: Dict, truncate: bool = False):
+        entry = {'ts': time.time(), **entry}
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if truncate else os.O_APPEND)
+        with self._lock:
+            fd = os.open(self.path, flags, 0o600)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def load(self) -> Dict:
+        """读取日志: {'args', 'reserved', 'steps': {步骤: 产出}}
+
+        steps 按完成顺序排列，不含已撤销的步骤；日志不存在时各项为空。
+        """
+        state = {'args': {}, 'reserved': {}, 'steps': {}}
+        if not self.path.exists():
+            return state
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时未写完的最后一行
+                op = entry.get('op')
+                if op == 'begin':
+                    state = {'args': entry.get('args') or {},
+                             'reserved': entry.get('reserved') or {}, 'steps': {}}
+                elif op == 'done':
+                    state['steps'][entry['step']] = entry.get('outputs') or {}
+                elif op == 'undone':
+                    state['steps'].pop(entry['step'], None)
+        return state
+
+    def restore_args(self, args):
+        """用日志中保存的部署参数补全 args (命令行显式给出的优先)"""
+        for key, value in self.load()['args'].items():
+            if getattr(args, key, None) is None:
+                setattr(args, key, value)
+        return args
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
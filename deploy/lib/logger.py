@@ -2,18 +2,210 @@
 """
 部署日志管理器
 记录部署过程的每一步操作和结果
+
+进程内全部部署器共用一条日志管道: 各自的记录经 QueueHandler 放入同一队列，
+由一个后台线程写入各自的日志文件与控制台，部署工作线程不在文件 / 终端 I/O 上等待。
+同一进程中有多个 Agent 输出时 (批量部署、收敛) 控制台每行加 [名称] 前缀。
+
+日志目录首次使用时由后台线程整理: 超过 compress_after_days 的日志 gzip 压缩，
+超过 retention_days 的文件删除 (步骤日志 *.journal.jsonl 除外)。
 """
 
+import atexit
+import gzip
 import logging
+import os
+import queue
+import shutil
 import sys
+import threading
+import time
+from contextlib import nullcontext
+from logging.handlers import QueueHandler
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Tuple
+
+from tracing import Tracer, StepProfiler, export_chrome_trace
+
+
+DEFAULT_COMPRESS_AFTER_DAYS = 1
+DEFAULT_RETENTION_DAYS = 30
+
+# 可压缩的日志产物 (.prof 保持原样，pstats 不能直接读取 .gz)
+COMPRESSIBLE_SUFFIXES = ('.log', '.spans.jsonl', '.trace.json')
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+
+def prune_logs(log_dir: Path, compress_after_days: float = DEFAULT_COMPRESS_AFTER_DAYS,
+               retention_days: float = DEFAULT_RETENTION_DAYS) -> Tuple[int, int]:
+    """整理部署日志目录，返回 (压缩数, 删除数)
+
+    按修改时间判断年龄；压缩后的 .gz 保留原文件的修改时间，按同一期限删除。
+    未完成部署的步骤日志 (--resume / --rollback 依赖它) 与隐藏文件 (如 --logs 的索引) 不动。
+    """
+    now = time.time()
+    compressed = removed = 0
+    for path in Path(log_dir).iterdir():
+        name = path.name
+        if name.startswith('.') or name.endswith(JOURNAL_SUFFIX):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if not path.is_file():
+            continue
+        age_days = (now - stat.st_mtime) / 86400
+        try:
+            if retention_days and age_days > retention_days:
+                path.unlink()
+                removed += 1
+            elif (compress_after_days is not None and age_days > compress_after_days
+                  and name.endswith(COMPRESSIBLE_SUFFIXES)):
+                target = path.with_name(name + '.gz')
+                with open(path, 'rb') as src, gzip.open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.utime(target, (stat.st_atime, stat.st_mtime))
+                path.unlink()
+                compressed += 1
+        except OSError:
+            continue  # 并发的另一进程已处理
+    return compressed, removed
+
+
+def flush_logs():
+    """等待全部已记录的部署日志写出 (尚未有部署器记录日志时为空操作)"""
+    if LogPipeline._instance is not None:
+        LogPipeline._instance.flush()
+
+
+class _AgentQueueHandler(QueueHandler):
+    """把记录连同所属日志文件的 key 放入管道队列"""
+
+    def __init__(self, log_queue, key: int, agent_name: str):
+        super().__init__(log_queue)
+        self.key = key
+        self.agent_name = agent_name
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_key = self.key
+        record.agent_name = self.agent_name
+        return record
+
+
+class LogPipeline:
+    """进程内共享的日志管道 (一个后台写入线程)"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.console = logging.StreamHandler(sys.stdout)
+        self.console.setLevel(logging.INFO)
+        self.console.setFormatter(logging.Formatter('%(message)s'))
+        self.file_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                             datefmt='%Y-%m-%d %H:%M:%S')
+        self.files: Dict[int, logging.Handler] = {}
+        self.agents = set()
+        self.pruned = set()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='deploy-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def get(cls) -> 'LogPipeline':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def attach(self, log_file: Path, agent_name: str,
+               retention: Tuple[float, float] = None) -> QueueHandler:
+        """登记一个日志文件，返回写入该文件的 QueueHandler"""
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+        handler.setLevel(logging.DEBUG)
+        handler.setFormatter(self.file_format)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self.files[key] = handler
+            self.agents.add(agent_name)
+            log_dir = Path(log_file).parent
+            first_use = log_dir not in self.pruned
+            self.pruned.add(log_dir)
+        if first_use and retention is not None:
+            self.queue.put(lambda: prune_logs(log_dir, *retention))
+        return _AgentQueueHandler(self.queue, key, agent_name)
+
+    def detach(self, key: int):
+        """在队列中此前的记录写出后关闭并移除日志文件 (释放文件描述符)"""
+        if self._thread.is_alive():
+            self.queue.put(lambda: self._detach(key))
+        else:
+            self._detach(key)
+
+    def _detach(self, key: int):
+        with self._lock:
+            handler = self.files.pop(key, None)
+        if handler is not None:
+            handler.close()
+
+    def flush(self, timeout: float = 5.0):
+        """等待此前放入队列的记录全部写出 (交回控制台或读取输入前调用)"""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done.set)
+        done.wait(timeout)
+
+    def close(self):
+        """写完队列中剩余的记录并停止后台线程 (进程退出时)"""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5.0)
+        with self._lock:
+            handlers, self.files = list(self.files.values()), {}
+        for handler in handlers:
+            handler.close()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                if callable(item):
+                    item()
+                else:
+                    self._emit(item)
+            except Exception:
+                pass  # 日志写入失败不影响部署
+
+    def _emit(self, record: logging.LogRecord):
+        handler = self.files.get(record.log_key)
+        if handler is not None:
+            handler.handle(record)
+        if record.levelno < self.console.level:
+            return
+        if len(self.agents) > 1:
+            prefix = f'[{record.agent_name}] '
+            record.msg = '\n'.join(prefix + line if line else line
+                                   for line in record.getMessage().split('\n'))
+            record.args = None
+        self.console.handle(record)
 
 
 class DeployLogger:
     """部署日志管理器"""
     
-    def __init__(self, log_dir: Path, agent_name: str, mode: str):
+    def __init__(self, log_dir: Path, agent_name: str, mode: str, profile: bool = False,
+                 compress_after_days: float = DEFAULT_COMPRESS_AFTER_DAYS,
+                 retention_days: float = DEFAULT_RETENTION_DAYS):
         self.log_dir = log_dir
         self.agent_name = agent_name
         self.mode = mode
@@ -25,33 +217,52 @@ class DeployLogger:
         timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
         self.log_file = self.log_dir / f'deploy-{mode}-{agent_name}-{timestamp}.log'
         
+        # 追踪 span 与 --profile 输出 (与 .log 同名)
+        self.tracer = Tracer(self.log_file.with_suffix('.spans.jsonl'))
+        self.profiler = StepProfiler(self.log_dir, self.log_file.stem) if profile else None
+        
         # 配置日志
+        self._retention = (compress_after_days, retention_days)
+        self._handler = None
+        self._attach_lock = threading.Lock()
         self._setup_logger()
     
     def _setup_logger(self):
-        """配置日志记录器"""
-        self.logger = logging.getLogger(f'deploy-{self.agent_name}')
-        self.logger.setLevel(logging.DEBUG)
+        """配置日志记录器: 记录放入共享管道，由后台线程写入文件 (详细) 与控制台 (简洁)"""
+        self.pipeline = LogPipeline.get()
+        self._logger = logging.getLogger(f'deploy-{self.agent_name}')
+        self._logger.setLevel(logging.DEBUG)
+        self._logger.propagate = False
         
         # 清除现有处理器
-        self.logger.handlers = []
-        
-        # 文件处理器 (详细日志)
-        file_handler = logging.FileHandler(self.log_file, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-        file_format = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_format)
-        self.logger.addHandler(file_handler)
-        
-        # 控制台处理器 (简洁输出)
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
-        console_format = logging.Formatter('%(message)s')
-        console_handler.setFormatter(console_format)
-        self.logger.addHandler(console_handler)
+        self._logger.handlers = []
+        self._attach()
+    
+    def _attach(self):
+        with self._attach_lock:
+            if self._handler is None:
+                self._handler = self.pipeline.attach(self.log_file, self.agent_name,
+                                                     self._retention)
+                self._logger.addHandler(self._handler)
+    
+    @property
+    def logger(self) -> logging.Logger:
+        """底层 Logger (close() 之后再记录时重新打开日志文件，追加写入)"""
+        if self._handler is None:
+            self._attach()
+        return self._logger
+    
+    def close(self):
+        """关闭日志文件 (已记录的内容写出后由后台线程关闭)，可重复调用"""
+        with self._attach_lock:
+            handler, self._handler = self._handler, None
+        if handler is not None:
+            self._logger.removeHandler(handler)
+            self.pipeline.detach(handler.key)
+    
+    def flush(self):
+        """等待已记录的日志写出 (之后的 print / 交互输入不会与其错序)"""
+        self.pipeline.flush()
     
     def debug(self, message: str):
         """调试日志"""
@@ -77,15 +288,44 @@ class DeployLogger:
         """步骤开始"""
         self.logger.info(f'[{step_num}/{total}] {message}...')
     
-    def step_complete(self, step_num: int, total: int, message: str):
+    def step_complete(self, step_num: int, total: int, message: str, duration: float = None):
         """步骤完成"""
-        self.logger.info(f'[{step_num}/{total}] {message}... ✅')
+        elapsed = f' ({duration:.2f}s)' if duration is not None else ''
+        self.logger.info(f'[{step_num}/{total}] {message}... ✅{elapsed}')
+    
+    def step_resumed(self, step_num: int, total: int, message: str):
+        """步骤已在上次运行中完成 (续跑时跳过)"""
+        self.logger.info(f'[{step_num}/{total}] {message}... ⏭️  已完成')
     
     def step_failed(self, step_num: int, total: int, message: str, error: str):
         """步骤失败"""
         self.logger.error(f'[{step_num}/{total}] {message}... ❌')
         self.logger.error(f'  错误：{error}')
     
+    def span(self, name: str, category: str = 'misc', parent: int = None, **args):
+        """计时 span (with 块)，嵌套的子 span 自动挂在其下"""
+        return self.tracer.span(name, category, parent=parent, **args)
+    
+    def current_span(self):
+        """当前线程最内层 span 的 id (跨线程传递父 span 时使用)"""
+        return self.tracer.current()
+    
+    def profile_step(self, key: str, span_args: dict = None):
+        """--profile 模式下对步骤运行 cProfile，否则为空操作"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.profile(key, span_args)
+    
+    def export_trace(self) -> Path:
+        """把已记录的 span 导出为 Chrome trace，返回其路径"""
+        if not self.tracer.path.exists():
+            return None
+        return export_chrome_trace(self.tracer.path, self.get_trace_path())
+    
+    def get_trace_path(self) -> Path:
+        """获取 Chrome trace 文件路径"""
+        return self.log_file.with_suffix('.trace.json')
+    
     def get_log_path(self) -> Path:
         """获取日志文件路径"""
         return self.log_file
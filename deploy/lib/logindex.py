@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+部署日志索引 (deploy-agent --logs)
+~/.openclaw/deploy-logs 中的部署日志增量写入本地 SQLite 索引 (.index.sqlite3):
+
+    deploys  每个日志文件一行: Agent / 模式 / 开始时间 / 类型 / 结果 / 失败步骤 / 错误
+    lines    每条日志记录一行: 时间 / 级别 / 所属步骤 / 内容 (FTS5 trigram 全文索引)
+
+每次查询前只 stat 目录中的文件，新文件与追加的内容按上次读到的偏移增量读入，
+已 gzip 压缩的日志 (见 logger.prune_logs) 沿用压缩前的偏移；被保留策略删除的文件同步移出索引。
+SQLite 不支持 FTS5 (或 trigram 分词器) 时退化为 LIKE 查询。
+"""
+
+import gzip
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+INDEX_NAME = '.index.sqlite3'
+
+LOG_NAME = re.compile(r'^deploy-(l1|l2)-(.+)-(\d{8}-\d{6})\.log$')
+RECORD = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - '
+                    r'(DEBUG|INFO|WARNING|ERROR|CRITICAL) - (.*)$')
+STEP = re.compile(r'\[\d+/\d+\] (.+?)\.\.\.')
+SINCE = re.compile(r'^(\d+)([mhd])$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deploys (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,           -- 日志文件名 (不含 .gz)
+    agent TEXT, mode TEXT, started TEXT,
+    kind TEXT,                  -- deploy / rollback / other
+    status TEXT,                -- ok / failed / incomplete / -
+    failed_step TEXT, error TEXT,
+    step TEXT,                  -- 读到的最后一个步骤 (增量读取时续接)
+    offset INTEGER, size INTEGER, mtime REAL
+);
+CREATE INDEX IF NOT EXISTS deploys_agent ON deploys(agent, started);
+CREATE INDEX IF NOT EXISTS deploys_status ON deploys(status, started);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    deploy_id INTEGER, ts TEXT, level TEXT, step TEXT, message TEXT
+);
+CREATE INDEX IF NOT EXISTS lines_deploy ON lines(deploy_id, level);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+    message, content='lines', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS lines_ai AFTER INSERT ON lines BEGIN
+    INSERT INTO lines_fts(rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS lines_ad AFTER DELETE ON lines BEGIN
+    INSERT INTO lines_fts(lines_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+CREATE TRIGGER IF NOT EXISTS lines_au AFTER UPDATE ON lines BEGIN
+    INSERT INTO lines_fts(lines_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    INSERT INTO lines_fts(rowid, message) VALUES (new.id, new.message);
+END;
+"""
+
+
+def parse_since(value: str) -> str:
+    """'7d' / '12h' / '30m' 或 'YYYY-MM-DD' → 索引中的时间字符串"""
+    match = SINCE.match(value.strip())
+    if match:
+        units = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+        delta = timedelta(**{units[match.group(2)]: int(match.group(1))})
+        return (datetime.now() - delta).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ValueError(f"无法解析时间: {value} (示例: 7d / 12h / 2026-03-01)")
+
+
+class LogIndex:
+    """部署日志的 SQLite 索引"""
+
+    def __init__(self, log_dir: Path, index_path: Path = None):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(index_path or self.log_dir / INDEX_NAME), timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        # 索引可随时从日志重建，不需要每次提交都 fsync
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            try:
+                self.conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    def close(self):
+        self.conn.close()
+
+    # ── 增量写入 ──
+
+    def update(self) -> Tuple[int, int]:
+        """把新增 / 追加的日志写入索引，返回 (读入的文件数, 新增记录数)"""
+        known = {row['name']: row for row in self.conn.execute(
+            'SELECT id, name, offset, size, mtime, step FROM deploys')}
+        present = {}
+        for entry in os.scandir(self.log_dir):
+            name = entry.name[:-3] if entry.name.endswith('.gz') else entry.name
+            if not LOG_NAME.match(name):
+                continue
+            # 压缩进行中 .log 与 .log.gz 可能同时存在，以 .log 为准
+            if name in present and entry.name.endswith('.gz'):
+                continue
+            present[name] = entry
+
+        files = records = 0
+        with self.conn:
+            for name in set(known) - set(present):
+                self._forget(known[name]['id'])
+            for name, entry in present.items():
+                stat = entry.stat()
+                row = known.get(name)
+                if row is not None and (row['size'], row['mtime']) == (stat.st_size, stat.st_mtime):
+                    continue
+                files += 1
+                records += self._ingest(name, Path(entry.path), stat, row)
+        return files, records
+
+    def _forget(self, deploy_id: int):
+        self.conn.execute('DELETE FROM lines WHERE deploy_id = ?', (deploy_id,))
+        self.conn.execute('DELETE FROM deploys WHERE id = ?', (deploy_id,))
+
+    def _ingest(self, name: str, path: Path, stat, row) -> int:
+        """从上次读到的偏移起读入一个日志文件，返回新增记录数"""
+        offset = row['offset'] if row is not None else 0
+        if path.suffix == '.gz':
+            # 压缩前已读到 offset (压缩不改变内容)，解压后跳过这部分
+            with gzip.open(path, 'rb') as f:
+                data = f.read()[offset:]
+        else:
+            if stat.st_size < offset:
+                offset = 0  # 文件被截断，重建
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+
+        if row is None or offset == 0:
+            if row is not None:
+                self._forget(row['id'])
+            mode, agent, stamp = LOG_NAME.match(name).groups()
+            started = datetime.strptime(stamp, '%Y%m%d-%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+            deploy_id = self.conn.execute(
+                "INSERT INTO deploys (name, agent, mode, started, kind, status) "
+                "VALUES (?, ?, ?, ?, 'other', '-')", (name, agent, mode, started)).lastrowid
+            step = None
+        else:
+            deploy_id, step = row['id'], row['step']
+
+        # 只处理到最后一个完整行，未写完的行留到下次
+        end = data.rfind(b'\n') + 1
+        text = data[:end].decode('utf-8', errors='replace')
+        count, step = self._insert_lines(deploy_id, text, step)
+        self.conn.execute('UPDATE deploys SET offset = ?, size = ?, mtime = ?, step = ? WHERE id = ?',
+                          (offset + end, stat.st_size, stat.st_mtime, step, deploy_id))
+        return count
+
+    def _insert_lines(self, deploy_id: int, text: str, step: Optional[str]) -> Tuple[int, Optional[str]]:
+        """解析日志记录 (多行消息的后续行并入上一条) 并更新部署结果"""
+        records = []
+        for line in text.splitlines():
+            match = RECORD.match(line)
+            if match:
+                records.append(list(match.groups()))
+            elif records:
+                records[-1][2] += '\n' + line
+            else:
+                # 续接上次读到的最后一条记录
+                last = self.conn.execute('SELECT id, message FROM lines WHERE deploy_id = ? '
+                                         'ORDER BY id DESC LIMIT 1', (deploy_id,)).fetchone()
+                if last is not None:
+                    self.conn.execute('UPDATE lines SET message = ? WHERE id = ?',
+                                      (last['message'] + '\n' + line, last['id']))
+                    self._classify(deploy_id, line, step, 'INFO')
+
+        rows = []
+        for ts, level, message in records:
+            match = STEP.search(message)
+            if match:
+                step = match.group(1)
+            rows.append((deploy_id, ts, level, step, message))
+            self._classify(deploy_id, message, step, level)
+        self.conn.executemany('INSERT INTO lines (deploy_id, ts, level, step, message) '
+                              'VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows), step
+
+    def _classify(self, deploy_id: int, message: str, step: Optional[str], level: str):
+        """根据关键记录更新部署类型与结果"""
+        if '开始部署' in message:
+            self.conn.execute("UPDATE deploys SET kind = 'deploy', status = 'incomplete' "
+                              "WHERE id = ? AND kind = 'other'", (deploy_id,))
+        elif '回滚' in message:
+            self.conn.execute("UPDATE deploys SET kind = 'rollback' "
+                              "WHERE id = ? AND kind = 'other'", (deploy_id,))
+        if '部署完成' in message:
+            # 同一日志中先失败后续跑成功时以最后结果为准
+            self.conn.execute("UPDATE deploys SET status = 'ok', failed_step = NULL, error = NULL "
+                              "WHERE id = ?", (deploy_id,))
+        elif '部署失败' in message:
+            error = message.split('部署失败', 1)[1].lstrip(':： ').strip()
+            self.conn.execute("UPDATE deploys SET status = 'failed', error = ? WHERE id = ?",
+                              (error, deploy_id))
+        elif level == 'ERROR' and message.rstrip().endswith('❌') and step:
+            self.conn.execute('UPDATE deploys SET failed_step = ? WHERE id = ? '
+                              'AND failed_step IS NULL', (step, deploy_id))
+
+    # ── 查询 ──
+
+    def deploys(self, agent: str = None, mode: str = None, failed: bool = False,
+                since: str = None, limit: int = 20) -> List[sqlite3.Row]:
+        """部署记录 (新的在前)"""
+        where, params = self._filters(agent, mode, since)
+        if failed:
+            where.append("d.status IN ('failed', 'incomplete')")
+        sql = 'SELECT d.* FROM deploys d'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY d.started DESC, d.id DESC LIMIT ?'
+        return self.conn.execute(sql, (*params, limit)).fetchall()
+
+    def search(self, text: str = None, agent: str = None, mode: str = None,
+               level: str = None, since: str = None, failed: bool = False,
+               limit: int = 50) -> List[sqlite3.Row]:
+        """日志记录全文检索 (新的在前)"""
+        where, params = self._filters(agent, mode, since)
+        joins = 'lines l JOIN deploys d ON d.id = l.deploy_id'
+        if text:
+            # trigram 至少需要 3 个字符，更短的词用 LIKE
+            if self.fts and len(text) >= 3:
+                joins += ' JOIN lines_fts f ON f.rowid = l.id'
+                where.append('lines_fts MATCH ?')
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                where.append("l.message LIKE ? ESCAPE '\\'")
+                params.append('%' + re.sub(r'([%_\\])', r'\\\1', text) + '%')
+        if level:
+            where.append('l.level = ?')
+            params.append(level.upper())
+        if failed:
+            where.append("d.status IN ('failed', 'incomplete')")
+        sql = (f'SELECT l.ts, l.level, l.step, l.message, d.agent, d.mode, d.name '
+               f'FROM {joins}')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY l.ts DESC, l.id DESC LIMIT ?'
+        return self.conn.execute(sql, (*params, limit)).fetchall()
+
+    def _filters(self, agent: str, mode: str, since: str) -> Tuple[List[str], List]:
+        where, params = [], []
+        if agent:
+            where.append('d.agent = ?')
+            params.append(agent)
+        if mode:
+            where.append('d.mode = ?')
+            params.append(mode)
+        if since:
+            where.append('d.started >= ?')
+            params.append(since)
+        return where, params
+
+
+def print_deploys(rows: List[sqlite3.Row], log_dir: Path):
+    """打印部署记录表"""
+    icons = {'ok': '✅', 'failed': '❌', 'incomplete': '⚠️ ', '-': '  '}
+    print("\n" + "="*96)
+    print(f"{'时间':<21} {'名称':<20} {'模式':<5} {'类型':<9} {'结果':<4} {'失败步骤 / 错误'}")
+    print("-" * 96)
+    for row in rows:
+        detail = ' — '.join(filter(None, [row['failed_step'], row['error']]))
+        print(f"{row['started']:<21} {row['agent']:<20} {row['mode'].upper():<5} "
+              f"{row['kind']:<9} {icons.get(row['status'], '  '):<4} {detail}")
+        if row['status'] in ('failed', 'incomplete'):
+            print(f"{'':<21} 日志: {log_dir / row['name']}")
+    print("="*96)
+    print(f"共 {len(rows)} 条\n")
+
+
+def print_lines(rows: List[sqlite3.Row]):
+    """打印检索到的日志记录"""
+    for row in reversed(rows):
+        step = f" ({row['step']})" if row['step'] else ''
+        first, *rest = row['message'].split('\n')
+        print(f"{row['ts']} [{row['agent']}] {row['level']:<7}{step} {first}")
+        for line in rest:
+            print(f"{'':>20} {line}")
+    print(f"\n共 {len(rows)} 条\n")
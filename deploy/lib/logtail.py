@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+多路实时跟踪 Gateway 日志 (deploy-agent --tail)
+按登记找到每个 Agent 的 stdout / stderr 日志 (路径由服务后端给出，见 services.gateway_logs)，
+交错输出并加上 [Agent] 前缀。
+
+等待新内容使用文件系统变更通知而不是轮询:
+
+    Linux   inotify (监视各日志所在目录，一个目录一个 watch)
+    macOS   kqueue  (EVFILT_VNODE: 日志文件本身 + 所在目录)
+
+空闲时进程阻塞在一次系统调用上，跟踪 50 个 Agent 也几乎不占资源；
+两者都不可用时退化为每秒 stat 一次。
+
+日志被截断 (从头写) 或轮转 (rename 后新建) 时从新文件开头继续；
+日志或目录尚不存在 (服务还没启动过) 的，每隔 RESCAN_INTERVAL 秒重试一次。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from services import CLAW_AGENT
+
+
+DEFAULT_LINES = 10          # 启动时每个日志先输出的末尾行数
+RESCAN_INTERVAL = 5.0       # 有日志或目录缺失时的重试间隔 (秒)
+POLL_INTERVAL = 1.0         # 无变更通知机制时的轮询间隔 (秒)
+READ_CHUNK = 65536
+HEAD_BYTES = 64             # 记录文件开头的字节数，用于识别被截断后又写长的日志
+
+
+class LogSource:
+    """一个被跟踪的日志文件 (增量读取，保留不完整的末行)"""
+
+    def __init__(self, agent: str, stream: str, path: Path):
+        self.agent = agent
+        self.stream = stream        # 'out' / 'err'
+        self.path = Path(path)
+        self.fd: Optional[int] = None
+        self.inode = None
+        self.position = 0
+        self.partial = b''
+        self.head = b''
+        self.error: Optional[str] = None
+
+    def open(self, backlog: Optional[int] = None) -> List[str]:
+        """打开日志，返回末尾 backlog 行 (None 为全部内容，用于新出现的日志)
+
+        不存在或无权读取时返回空。
+        """
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            self.error = e.strerror
+            return []
+        st = os.fstat(fd)
+        self.fd, self.inode, self.error = fd, (st.st_dev, st.st_ino), None
+        self.partial, self.head = b'', b''
+        if backlog is None:
+            self.position = 0
+        elif backlog <= 0:
+            self.position = st.st_size
+        else:
+            self.position = _tail_offset(fd, st.st_size, backlog)
+        return self._drain()
+
+    def read(self) -> List[str]:
+        """读取新增内容 (截断时从头、轮转时换到新文件)，返回完整的行"""
+        if self.fd is None:
+            return self.open()
+
+        lines = self._drain() if self._same_head() else []
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return lines                # 已删除: 保持打开，等新文件出现
+        if (st.st_dev, st.st_ino) != self.inode:
+            lines += self._flush_partial()
+            self.close()
+            return lines + self.open()
+        if st.st_size < self.position or not self._same_head():
+            self.position, self.partial, self.head = 0, b'', b''
+            lines += self._drain()
+        return lines
+
+    def _same_head(self) -> bool:
+        """文件开头与上次读到的一致 (否则是截断后又写入了超过原长度的内容)"""
+        return not self.head or os.pread(self.fd, len(self.head), 0) == self.head
+
+    def _drain(self) -> List[str]:
+        if len(self.head) < HEAD_BYTES:
+            self.head = os.pread(self.fd, HEAD_BYTES, 0)
+        chunks = []
+        while True:
+            data = os.pread(self.fd, READ_CHUNK, self.position)
+            if not data:
+                break
+            chunks.append(data)
+            self.position += len(data)
+        if not chunks:
+            return []
+        data = self.partial + b''.join(chunks)
+        *complete, self.partial = data.split(b'\n')
+        return [line.decode('utf-8', 'replace').rstrip('\r') for line in complete]
+
+    def _flush_partial(self) -> List[str]:
+        line, self.partial = self.partial, b''
+        return [line.decode('utf-8', 'replace')] if line else []
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _tail_offset(fd: int, size: int, count: int) -> int:
+    """从文件末尾向前找第 count 行的起始偏移"""
+    offset, found = size, 0
+    while offset > 0:
+        step = min(READ_CHUNK, offset)
+        offset -= step
+        block = os.pread(fd, step, offset)
+        # 文件末尾的换行不算作一行的开始
+        end = len(block) - 1 if offset + step == size else len(block)
+        index = block.rfind(b'\n', 0, end)
+        while index != -1:
+            found += 1
+            if found == count:
+                return offset + index + 1
+            index = block.rfind(b'\n', 0, index)
+    return 0
+
+
+# ── 变更通知 ──
+
+
+class _PollWatcher:
+    """无通知机制时的退化实现: 定时醒来检查全部日志"""
+
+    name = 'poll'
+
+    def __init__(self):
+        self.watched: Set[Path] = set()
+
+    def add_dir(self, directory: Path) -> bool:
+        self.watched.add(directory)
+        return True
+
+    def add_file(self, source: LogSource):
+        pass
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        """阻塞到有变更或超时，返回发生变更的路径 (文件或目录)；None 表示全部检查"""
+        select.select([], [], [], POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL))
+        return None
+
+    def close(self):
+        pass
+
+
+class _InotifyWatcher:
+    """inotify (Linux)，通过 libc 调用；监视目录即可覆盖其中的文件与新建/轮转"""
+
+    name = 'inotify'
+
+    IN_MODIFY = 0x002
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x01000000
+    DIR_MASK = (IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.dirs: Dict[int, Path] = {}
+
+    @property
+    def watched(self) -> Set[Path]:
+        return set(self.dirs.values())
+
+    def add_dir(self, directory: Path) -> bool:
+        wd = self._add_watch(self.fd, os.fsencode(directory), self.DIR_MASK)
+        if wd < 0:
+            return False
+        self.dirs[wd] = directory
+        return True
+
+    def add_file(self, source: LogSource):
+        pass
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, READ_CHUNK)
+        except BlockingIOError:
+            return set()
+
+        changed: Set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0')
+            offset += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self.dirs[wd]       # 目录被删除: 之后重扫时重新监视
+                changed.add(directory)
+            elif name:
+                changed.add(directory / os.fsdecode(name))
+            else:
+                changed.add(directory)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _KqueueWatcher:
+    """kqueue (macOS/BSD): 日志文件的写入/截断/轮转 + 目录的新建 (日志首次出现或轮转)"""
+
+    name = 'kqueue'
+
+    def __init__(self):
+        self.kq = select.kqueue()
+        self.idents: Dict[int, Path] = {}
+        self.dir_fds: List[int] = []
+
+    @property
+    def watched(self) -> Set[Path]:
+        return {self.idents[fd] for fd in self.dir_fds}
+
+    def _register(self, fd: int, path: Path, fflags: int):
+        event = select.kevent(fd, filter=select.KQ_FILTER_VNODE,
+                              flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR, fflags=fflags)
+        self.kq.control([event], 0)
+        self.idents[fd] = path
+
+    def add_dir(self, directory: Path) -> bool:
+        try:
+            fd = os.open(directory, os.O_RDONLY | getattr(os, 'O_EVTONLY', 0))
+        except OSError:
+            return False
+        self._register(fd, directory, select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE
+                       | select.KQ_NOTE_RENAME)
+        self.dir_fds.append(fd)
+        return True
+
+    def add_file(self, source: LogSource):
+        # 注册在 LogSource 自己的读句柄上，句柄关闭时内核自动注销
+        self._register(source.fd, source.path, select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND
+                       | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME | select.KQ_NOTE_ATTRIB)
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        changed: Set[Path] = set()
+        for event in self.kq.control(None, 64, timeout):
+            path = self.idents.get(event.ident)
+            if path is None:
+                continue
+            changed.add(path)
+            if event.ident in self.dir_fds and event.fflags & (select.KQ_NOTE_DELETE
+                                                               | select.KQ_NOTE_RENAME):
+                self.dir_fds.remove(event.ident)     # 目录被删除: 之后重扫时重新监视
+                del self.idents[event.ident]
+                os.close(event.ident)
+        return changed
+
+    def close(self):
+        for fd in self.dir_fds:
+            os.close(fd)
+        self.kq.close()
+
+
+def create_watcher():
+    """当前平台可用的变更通知机制"""
+    if hasattr(select, 'kqueue'):
+        return _KqueueWatcher()
+    if sys.platform.startswith('linux'):
+        try:
+            return _InotifyWatcher()
+        except (OSError, AttributeError):
+            pass    # 没有 libc inotify (或 inotify 实例数已达上限)
+    return _PollWatcher()
+
+
+# ── 多路跟踪 ──
+
+
+def agent_log_sources(agents: Iterable[Dict], backend_for_scope: Callable) -> List[LogSource]:
+    """登记项 → 各 Agent 的 stdout / stderr 日志 (Claw 自身不在登记管理范围内)"""
+    sources = []
+    for agent in agents:
+        name = agent.get('name') or agent.get('agent')
+        if name == CLAW_AGENT:
+            continue
+        if agent.get('mode') == 'l2':
+            paths = backend_for_scope('system').gateway_logs(agent.get('username') or name)
+        else:
+            paths = backend_for_scope('user').gateway_logs(name)
+        sources.extend(LogSource(name, stream, path)
+                       for stream, path in zip(('out', 'err'), paths))
+    return sources
+
+
+class LogTailer:
+    """把多个日志交错输出到 echo，每行加 [Agent] (stderr 为 [Agent!]) 前缀"""
+
+    def __init__(self, sources: List[LogSource], echo: Callable[[str], None] = print,
+                 watcher=None):
+        self.sources = sources
+        self.echo = echo
+        self.watcher = watcher if watcher is not None else create_watcher()
+        width = max((len(s.agent) for s in sources), default=0) + 4
+        self._prefix = {id(s): f"[{s.agent}{'!' if s.stream == 'err' else ''}]".ljust(width)
+                        for s in sources}
+        self._by_dir: Dict[Path, List[LogSource]] = {}
+        for source in sources:
+            self._by_dir.setdefault(source.path.parent, []).append(source)
+
+    @property
+    def missing(self) -> List[LogSource]:
+        """尚未打开的日志 (不存在或无权读取)"""
+        return [s for s in self.sources if s.fd is None]
+
+    def start(self, backlog: int = DEFAULT_LINES):
+        """打开全部日志并输出末尾 backlog 行"""
+        for source in self.sources:
+            self._read(source, backlog)
+        self._rescan()
+
+    def follow(self):
+        """持续跟踪 (阻塞，Ctrl-C 退出)"""
+        while True:
+            changed = self.watcher.wait(RESCAN_INTERVAL if self._incomplete() else None)
+            if changed is None:
+                targets = self.sources
+            else:
+                targets = [s for s in self.sources
+                           if s.path in changed or s.path.parent in changed]
+            for source in targets:
+                self._read(source)
+            if changed is None or self._incomplete():
+                self._rescan()
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+        self.watcher.close()
+
+    def _incomplete(self) -> bool:
+        return bool(self.missing) or len(self.watcher.watched) < len(self._by_dir)
+
+    def _rescan(self):
+        """监视新出现的目录，打开新出现的日志 (从头读)"""
+        watched = self.watcher.watched
+        for directory, sources in self._by_dir.items():
+            if directory not in watched and self.watcher.add_dir(directory):
+                for source in sources:
+                    self._read(source)
+        for source in self.missing:
+            self._read(source)
+
+    def _read(self, source: LogSource, backlog: Optional[int] = None):
+        fd = source.fd
+        lines = source.open(backlog) if fd is None else source.read()
+        if source.fd is not None and source.fd != fd:
+            self.watcher.add_file(source)
+        self._print(source, lines)
+
+    def _print(self, source: LogSource, lines: List[str]):
+        prefix = self._prefix[id(source)]
+        for line in lines:
+            self.echo(f'{prefix}{line}')
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+持续健康监控 (deploy-agent --watch)
+按 HEARTBEAT 设计的 Level 1 检查 — Gateway 健康 / 进程存活 / 磁盘空间 —
+以固定间隔并发探测 ports.yaml 中的全部 Agent。
+
+每个 Agent 的最近结果保存在定长环形缓冲区中，并累计延迟直方图；
+每轮顺带采样 Gateway 的 CPU / RSS 写入用量环形文件 (见 usage.py，--top 读取)；
+每轮结束后原子写入状态文件 (默认 config/.watch.status.json)，
+仪表盘直接读取该文件，无需自行探测。
+
+休眠中的 Agent (见 hibernate.py) 不做网络探测，避免把它们唤醒。
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import registry_snapshot
+from hibernate import read_hibernating
+from registry_snapshot import write_json_atomic
+from snapshot import SystemSnapshot
+from usage import DEFAULT_CAPACITY, DEFAULT_INTERVAL as USAGE_INTERVAL, UsageSampler
+
+
+STATUS_NAME = '.watch.status.json'
+
+DEFAULT_INTERVAL = 60
+DEFAULT_HISTORY = 120
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_DISK_MIN_GB = 10     # HEARTBEAT Level 1: 可用 < 10GB 告警
+
+# 延迟直方图桶上界 (毫秒)，最后一桶为 +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class ProbeResult:
+    """一次探测结果"""
+
+    __slots__ = ('time', 'gateway_ok', 'latency_ms', 'process_ok', 'pid', 'cpu', 'rss_mb',
+                 'disk_free_gb', 'disk_ok', 'hibernating', 'error')
+
+    def __init__(self):
+        self.time = time.time()
+        self.gateway_ok = False
+        self.latency_ms: Optional[float] = None
+        self.process_ok = False
+        self.pid: Optional[int] = None
+        self.cpu: Optional[float] = None
+        self.rss_mb: Optional[float] = None
+        self.disk_free_gb: Optional[float] = None
+        self.disk_ok = True
+        self.hibernating = False
+        self.error: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        """up / degraded (Gateway 正常但有其他问题) / down / hibernating"""
+        if self.hibernating:
+            return 'hibernating'
+        if not self.gateway_ok:
+            return 'down'
+        if not (self.process_ok and self.disk_ok):
+            return 'degraded'
+        return 'up'
+
+    def to_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['status'] = self.status
+        return data
+
+
+class LatencyHistogram:
+    """固定桶延迟直方图 (内存占用与样本数无关)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+
+    def add(self, latency_ms: float):
+        for i, bound in enumerate(self.buckets):
+            if latency_ms <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def to_dict(self) -> Dict[str, int]:
+        labels = [f'le_{b}' for b in self.buckets] + ['inf']
+        return dict(zip(labels, self.counts))
+
+
+class AgentHealth:
+    """单个 Agent 的监控状态"""
+
+    def __init__(self, agent: Dict, history: int):
+        self.name = agent.get('name') or agent.get('agent')
+        self.agent = agent
+        self.port = agent['port']
+        self.history: deque = deque(maxlen=history)
+        self.histogram = LatencyHistogram()
+        self.consecutive_failures = 0
+
+    @property
+    def latest(self) -> Optional[ProbeResult]:
+        return self.history[-1] if self.history else None
+
+    def record(self, result: ProbeResult):
+        self.history.append(result)
+        if result.latency_ms is not None:
+            self.histogram.add(result.latency_ms)
+        if result.status in ('up', 'hibernating'):
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+
+    def summary(self) -> Dict:
+        probed = [r for r in self.history if not r.hibernating]
+        latencies = sorted(r.latency_ms for r in probed if r.latency_ms is not None)
+        latest = self.latest
+        return {
+            'name': self.name,
+            'mode': self.agent.get('mode'),
+            'port': self.port,
+            'status': latest.status if latest else 'unknown',
+            'consecutive_failures': self.consecutive_failures,
+            'availability': (sum(r.gateway_ok for r in probed) / len(probed)) if probed else None,
+            'latency_ms': {
+                'p50': _percentile(latencies, 50),
+                'p95': _percentile(latencies, 95),
+                'max': latencies[-1] if latencies else None,
+            },
+            'histogram': self.histogram.to_dict(),
+            'latest': latest.to_dict() if latest else None,
+            'recent': [r.status for r in self.history],
+        }
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+
+async def probe_gateway(port: int, host: str = '127.0.0.1',
+                        timeout: float = DEFAULT_TIMEOUT):
+    """HTTP GET / ，返回 (是否 200, 延迟毫秒, 错误)"""
+    start = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f'GET / HTTP/1.0\r\nHost: {host}:{port}\r\n\r\n'.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        latency = (time.perf_counter() - start) * 1000
+        parts = status_line.decode(errors='replace').split()
+        if len(parts) >= 2 and parts[1] == '200':
+            return True, latency, None
+        return False, latency, f"HTTP {parts[1] if len(parts) >= 2 else '无响应'}"
+    except (OSError, asyncio.TimeoutError) as e:
+        return False, None, str(e) or type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def agent_home(agent: Dict, defaults: Dict) -> Path:
+    """Agent 数据所在目录 (用于磁盘检查)"""
+    if agent.get('mode') == 'l2':
+        return Path(defaults.get('users_root', '/Users')) / (agent.get('username') or agent.get('agent'))
+    return Path.home() / f".openclaw-{agent.get('name') or agent.get('agent')}"
+
+
+class HealthMonitor:
+    """异步健康监控器"""
+
+    def __init__(self, defaults: Dict, names: List[str] = None,
+                 interval: float = DEFAULT_INTERVAL, history: int = DEFAULT_HISTORY,
+                 timeout: float = DEFAULT_TIMEOUT, disk_min_gb: float = DEFAULT_DISK_MIN_GB,
+                 config_dir: Path = None, status_path: Path = None,
+                 echo: Callable[[str], None] = print):
+        self.defaults = defaults
+        self.names = set(names) if names else None
+        self.interval = interval
+        self.history = history
+        self.timeout = timeout
+        self.disk_min_gb = disk_min_gb
+        self.config_dir = config_dir or registry_snapshot.default_config_dir()
+        self.status_path = status_path or self.config_dir / STATUS_NAME
+        self.echo = echo
+        self.agents: Dict[str, AgentHealth] = {}
+        self.cycles = 0
+        self.sampler = UsageSampler(self.config_dir,
+                                    capacity=defaults.get('usage_history', DEFAULT_CAPACITY),
+                                    interval=defaults.get('usage_interval', USAGE_INTERVAL))
+
+    def _refresh_agents(self):
+        """每轮重新读取登记 (快照，开销很小)，跟上新部署/回滚"""
+        current = {}
+        for agent in registry_snapshot.list_agents(self.config_dir):
+            name = agent.get('name') or agent.get('agent')
+            if self.names is not None and name not in self.names:
+                continue
+            health = self.agents.get(name)
+            if health is None or health.port != agent['port']:
+                health = AgentHealth(agent, self.history)
+            current[name] = health
+        self.agents = current
+
+    async def cycle(self):
+        """一轮探测: 进程快照与磁盘检查在线程中执行，网络探测全部并发"""
+        self._refresh_agents()
+        hibernating = read_hibernating(self.config_dir)
+
+        snapshot_task = asyncio.to_thread(SystemSnapshot.capture)
+        disk_task = asyncio.to_thread(self._disk_free, list(self.agents.values()))
+        probes = {name: asyncio.ensure_future(probe_gateway(h.port, timeout=self.timeout))
+                  for name, h in self.agents.items() if name not in hibernating}
+
+        snapshot, disk_free = await asyncio.gather(snapshot_task, disk_task)
+        usage = await asyncio.to_thread(
+            self.sampler.sample,
+            [h.agent for name, h in self.agents.items() if name not in hibernating], snapshot)
+        await asyncio.gather(*probes.values())
+
+        for name, health in self.agents.items():
+            result = ProbeResult()
+            result.disk_free_gb = disk_free.get(name)
+            result.disk_ok = result.disk_free_gb is None or result.disk_free_gb >= self.disk_min_gb
+            if name in hibernating:
+                result.hibernating = True
+            else:
+                result.gateway_ok, result.latency_ms, result.error = probes[name].result()
+                proc = snapshot.gateway_for_port(health.port)
+                result.process_ok = proc is not None
+                result.pid = proc.pid if proc else None
+                sample = usage.get(name)
+                if sample is not None and sample.rss is not None:
+                    result.cpu = sample.cpu
+                    result.rss_mb = round(sample.rss / 1024 ** 2, 1)
+            self._report_transition(health, result)
+            health.record(result)
+
+        self.cycles += 1
+        write_json_atomic(self.status_path, self.status())
+
+    def _disk_free(self, agents: List[AgentHealth]) -> Dict[str, float]:
+        """各 Agent 所在文件系统的可用空间 (GB)，同一文件系统只查一次"""
+        by_device, free = {}, {}
+        for health in agents:
+            path = agent_home(health.agent, self.defaults)
+            while not path.exists() and path != path.parent:
+                path = path.parent
+            try:
+                device = os.stat(path).st_dev
+                if device not in by_device:
+                    by_device[device] = shutil.disk_usage(path).free / 1024 ** 3
+                free[health.name] = by_device[device]
+            except OSError:
+                continue
+        return free
+
+    def _report_transition(self, health: AgentHealth, result: ProbeResult):
+        previous = health.latest.status if health.latest else None
+        if previous == result.status or (previous is None and result.status == 'up'):
+            return
+        icons = {'up': '✅', 'degraded': '⚠️ ', 'down': '❌', 'hibernating': '💤'}
+        detail = f" ({result.error})" if result.error else ''
+        if result.status == 'degraded':
+            detail = ' (进程未找到)' if not result.process_ok else \
+                f' (磁盘可用 {result.disk_free_gb:.1f}GB)'
+        self.echo(f"[{datetime.now():%H:%M:%S}] {icons[result.status]} {health.name} "
+                  f":{health.port} {previous or '-'} → {result.status}{detail}")
+
+    def status(self) -> Dict:
+        """状态文件内容"""
+        return {
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'interval': self.interval,
+            'cycles': self.cycles,
+            'agents': [h.summary() for h in self.agents.values()],
+        }
+
+    async def run(self, once: bool = False):
+        """按间隔循环探测；once=True 时只探测一轮"""
+        self.echo(f"👀 监控 {len(registry_snapshot.list_agents(self.config_dir))} 个已登记 Agent，"
+                  f"每 {self.interval:g}s 一轮，状态文件: {self.status_path}")
+        try:
+            while True:
+                started = time.monotonic()
+                await self.cycle()
+                if once:
+                    return
+                counts = {}
+                for health in self.agents.values():
+                    counts[health.latest.status] = counts.get(health.latest.status, 0) + 1
+                self.echo(f"[{datetime.now():%H:%M:%S}] " +
+                          ' / '.join(f"{status} {n}" for status, n in sorted(counts.items())))
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            self.sampler.close()
+
+
+def print_status(monitor: HealthMonitor):
+    """打印单轮结果表 (--watch --once)"""
+    print("\n" + "="*72)
+    print(f"{'名称':<20} {'端口':<8} {'状态':<12} {'延迟':<10} {'PID':<8} {'磁盘可用'}")
+    print("-" * 72)
+    for health in monitor.agents.values():
+        r = health.latest
+        latency = f"{r.latency_ms:.1f}ms" if r.latency_ms is not None else '-'
+        disk = f"{r.disk_free_gb:.1f}GB" if r.disk_free_gb is not None else '-'
+        print(f"{health.name:<20} {health.port:<8} {r.status:<12} {latency:<10} "
+              f"{str(r.pid or '-'):<8} {disk}")
+    print("="*72 + "\n")
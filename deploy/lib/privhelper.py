@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+特权助手
+一次 sudo 认证启动一个常驻 root 进程，通过 stdin/stdout 的 JSON 行协议
+接收文件系统与账户操作并在进程内执行，替代逐条 `sudo -S` 调用
+
+协议:
+    请求  {"op": "mkdir", "path": "...", "owner": "user:staff"}
+    响应  {"ok": true, ...} 或 {"ok": false, "error": "..."}
+
+本文件只依赖标准库，以 `python3 privhelper.py --serve` 在 root 下运行。
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from contextlib import nullcontext
+
+# 以脚本运行时 sys.path[0] 即 lib 目录
+from exceptions import PermissionError
+from tracing import command_label
+
+
+READY_TIMEOUT = 30
+HELLO = {'op': 'hello'}
+
+
+# ── Client (部署器侧) ──
+
+
+class PrivilegedHelper:
+    """特权助手客户端 (线程安全)"""
+
+    def __init__(self, sudo_password: str, python: str = None, tracer=None):
+        self.sudo_password = sudo_password
+        self.python = python or sys.executable
+        self.tracer = tracer
+        self._proc = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """启动助手并完成 sudo 认证"""
+        # -k 忽略已缓存的凭据，确保 sudo 一定从 stdin 读取密码
+        self._proc = subprocess.Popen(
+            ['sudo', '-k', '-S', '-p', '', self.python, os.path.abspath(__file__), '--serve'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, bufsize=1,
+        )
+
+        # 认证失败时 sudo 会等待重试，超时直接终止
+        timer = threading.Timer(READY_TIMEOUT, self._proc.kill)
+        timer.start()
+        try:
+            self._proc.stdin.write(f"{self.sudo_password or ''}\n")
+            self._proc.stdin.write(json.dumps(HELLO) + '\n')
+            self._proc.stdin.flush()
+            line = self._proc.stdout.readline()
+        except OSError:
+            line = ''
+        finally:
+            timer.cancel()
+
+        if not line or not json.loads(line).get('ok'):
+            self._proc.kill()
+            stderr = self._proc.stderr.read().strip()
+            self._proc = None
+            raise PermissionError(f"特权助手启动失败 (sudo 认证): {stderr or '无响应'}")
+
+    def close(self):
+        """关闭助手"""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+        self._proc = None
+
+    def _span(self, op: str, params: dict):
+        """为一次调用记录 span (未配置 tracer 时为空操作)"""
+        if self.tracer is None:
+            return nullcontext()
+        if op == 'run':
+            return self.tracer.span(command_label(params['command']), 'privileged',
+                                    user=params.get('user'))
+        return self.tracer.span(op, 'privileged',
+                                path=params.get('path') or params.get('dst'))
+
+    def call(self, op: str, **params) -> dict:
+        """发送一个操作并等待结果"""
+        with self._span(op, params):
+            return self._call(op, params)
+
+    def _call(self, op: str, params: dict) -> dict:
+        with self._lock:
+            if not self.running:
+                self.start()
+            try:
+                self._proc.stdin.write(json.dumps({'op': op, **params}) + '\n')
+                self._proc.stdin.flush()
+                line = self._proc.stdout.readline()
+            except OSError as e:
+                raise PermissionError(f"特权助手通信失败: {e}")
+
+        if not line:
+            raise PermissionError(f"特权助手已退出 ({op})")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise PermissionError(f"命令失败: {response.get('error')}")
+        return response
+
+    # ── 便捷方法 ──
+
+    def mkdir(self, path: str, owner: str = None, mode: int = None):
+        return self.call('mkdir', path=str(path), owner=owner, mode=mode)
+
+    def write(self, path: str, content: str, owner: str = None, mode: int = None):
+        return self.call('write', path=str(path), content=content, owner=owner, mode=mode)
+
+    def copy(self, src: str, dst: str, owner: str = None, mode: int = None):
+        return self.call('copy', src=str(src), dst=str(dst), owner=owner, mode=mode)
+
+    def symlink(self, src: str, dst: str, owner: str = None):
+        return self.call('symlink', src=str(src), dst=str(dst), owner=owner)
+
+    def chown(self, path: str, owner: str):
+        return self.call('chown', path=str(path), owner=owner)
+
+    def chmod(self, path: str, mode: int):
+        return self.call('chmod', path=str(path), mode=mode)
+
+    def remove(self, path: str, recursive: bool = False):
+        return self.call('remove', path=str(path), recursive=recursive)
+
+    def install_tree(self, path: str, archive: bytes, owner: str = None):
+        """把 tar 解包为目录 path (整棵树属主设为 owner)，一次往返完成"""
+        return self.call('install_tree', path=str(path), owner=owner,
+                         archive=base64.b64encode(archive).decode('ascii'))
+
+    def inspect(self, paths: list, read: list = ()) -> dict:
+        """以 root 查看路径状态与内容哈希 (见 inspect_paths)"""
+        return self.call('inspect', paths=[str(p) for p in paths],
+                         read=[str(p) for p in read])
+
+    def run(self, command: list, user: str = None, env: dict = None,
+            check: bool = True, timeout: int = 300, input: str = None) -> dict:
+        """以 root (或指定用户) 执行命令，返回 returncode/stdout/stderr
+
+        input 写入子进程 stdin (密码等敏感内容经此传递，不出现在命令行参数中)。
+        """
+        return self.call('run', command=[str(c) for c in command], user=user,
+                         env=env, check=check, timeout=timeout, input=input)
+
+
+# ── Server (root 侧) ──
+
+
+def _resolve_owner(owner: str):
+    import grp
+    import pwd
+
+    user, _, group = owner.partition(':')
+    uid = pwd.getpwnam(user).pw_uid if user else -1
+    gid = grp.getgrnam(group).gr_gid if group else -1
+    return uid, gid
+
+
+def _apply_owner(path: str, owner: str = None, mode: int = None, follow: bool = True):
+    if owner:
+        uid, gid = _resolve_owner(owner)
+        if follow:
+            os.chown(path, uid, gid)
+        else:
+            os.lchown(path, uid, gid)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def _op_mkdir(path, owner=None, mode=None):
+    # 与 `mkdir -p` 一致：逐级创建，仅对新建的目录设置属主
+    missing = []
+    current = path
+    while current and not os.path.exists(current):
+        missing.append(current)
+        current = os.path.dirname(current)
+    os.makedirs(path, exist_ok=True)
+    for created in reversed(missing):
+        _apply_owner(created, owner, mode)
+    if not missing:
+        _apply_owner(path, owner, mode)
+    return {}
+
+
+def _op_write(path, content, owner=None, mode=None):
+    # 未指定 mode 时沿用目标文件的权限；新文件为 0600 (openclaw.json 含 API key 与 token)
+    if mode is None:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o600
+    # 同目录临时文件 + rename，读者不会看到半写的文件
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.deploy-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.chmod(tmp, mode)
+        _apply_owner(tmp, owner)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return {}
+
+
+def _op_copy(src, dst, owner=None, mode=None):
+    shutil.copy(src, dst)
+    _apply_owner(dst, owner, mode)
+    return {}
+
+
+def _op_symlink(src, dst, owner=None):
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    os.symlink(src, dst)
+    _apply_owner(dst, owner, follow=False)
+    return {}
+
+
+def _op_chown(path, owner):
+    _apply_owner(path, owner)
+    return {}
+
+
+def _op_chmod(path, mode):
+    os.chmod(path, mode)
+    return {}
+
+
+def _op_remove(path, recursive=False):
+    if os.path.isdir(path) and not os.path.islink(path):
+        if recursive:
+            shutil.rmtree(path)
+        else:
+            os.rmdir(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+    return {}
+
+
+def _op_install_tree(path, archive, owner=None):
+    # 解包到目标旁的暂存目录，设定属主后 rename，目标要么完整出现要么不出现
+    if os.path.lexists(path):
+        raise FileExistsError(f"目标已存在: {path}")
+    staging = f"{path}.staging-{os.getpid()}"
+    if os.path.lexists(staging):
+        shutil.rmtree(staging)
+    os.mkdir(staging)
+    try:
+        with tarfile.open(fileobj=io.BytesIO(base64.b64decode(archive))) as tar:
+            # 'tar' 过滤器拒绝写出目标目录之外的成员，但保留指向共享层的绝对 symlink
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extractall(staging, filter='tar')
+            else:
+                tar.extractall(staging)
+        for dirpath, dirnames, filenames in os.walk(staging):
+            _apply_owner(dirpath, owner)
+            for name in dirnames + filenames:
+                _apply_owner(os.path.join(dirpath, name), owner, follow=False)
+        os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return {}
+
+
+def inspect_paths(paths, read=()) -> dict:
+    """各路径的当前状态，供增量收敛比对 (本进程权限内执行)
+
+    paths 中每项返回 {"type": "missing"} / {"type": "link", "target": ...} /
+    {"type": "file", "sha256": ...} / {"type": "other"}；
+    read 中的文件另外返回文本内容。
+    """
+    states, contents = {}, {}
+    for path in paths:
+        if os.path.islink(path):
+            states[path] = {'type': 'link', 'target': os.readlink(path)}
+        elif os.path.isfile(path):
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(chunk)
+            states[path] = {'type': 'file', 'sha256': digest.hexdigest()}
+        elif os.path.exists(path):
+            states[path] = {'type': 'other'}
+        else:
+            states[path] = {'type': 'missing'}
+    for path in read:
+        try:
+            with open(path, encoding='utf-8') as f:
+                contents[path] = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+    return {'paths': states, 'contents': contents}
+
+
+def _op_inspect(paths, read=()):
+    return inspect_paths(paths, read)
+
+
+def _op_run(command, user=None, env=None, check=True, timeout=300, input=None):
+    preexec = None
+    run_env = {**os.environ, **(env or {})}
+    if user:
+        import pwd
+        pw = pwd.getpwnam(user)
+        run_env.setdefault('HOME', pw.pw_dir)
+        run_env['USER'] = run_env['LOGNAME'] = user
+
+        def preexec():
+            os.initgroups(user, pw.pw_gid)
+            os.setgid(pw.pw_gid)
+            os.setuid(pw.pw_uid)
+
+    result = subprocess.run(command, capture_output=True, text=True, env=run_env,
+                            preexec_fn=preexec, timeout=timeout, input=input)
+    if check and result.returncode != 0:
+        # 只报告程序名，参数里可能有密码
+        raise RuntimeError(result.stderr.strip() or
+                           f"{command[0]} 退出码 {result.returncode}")
+    return {'returncode': result.returncode, 'stdout': result.stdout,
+            'stderr': result.stderr}
+
+
+OPERATIONS = {
+    'mkdir': _op_mkdir,
+    'write': _op_write,
+    'copy': _op_copy,
+    'symlink': _op_symlink,
+    'chown': _op_chown,
+    'chmod': _op_chmod,
+    'remove': _op_remove,
+    'install_tree': _op_install_tree,
+    'inspect': _op_inspect,
+    'run': _op_run,
+}
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """逐行处理请求直到 stdin 关闭"""
+    def reply(payload):
+        stdout.write(json.dumps(payload) + '\n')
+        stdout.flush()
+
+    # sudo 有 NOPASSWD 等配置时密码行会透传过来，握手前的非请求行一律忽略
+    for line in stdin:
+        try:
+            if json.loads(line) == HELLO:
+                break
+        except ValueError:
+            continue
+    else:
+        return
+    reply({'ok': True, 'pid': os.getpid()})
+
+    for line in stdin:
+        try:
+            request = json.loads(line)
+            handler = OPERATIONS[request.pop('op')]
+            reply({'ok': True, **handler(**request)})
+        except subprocess.TimeoutExpired as e:
+            reply({'ok': False, 'error': f"命令超时: {e.cmd[0]}"})
+        except Exception as e:
+            reply({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--serve']:
+        sys.exit("用法: privhelper.py --serve (由 PrivilegedHelper 通过 sudo 启动)")
+    serve()
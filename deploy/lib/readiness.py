@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Gateway 就绪探测
+以指数退避轮询，先探测 TCP 端口再探测 HTTP，直到就绪或超时
+"""
+
+import socket
+import time
+import urllib.request
+
+
+DEFAULT_TIMEOUT = 30.0
+
+
+class ReadinessResult:
+    """就绪探测结果"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.ready = False
+        self.stage = 'tcp'       # 最后到达的阶段: tcp / http / ready
+        self.attempts = 0
+        self.elapsed = 0.0       # 就绪耗时 (未就绪时为总等待时间)
+        self.error = None
+
+    def __repr__(self):
+        state = 'ready' if self.ready else f'not ready at {self.stage}'
+        return f"<ReadinessResult :{self.port} {state} after {self.elapsed:.2f}s>"
+
+
+def wait_until_ready(port: int, host: str = '127.0.0.1', path: str = '/',
+                     timeout: float = DEFAULT_TIMEOUT,
+                     initial_delay: float = 0.05, max_delay: float = 1.0,
+                     backoff: float = 2.0) -> ReadinessResult:
+    """轮询 Gateway 直到 TCP 可连接且 HTTP 返回 200，或超过 timeout"""
+    result = ReadinessResult(port)
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = initial_delay
+
+    while True:
+        result.attempts += 1
+        remaining = deadline - time.monotonic()
+        attempt_timeout = max(0.05, min(remaining, max_delay * 2))
+
+        if _probe_tcp(host, port, attempt_timeout, result):
+            result.stage = 'http'
+            if _probe_http(host, port, path, attempt_timeout, result):
+                result.stage = 'ready'
+                result.ready = True
+                result.error = None
+                break
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def _probe_tcp(host: str, port: int, timeout: float, result: ReadinessResult) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError as e:
+        result.error = str(e)
+        return False
+
+
+def _probe_http(host: str, port: int, path: str, timeout: float,
+                result: ReadinessResult) -> bool:
+    try:
+        req = urllib.request.Request(f"http://{host}:{port}{path}", method='GET')
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            if resp.status == 200:
+                return True
+            result.error = f"HTTP {resp.status}"
+    except Exception as e:
+        result.error = str(e)
+    return False
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+增量收敛 (deploy-agent --reconcile)
+按当前模板与登记渲染已部署 Agent 的期望状态，与磁盘上的实际状态逐项比对
+内容哈希，只写入有差异的项；仅当 openclaw.json 或服务单元变化时重启 Gateway。
+
+资源类型:
+    file     完全由部署工具决定的文件 (服务单元、auth-profiles)，内容不同即覆盖
+    json     openclaw.json: 只比较模板声明的键与列表元素 (对象按 id / name 对应，
+             与顺序无关)，写回时保留 openclaw CLI 自行添加的键与列表元素
+    seed     workspace 文件 (IDENTITY / MEMORY / USER) 归 Agent 所有，仅在缺失时创建
+    symlink  共享层链接，目标不同即重建
+
+gateway token、Bot token 与部署时间从现有 openclaw.json 中沿用，
+否则每次渲染都会不同，永远无法收敛；meta.lastTouchedVersion 由 openclaw CLI
+写入时更新，同样沿用现有值。
+
+整个 fleet 的收敛并发执行；同一服务作用域内需要重启的 Gateway
+合并为一次 launchctl/systemctl 调用。
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from logger import flush_logs
+from readiness import wait_until_ready
+from services import CLAW_AGENT, ServiceBackend, ServiceUnit
+
+
+DEFAULT_WORKERS = 8
+
+
+def content_hash(data) -> str:
+    """内容哈希: 字符串按 UTF-8，其他值按规范化 JSON"""
+    if not isinstance(data, (str, bytes)):
+        data = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _item_key(item):
+    """列表元素的标识: 带 id (或 name) 的对象按该字段，其他值按内容"""
+    if isinstance(item, dict):
+        for field in ('id', 'name'):
+            if field in item:
+                return (field, content_hash(item[field]))
+    return ('value', content_hash(item))
+
+
+def _match_items(actual: list, desired: list) -> List[Optional[int]]:
+    """期望列表中每个元素在实际列表中的下标 (没有对应元素时为 None)"""
+    index = {}
+    for i, item in enumerate(actual):
+        index.setdefault(_item_key(item), i)
+    return [index.get(_item_key(item)) for item in desired]
+
+
+def project_json(actual, desired):
+    """实际 JSON 中与期望 JSON 对应的部分 (只保留期望中出现的键与列表元素)"""
+    if isinstance(actual, dict) and isinstance(desired, dict):
+        return {k: project_json(actual[k], v) for k, v in desired.items() if k in actual}
+    if isinstance(actual, list) and isinstance(desired, list):
+        return [project_json(actual[i], v) for i, v in zip(_match_items(actual, desired), desired)
+                if i is not None]
+    return actual
+
+
+def merge_json(actual, desired):
+    """把期望 JSON 合并进实际 JSON，期望中未出现的键与列表元素原样保留"""
+    if isinstance(actual, dict) and isinstance(desired, dict):
+        merged = dict(actual)
+        for k, v in desired.items():
+            merged[k] = merge_json(actual.get(k), v)
+        return merged
+    if isinstance(actual, list) and isinstance(desired, list):
+        merged = list(actual)
+        for i, v in zip(_match_items(actual, desired), desired):
+            if i is None:
+                merged.append(v)
+            else:
+                merged[i] = merge_json(actual[i], v)
+        return merged
+    return desired
+
+
+def preserved_config_values(current: Optional[Dict]) -> Dict[str, str]:
+    """现有 openclaw.json 中需要沿用的值 (渲染模板时作为参数传入)"""
+    def dig(*keys):
+        node = current
+        for key in keys:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(key)
+        return node or None
+
+    values = {
+        'gateway_token': dig('gateway', 'auth', 'token'),
+        'bot_token': dig('channels', 'telegram', 'accounts', 'default', 'botToken'),
+        'deploy_time': dig('meta', 'deployed_at'),
+        'last_touched_version': dig('meta', 'lastTouchedVersion'),
+    }
+    return {k: v for k, v in values.items() if v}
+
+
+def read_json(files, path: Path) -> Optional[Dict]:
+    """读取现有 JSON 文件，不存在或无法解析时返回 None"""
+    text = files.inspect([], [str(path)])['contents'].get(str(path))
+    try:
+        data = json.loads(text) if text else None
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class Resource:
+    """期望状态中的一项"""
+
+    def __init__(self, kind: str, path: Path, content=None, restart: bool = False,
+                 install: Callable[[], None] = None, mode: int = None):
+        self.kind = kind            # file / json / seed / symlink
+        self.path = Path(path)
+        self.content = content      # 文件内容 / JSON 对象 / symlink 目标
+        self.restart = restart      # 变化后是否需要重启 Gateway
+        self.install = install      # 自定义写入方式 (服务单元经后端写入)
+        self.mode = mode            # 写入后的文件权限 (含密钥的文件为 0600)
+
+    def differs(self, state: Dict, text: Optional[str]) -> bool:
+        """与实际状态比对 (state 来自 privhelper.inspect_paths)"""
+        kind = state['type']
+        if self.kind == 'seed':
+            return kind == 'missing'
+        if self.kind == 'symlink':
+            return kind != 'link' or state['target'] != str(self.content)
+        if kind != 'file':
+            return True
+        if self.kind == 'json':
+            try:
+                actual = json.loads(text)
+            except (TypeError, ValueError):
+                return True
+            return content_hash(project_json(actual, self.content)) != content_hash(self.content)
+        return state['sha256'] != content_hash(self.content)
+
+
+class Change:
+    """一项需要写入的差异"""
+
+    def __init__(self, resource: Resource, action: str, current_text: str = None):
+        self.resource = resource
+        self.action = action        # create / update
+        self.current_text = current_text
+
+    @property
+    def label(self) -> str:
+        return self.resource.path.name
+
+    def __repr__(self):
+        return f"<Change {self.action} {self.resource.path}>"
+
+
+def plan(resources: List[Resource], files) -> List[Change]:
+    """比对期望与实际状态，返回需要写入的差异 (一次 inspect 调用)"""
+    paths = [str(r.path) for r in resources]
+    reads = [str(r.path) for r in resources if r.kind == 'json']
+    snapshot = files.inspect(paths, reads)
+
+    changes = []
+    for resource in resources:
+        path = str(resource.path)
+        state = snapshot['paths'][path]
+        text = snapshot['contents'].get(path)
+        if resource.differs(state, text):
+            action = 'create' if state['type'] == 'missing' else 'update'
+            changes.append(Change(resource, action, text))
+    return changes
+
+
+def apply(changes: List[Change], files):
+    """写入差异"""
+    for change in changes:
+        resource = change.resource
+        if resource.install is not None:
+            resource.install()
+        elif resource.kind == 'symlink':
+            files.symlink(resource.content, resource.path)
+        elif resource.kind == 'json':
+            try:
+                actual = json.loads(change.current_text) if change.current_text else {}
+            except ValueError:
+                actual = {}
+            merged = merge_json(actual if isinstance(actual, dict) else {}, resource.content)
+            files.write(resource.path, json.dumps(merged, indent=2, ensure_ascii=False) + '\n',
+                        mode=resource.mode)
+        else:
+            files.write(resource.path, resource.content, mode=resource.mode)
+
+
+# ── 文件访问 ──
+
+
+class LocalFiles:
+    """以当前用户读写 (L1)"""
+
+    def __init__(self, logger=None):
+        self.logger = logger
+
+    def inspect(self, paths: List[str], read: List[str] = ()) -> Dict:
+        from privhelper import inspect_paths
+        return inspect_paths(paths, read)
+
+    def write(self, path: Path, content: str, mode: int = None):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.logger is not None:
+            with self.logger.span('write', 'file', path=str(path)):
+                path.write_text(content)
+        else:
+            path.write_text(content)
+        if mode is not None:
+            path.chmod(mode)
+
+    def symlink(self, target: Path, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() or path.is_symlink():
+            path.unlink()
+        path.symlink_to(target)
+
+
+class PrivilegedFiles:
+    """经特权助手读写，并把文件属主设为 Agent 用户 (L2)"""
+
+    def __init__(self, privileged: Callable, owner: str):
+        self.privileged = privileged
+        self.owner = owner
+
+    def inspect(self, paths: List[str], read: List[str] = ()) -> Dict:
+        return self.privileged().inspect(paths, read)
+
+    def write(self, path: Path, content: str, mode: int = None):
+        helper = self.privileged()
+        helper.mkdir(str(Path(path).parent), owner=self.owner)
+        helper.write(str(path), content, owner=self.owner, mode=mode)
+
+    def symlink(self, target: Path, path: Path):
+        helper = self.privileged()
+        helper.mkdir(str(Path(path).parent), owner=self.owner)
+        helper.symlink(str(target), str(path), owner=self.owner)
+
+
+# ── 结果与 fleet 收敛 ──
+
+
+class ReconcileResult:
+    """单个 Agent 的收敛结果"""
+
+    def __init__(self, agent_name: str, mode: str, port: int):
+        self.agent: Dict = {}       # 登记项
+        self.agent_name = agent_name
+        self.mode = mode
+        self.port = port
+        self.changes: List[Change] = []
+        self.backend: Optional[ServiceBackend] = None
+        self.unit: Optional[ServiceUnit] = None
+        self.restarted = False
+        self.time_to_ready = None
+        self.error = None
+        self.duration = 0.0
+
+    @property
+    def needs_restart(self) -> bool:
+        return any(c.resource.restart for c in self.changes)
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+class FleetReconciler:
+    """并发收敛一组已登记 Agent，最后按服务作用域批量重启"""
+
+    def __init__(self, config, agents: List[Dict], sudo_password: str = None,
+                 password_prompt: Callable[[], str] = None,
+                 workers: int = None, dry_run: bool = False,
+                 role: str = None, bot_token: str = None):
+        from services import FleetBackends
+
+        self.config = config
+        self.agents = [a for a in agents if (a.get('name') or a.get('agent')) != CLAW_AGENT]
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.dry_run = dry_run
+        self.role = role
+        self.bot_token = bot_token
+        prompt = (lambda: sudo_password) if sudo_password is not None else password_prompt
+        self.backends = FleetBackends(config, prompt)
+
+    def run(self) -> List[ReconcileResult]:
+        """收敛全部 Agent，返回与输入顺序一致的结果"""
+        try:
+            return self.reconcile(self.agents)
+        finally:
+            self.close()
+
+    def reconcile(self, agents: List[Dict], dry_run: bool = None) -> List[ReconcileResult]:
+        """收敛一组 Agent (最多 workers 个并发)，然后批量重启并等待就绪"""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='reconcile') as pool:
+            results = list(pool.map(lambda a: self._reconcile_one(a, dry_run), agents))
+        if not dry_run:
+            self._restart(results)
+        flush_logs()
+        return results
+
+    def close(self):
+        self.backends.close()
+
+    def _deployer(self, agent: Dict):
+        from deploy_l1 import L1Deployer
+        from deploy_l2 import L2Deployer
+
+        name = agent.get('name') or agent.get('agent')
+        args = argparse.Namespace(
+            mode=agent.get('mode'), name=name, username=agent.get('username') or name,
+            uid=agent.get('uid'), port=agent['port'], role=self.role,
+            bot_token=self.bot_token, profile=False,
+            # 收敛不分配资源: 缺少 uid 的旧登记项只查看下一个 UID，不占用
+            dry_run=True,
+        )
+        if agent.get('mode') == 'l2':
+            return L2Deployer(self.config, args, None, privileged=self.backends.privileged)
+        return L1Deployer(self.config, args)
+
+    def _reconcile_one(self, agent: Dict, dry_run: bool) -> ReconcileResult:
+        start = time.monotonic()
+        name = agent.get('name') or agent.get('agent')
+        try:
+            result = self._deployer(agent).reconcile(dry_run=dry_run)
+        except Exception as e:
+            result = ReconcileResult(name, agent.get('mode'), agent.get('port'))
+            result.error = str(e)
+        result.agent = agent
+        result.duration = time.monotonic() - start
+        return result
+
+    def _restart(self, results: List[ReconcileResult]):
+        """同一后端 (作用域 + 单元目录) 的重启合并为一次调用，然后并发等待就绪"""
+        groups: Dict[tuple, List[ReconcileResult]] = {}
+        for result in results:
+            if result.success and result.needs_restart:
+                backend = result.backend
+                key = (backend.name, backend.scope, str(backend.unit_dir))
+                groups.setdefault(key, []).append(result)
+
+        restarted = []
+        for group in groups.values():
+            try:
+                group[0].backend.restart([r.unit for r in group])
+            except Exception as e:
+                for result in group:
+                    result.error = f"重启失败: {e}"
+                continue
+            for result in group:
+                result.restarted = True
+            restarted.extend(group)
+
+        if not restarted:
+            return
+        timeout = self.config.defaults.get('readiness_timeout', 30)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            readiness = list(pool.map(lambda r: wait_until_ready(r.port, timeout=timeout),
+                                      restarted))
+        for result, ready in zip(restarted, readiness):
+            if ready.ready:
+                result.time_to_ready = ready.elapsed
+            else:
+                result.error = f"重启后未就绪 ({ready.stage}): {ready.error}"
+
+
+def print_reconcile_report(results: List[ReconcileResult], elapsed: float, dry_run: bool = False):
+    """打印收敛汇总"""
+    print("\n" + "="*88)
+    print("📊 收敛报告" + (" (预演，未写入)" if dry_run else ""))
+    print("="*88)
+    print(f"{'名称':<20} {'模式':<6} {'变更':<6} {'重启':<6} {'耗时':<10} {'详情'}")
+    print("-" * 88)
+
+    for result in results:
+        if not result.success:
+            detail = f"❌ {result.error}"
+        elif result.changes:
+            detail = ', '.join(f"{'+' if c.action == 'create' else '~'}{c.label}"
+                               for c in result.changes)
+        else:
+            detail = '✅ 无变化'
+        restart = '✅' if result.restarted else ('待重启' if dry_run and result.needs_restart else '-')
+        print(f"{result.agent_name:<20} {(result.mode or '-').upper():<6} "
+              f"{len(result.changes):<6} {restart:<6} {result.duration:>6.2f}s   {detail}")
+
+    changed = sum(1 for r in results if r.changes)
+    restarted = sum(1 for r in results if r.restarted)
+    failed = sum(1 for r in results if not r.success)
+    print("-" * 88)
+    print(f"总计：{len(results)} 个 Agent，{changed} 个有变更，{restarted} 个重启，"
+          f"{failed} 个失败，总耗时 {elapsed:.1f}s")
+    print("="*88 + "\n")
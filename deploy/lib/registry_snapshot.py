@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+登记快照
+ports.yaml 的 JSON 预编译副本，供 --list / --verify 等只读命令快速读取，
+避免为查询而导入 yaml 并解析 YAML。本模块只依赖标准库。
+
+快照记录 ports.yaml 与登记日志的 (mtime, size)；任一变化即视为过期，
+过期时回退到 ConfigManager 加载并重新生成快照。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CONFIG_DIR_ENV = 'OPENCLAW_DEPLOY_CONFIG_DIR'
+SNAPSHOT_NAME = '.ports.snapshot.json'
+SOURCE_NAMES = ('ports.yaml', 'ports.journal.jsonl')
+VERSION = 1
+
+
+def default_config_dir() -> Path:
+    """配置目录 (可用环境变量 OPENCLAW_DEPLOY_CONFIG_DIR 覆盖，供基准/演练使用)"""
+    override = os.environ.get(CONFIG_DIR_ENV)
+    return Path(override) if override else Path(__file__).parent.parent / 'config'
+
+
+def source_stamp(config_dir: Path) -> List[Optional[List[int]]]:
+    """登记源文件的当前版本戳 (在读取登记之前获取)"""
+    stamp = []
+    for name in SOURCE_NAMES:
+        try:
+            st = os.stat(config_dir / name)
+            stamp.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            stamp.append(None)
+    return stamp
+
+
+def write_snapshot(ports: Dict, config_dir: Path, stamp: List = None):
+    """写入快照 (由 ConfigManager 在加载/保存登记后调用)
+
+    stamp 应在读取 ports 之前获取，这样读取期间若有其他进程写入，
+    快照会因版本戳不符而被视为过期。
+    """
+    if stamp is None:
+        stamp = source_stamp(config_dir)
+    payload = {'version': VERSION, 'stamp': stamp, 'ports': ports}
+    try:
+        write_json_atomic(config_dir / SNAPSHOT_NAME, payload)
+    except OSError:
+        pass  # 快照只是加速手段，写不了 (只读目录等) 不影响功能
+
+
+def write_json_atomic(path: Path, data):
+    """原子写入 JSON (临时文件 + rename)，读者不会看到写了一半的文件"""
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def read_snapshot(config_dir: Path) -> Optional[Dict]:
+    """读取仍然有效的快照，过期或不存在时返回 None"""
+    try:
+        with open(config_dir / SNAPSHOT_NAME, encoding='utf-8') as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get('version') != VERSION or payload.get('stamp') != source_stamp(config_dir):
+        return None
+    return payload['ports']
+
+
+def load_ports(config_dir: Path = None) -> Dict:
+    """读取端口登记：优先快照，过期时完整加载并刷新快照"""
+    ports = read_snapshot(config_dir or default_config_dir())
+    if ports is None:
+        from config import ConfigManager
+        ports = ConfigManager().ports
+    return ports
+
+
+def list_agents(config_dir: Path = None) -> List[Dict]:
+    """已部署 Agent 列表 (只读)"""
+    return load_ports(config_dir).get('allocated', [])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+分波次配置发布 (deploy-agent --rollout)
+修改 defaults.yaml (如 default_model) 或 openclaw.json.j2 等模板后，
+按当前模板为全部 Agent 重新渲染配置，分波次增量收敛 (见 reconcile.py):
+
+    1. 对全部 Agent 预演收敛，只有存在差异的 Agent 进入发布
+    2. 第 1 波为 canary (默认 1 个)，之后每波规模按 growth 倍增，不超过 max_wave
+    3. 每波内部用有界线程池并发写入，同一服务作用域的重启合并为一次调用
+    4. 被重启的 Gateway 就绪后再观察 soak 秒并复查一次，捕获启动后崩溃
+    5. 任一 Agent 失败即停止，后续波次不再执行
+
+预演阶段有任何 Agent 出错时直接中止，不写入任何文件。
+"""
+
+import time
+from typing import Callable, Dict, List
+
+from readiness import wait_until_ready
+from reconcile import FleetReconciler, ReconcileResult
+
+
+DEFAULT_CANARY = 1
+DEFAULT_GROWTH = 2
+DEFAULT_MAX_WAVE = 16
+DEFAULT_SOAK = 10           # 秒
+RECHECK_TIMEOUT = 5         # soak 后复查的探测超时 (秒)
+
+
+def plan_waves(items: List, canary: int = DEFAULT_CANARY, growth: int = DEFAULT_GROWTH,
+               max_wave: int = DEFAULT_MAX_WAVE) -> List[List]:
+    """把 items 切成逐波增长的批次: canary, canary*growth, ... (单波不超过 max_wave)"""
+    waves = []
+    size = max(1, canary)
+    i = 0
+    while i < len(items):
+        waves.append(items[i:i + size])
+        i += size
+        size = max(size, min(size * max(1, growth), max_wave))
+    return waves
+
+
+class Wave:
+    """一个发布波次"""
+
+    def __init__(self, index: int, agents: List[Dict]):
+        self.index = index
+        self.agents = agents
+        self.results: List[ReconcileResult] = []
+        self.elapsed = 0.0
+
+    @property
+    def names(self) -> List[str]:
+        return [a.get('name') or a.get('agent') for a in self.agents]
+
+    @property
+    def failed(self) -> List[ReconcileResult]:
+        return [r for r in self.results if not r.success]
+
+
+class Rollout:
+    """分波次发布"""
+
+    def __init__(self, reconciler: FleetReconciler, canary: int = DEFAULT_CANARY,
+                 growth: int = DEFAULT_GROWTH, max_wave: int = DEFAULT_MAX_WAVE,
+                 soak: float = DEFAULT_SOAK, echo: Callable[[str], None] = print):
+        self.reconciler = reconciler
+        self.canary = canary
+        self.growth = growth
+        self.max_wave = max_wave
+        self.soak = soak
+        self.echo = echo
+        self.planned: List[ReconcileResult] = []
+        self.waves: List[Wave] = []
+        self.halted = False
+
+    @property
+    def results(self) -> List[ReconcileResult]:
+        """已执行波次的结果"""
+        return [r for wave in self.waves for r in wave.results]
+
+    @property
+    def pending(self) -> List[str]:
+        """因中止而未执行的 Agent"""
+        if not self.halted:
+            return []
+        return [name for wave in self.waves if not wave.results for name in wave.names]
+
+    def run(self, dry_run: bool = False) -> bool:
+        """执行发布，全部成功返回 True；dry_run 只计算差异与波次"""
+        try:
+            return self._run(dry_run)
+        finally:
+            self.reconciler.close()
+
+    def _run(self, dry_run: bool) -> bool:
+        self.planned = self.reconciler.reconcile(self.reconciler.agents, dry_run=True)
+        errors = [r for r in self.planned if not r.success]
+        if errors:
+            self.halted = True
+            for r in errors:
+                self.echo(f"❌ {r.agent_name}: {r.error}")
+            self.echo("❌ 预演阶段出错，未写入任何文件")
+            return False
+
+        changed = [r.agent for r in self.planned if r.changes]
+        self.waves = [Wave(i, agents) for i, agents in enumerate(
+            plan_waves(changed, self.canary, self.growth, self.max_wave), 1)]
+        self.echo(f"📋 {len(self.planned)} 个 Agent 中 {len(changed)} 个有变更，"
+                  f"分 {len(self.waves)} 波: {' → '.join(str(len(w.agents)) for w in self.waves) or '-'}")
+        if dry_run:
+            for wave in self.waves:
+                self.echo(f"   第 {wave.index} 波{' (canary)' if wave.index == 1 else ''}: "
+                          f"{', '.join(wave.names)}")
+            return True
+
+        for wave in self.waves:
+            if not self._apply(wave):
+                self.halted = True
+                return False
+        return True
+
+    def _apply(self, wave: Wave) -> bool:
+        """执行一波并按就绪检查放行"""
+        label = ' (canary)' if wave.index == 1 else ''
+        self.echo(f"\n🌊 第 {wave.index}/{len(self.waves)} 波{label}: {', '.join(wave.names)}")
+        start = time.monotonic()
+        wave.results = self.reconciler.reconcile(wave.agents)
+
+        restarted = [r for r in wave.results if r.restarted and r.success]
+        if not wave.failed and restarted and self.soak > 0:
+            self.echo(f"   ⏳ 观察 {self.soak:g}s 后复查 {len(restarted)} 个 Gateway")
+            time.sleep(self.soak)
+            for result in restarted:
+                readiness = wait_until_ready(result.port, timeout=RECHECK_TIMEOUT)
+                if not readiness.ready:
+                    result.error = f"观察期后不可用 ({readiness.stage}): {readiness.error}"
+        wave.elapsed = time.monotonic() - start
+
+        if wave.failed:
+            for r in wave.failed:
+                self.echo(f"   ❌ {r.agent_name}: {r.error}")
+            remaining = sum(len(w.agents) for w in self.waves[wave.index:])
+            self.echo(f"❌ 第 {wave.index} 波失败，停止发布 (剩余 {remaining} 个 Agent 未执行)")
+            self.echo("   失败的 Agent 已写入新配置，排查后用 --restart 重启，"
+                      "或修正模板后重新 --rollout")
+            return False
+
+        self.echo(f"   ✅ 完成 ({len(restarted)} 个重启, {wave.elapsed:.1f}s)")
+        return True
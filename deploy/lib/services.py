@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+服务管理器后端
+把 Gateway 服务的安装/启动/停止抽象为可替换的后端:
+
+    launchd  — macOS (L1: LaunchAgent, L2: LaunchDaemon)
+    systemd  — Linux (L1: systemd --user 服务, L2: 系统服务)
+
+所有操作都以"一组单元"为单位，一次服务管理器调用处理整组
+(launchctl load/bootstrap 与 systemctl 均支持多个目标)。
+并发部署时，短时间窗口内到达的启动请求会被合并为一次调用 (group commit)。
+"""
+
+import abc
+import subprocess
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from exceptions import ConfigError
+from tracing import command_label
+
+
+# Claw 自身的服务与登记名 — 任何批量操作都不能碰
+CLAW_LABEL = 'ai.openclaw.gateway'
+CLAW_AGENT = 'claw'
+
+# 启动请求合并窗口 (秒)
+DEFAULT_BATCH_WINDOW = 0.05
+
+
+def l1_label(name: str) -> str:
+    """L1 Agent 的服务标签"""
+    return f'ai.openclaw.gateway.{name}'
+
+
+def l2_label(username: str) -> str:
+    """L2 Agent 的服务标签"""
+    return f'ai.openclaw.{username}.gateway'
+
+
+class ServiceUnit:
+    """一个服务单元 (launchd plist / systemd unit)"""
+
+    def __init__(self, label: str, path: Path, content: str = None):
+        self.label = label
+        self.path = Path(path)
+        self.content = content
+
+
+class ServiceBackend(abc.ABC):
+    """服务管理器后端基类
+
+    scope 为 'user' (L1，当前用户) 或 'system' (L2，需要 root)。
+    system 作用域的写文件与命令经 privileged() 返回的特权助手执行。
+    """
+
+    name = ''
+    templates: Dict[str, str] = {}
+    display_names: Dict[str, str] = {}
+    suffix = ''
+    system_owner = 'root:root'
+    log_root = Path('/tmp')     # L2 Gateway 日志目录的上级 (与 system 模板一致)
+
+    def __init__(self, scope: str, unit_dir: Path,
+                 privileged: Callable = None, tracer=None,
+                 batch_window: float = DEFAULT_BATCH_WINDOW):
+        if scope not in ('user', 'system'):
+            raise ConfigError(f"未知服务作用域: {scope}")
+        self.scope = scope
+        self.unit_dir = Path(unit_dir)
+        self.privileged = privileged
+        self.tracer = tracer
+        self.batch_window = batch_window
+
+    @property
+    def display_name(self) -> str:
+        return self.display_names[self.scope]
+
+    def unit(self, label: str, content: str = None) -> ServiceUnit:
+        return ServiceUnit(label, self.unit_dir / f'{label}{self.suffix}', content)
+
+    def gateway_logs(self, name: str, profile_dir: Path = None) -> Tuple[Path, Path]:
+        """Gateway 的 (stdout, stderr) 日志路径，与本后端模板中的重定向一致
+
+        user 作用域 (L1) 写在 profile 目录的 logs/ 下 (profile_dir 缺省为 ~/.openclaw-{name})，
+        system 作用域 (L2) 写在 log_root/openclaw-{username}/ 下。
+        """
+        if self.scope == 'system':
+            root = self.log_root / f'openclaw-{name}'
+            return root / 'openclaw.log', root / 'openclaw.err'
+        logs = Path(profile_dir or Path.home() / f'.openclaw-{name}') / 'logs'
+        return logs / 'gateway.log', logs / 'gateway.err.log'
+
+    def render_unit(self, config, label: str, **context) -> ServiceUnit:
+        """按本后端的模板渲染服务单元"""
+        content = config.render_template(self.templates[self.scope], label=label, **context)
+        return self.unit(label, content)
+
+    # ── 公共操作 (均为一次批量调用) ──
+
+    def install(self, units: List[ServiceUnit]):
+        """写入单元文件"""
+        for unit in units:
+            self._write(unit)
+
+    @abc.abstractmethod
+    def start(self, units: List[ServiceUnit], check: bool = True):
+        """加载并启动"""
+
+    @abc.abstractmethod
+    def stop(self, units: List[ServiceUnit], check: bool = True):
+        """停止并卸载"""
+
+    @abc.abstractmethod
+    def restart(self, units: List[ServiceUnit]):
+        """重启 (单元文件变化后生效)"""
+
+    @abc.abstractmethod
+    def status(self, label: str) -> Optional[str]:
+        """服务状态描述 (诊断用)，未加载时返回 None"""
+
+    def loaded(self, label: str) -> bool:
+        """服务是否已被服务管理器加载 (再次启动会报"已加载")"""
+        return self.status(label) is not None
+
+    def apply(self, units: List[ServiceUnit]):
+        """安装并启动；与其他线程同时到达的启动请求合并为一次调用"""
+        self.install(units)
+        _batcher_for(self).submit(self, units)
+
+    def remove(self, units: List[ServiceUnit]):
+        """停止并删除单元文件 (忽略未加载的服务)"""
+        self.stop(units, check=False)
+        for unit in units:
+            if unit.path.exists():
+                self._remove(unit.path)
+
+    # ── 执行 ──
+
+    def _run(self, command: List[str], check: bool = True) -> Dict:
+        """执行服务管理器命令，返回 returncode/stdout/stderr"""
+        if self.scope == 'system' and self.privileged is not None:
+            return self.privileged().run(command, check=check)
+
+        span = (self.tracer.span(command_label(command), 'subprocess')
+                if self.tracer is not None else nullcontext())
+        with span:
+            proc = subprocess.run(command, capture_output=True, text=True)
+        if check and proc.returncode != 0:
+            raise ConfigError(f"{command_label(command)} 失败: {proc.stderr.strip()}")
+        return {'returncode': proc.returncode, 'stdout': proc.stdout, 'stderr': proc.stderr}
+
+    def _write(self, unit: ServiceUnit):
+        if self.scope == 'system' and self.privileged is not None:
+            self.privileged().write(unit.path, unit.content,
+                                    owner=self.system_owner, mode=0o644)
+            return
+        span = (self.tracer.span('write', 'file', path=str(unit.path))
+                if self.tracer is not None else nullcontext())
+        with span:
+            unit.path.parent.mkdir(parents=True, exist_ok=True)
+            unit.path.write_text(unit.content)
+
+    def _remove(self, path: Path):
+        if self.scope == 'system' and self.privileged is not None:
+            self.privileged().remove(path)
+        else:
+            path.unlink()
+
+
+class LaunchdBackend(ServiceBackend):
+    """launchd (macOS)"""
+
+    name = 'launchd'
+    templates = {'user': 'launchagent.plist', 'system': 'launchdaemon.plist'}
+    display_names = {'user': 'LaunchAgent', 'system': 'LaunchDaemon'}
+    suffix = '.plist'
+    system_owner = 'root:wheel'
+
+    def start(self, units: List[ServiceUnit], check: bool = True):
+        paths = [str(u.path) for u in units]
+        if self.scope == 'system':
+            return self._run(['launchctl', 'bootstrap', 'system', *paths], check=check)
+        return self._run(['launchctl', 'load', *paths], check=check)
+
+    def stop(self, units: List[ServiceUnit], check: bool = True):
+        paths = [str(u.path) for u in units]
+        if self.scope == 'system':
+            return self._run(['launchctl', 'bootout', 'system', *paths], check=check)
+        return self._run(['launchctl', 'unload', *paths], check=check)
+
+    def restart(self, units: List[ServiceUnit]):
+        # launchctl kickstart 只接受单个服务，卸载+加载两次调用处理整组
+        self.stop(units, check=False)
+        self.start(units)
+
+    def status(self, label: str) -> Optional[str]:
+        result = self._run(['launchctl', 'list'], check=False)
+        for line in result['stdout'].splitlines():
+            if line.split('\t')[-1].strip() == label:
+                return line.strip()
+        return None
+
+
+class SystemdBackend(ServiceBackend):
+    """systemd (Linux)；L1 使用 --user 实例，L2 使用系统实例并以 User= 降权"""
+
+    name = 'systemd'
+    templates = {'user': 'systemd-user.service', 'system': 'systemd-system.service'}
+    display_names = {'user': 'systemd 用户服务', 'system': 'systemd 服务'}
+    suffix = '.service'
+    log_root = Path('/var/log')
+
+    def _systemctl(self, *args) -> List[str]:
+        if self.scope == 'user':
+            return ['systemctl', '--user', *args]
+        return ['systemctl', *args]
+
+    def start(self, units: List[ServiceUnit], check: bool = True):
+        self._run(self._systemctl('daemon-reload'), check=check)
+        return self._run(self._systemctl('enable', '--now', *[u.label for u in units]),
+                         check=check)
+
+    def stop(self, units: List[ServiceUnit], check: bool = True):
+        return self._run(self._systemctl('disable', '--now', *[u.label for u in units]),
+                         check=check)
+
+    def restart(self, units: List[ServiceUnit]):
+        self._run(self._systemctl('daemon-reload'))
+        return self._run(self._systemctl('restart', *[u.label for u in units]))
+
+    def status(self, label: str) -> Optional[str]:
+        result = self._run(self._systemctl('is-active', label), check=False)
+        state = result['stdout'].strip()
+        return f"{label}: {state}" if state and state != 'inactive' else None
+
+    def loaded(self, label: str) -> bool:
+        # failed 的单元 status 非空，但需要重新 enable --now
+        result = self._run(self._systemctl('is-active', label), check=False)
+        return result['stdout'].strip() in ('active', 'activating', 'reloading')
+
+
+BACKENDS = {'launchd': LaunchdBackend, 'systemd': SystemdBackend}
+
+
+def get_backend(config, scope: str, privileged: Callable = None,
+                tracer=None) -> ServiceBackend:
+    """按 defaults.yaml 的 service_manager (auto/launchd/systemd) 选择后端"""
+    name = config.defaults.get('service_manager', 'auto')
+    if name == 'auto':
+        name = 'launchd' if sys.platform == 'darwin' else 'systemd'
+    if name not in BACKENDS:
+        raise ConfigError(f"未知服务管理器: {name} (可选 {', '.join(BACKENDS)})")
+
+    if name == 'launchd':
+        unit_dir = (Path.home() / 'Library' / 'LaunchAgents' if scope == 'user'
+                    else Path(config.defaults['launch_daemons_dir']))
+    else:
+        unit_dir = (Path.home() / '.config' / 'systemd' / 'user' if scope == 'user'
+                    else Path(config.defaults.get('systemd_system_dir', '/etc/systemd/system')))
+
+    return BACKENDS[name](scope, unit_dir, privileged=privileged, tracer=tracer,
+                          batch_window=config.defaults.get('service_batch_window',
+                                                           DEFAULT_BATCH_WINDOW))
+
+
+class FleetBackends:
+    """为整个 fleet 的操作按作用域提供后端 (可作为 backend_for 传入 agent_unit)
+
+    system 作用域首次执行命令时才启动特权助手 (调用 password_prompt 获取 sudo 密码)。
+    """
+
+    def __init__(self, config, password_prompt: Callable[[], str]):
+        self.config = config
+        self.password_prompt = password_prompt
+        self._backends: Dict[str, ServiceBackend] = {}
+        self._helper = None
+        self._lock = threading.Lock()
+
+    def __call__(self, scope: str) -> ServiceBackend:
+        if scope not in self._backends:
+            self._backends[scope] = get_backend(self.config, scope, privileged=self.privileged)
+        return self._backends[scope]
+
+    def privileged(self):
+        """共享的特权助手 (首次调用时启动)"""
+        from privhelper import PrivilegedHelper
+
+        with self._lock:
+            if self._helper is None:
+                helper = PrivilegedHelper(self.password_prompt())
+                helper.start()
+                self._helper = helper
+            return self._helper
+
+    def close(self):
+        with self._lock:
+            if self._helper is not None:
+                self._helper.close()
+                self._helper = None
+
+
+def agent_unit(backend_for_scope: Callable[[str], ServiceBackend], agent: Dict):
+    """登记项对应的 (后端, 单元)；Claw 自身返回 None"""
+    name = agent.get('name') or agent.get('agent')
+    if name == CLAW_AGENT:
+        return None
+    if agent.get('mode') == 'l2':
+        backend = backend_for_scope('system')
+        return backend, backend.unit(l2_label(agent.get('username') or name))
+    backend = backend_for_scope('user')
+    return backend, backend.unit(l1_label(name))
+
+
+# ── 启动请求合并 ──
+
+
+class _Batch:
+    def __init__(self):
+        self.units: List[ServiceUnit] = []
+        self.errors: Dict[str, Exception] = {}
+        self.done = threading.Event()
+
+
+class StartBatcher:
+    """group commit: 第一个到达的请求作为 leader 等待 window 秒，
+    期间到达的请求并入同一批，由 leader 发起一次服务管理器调用。
+
+    批量调用失败时 leader 逐个重试尚未加载的单元，使错误只归属到真正失败的单元
+    (已随批量调用加载的单元再次 bootstrap 会报"已加载"，不能算作失败)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Optional[_Batch] = None
+
+    def submit(self, backend: ServiceBackend, units: List[ServiceUnit]):
+        with self._lock:
+            leader = self._pending is None
+            if leader:
+                self._pending = _Batch()
+            batch = self._pending
+            batch.units.extend(units)
+
+        if leader:
+            if backend.batch_window > 0:
+                time.sleep(backend.batch_window)
+            with self._lock:
+                self._pending = None
+            self._flush(backend, batch)
+        else:
+            batch.done.wait()
+
+        for unit in units:
+            if unit.label in batch.errors:
+                raise batch.errors[unit.label]
+
+    def _flush(self, backend: ServiceBackend, batch: _Batch):
+        try:
+            backend.start(batch.units)
+        except Exception as e:
+            if len(batch.units) == 1:
+                batch.errors[batch.units[0].label] = e
+            else:
+                for unit in batch.units:
+                    if self._loaded(backend, unit):
+                        continue
+                    try:
+                        backend.start([unit])
+                    except Exception as unit_error:
+                        batch.errors[unit.label] = unit_error
+        finally:
+            batch.done.set()
+
+    @staticmethod
+    def _loaded(backend: ServiceBackend, unit: ServiceUnit) -> bool:
+        """单元是否已随批量调用加载 (查询失败时视为未加载，照常重试)"""
+        try:
+            return backend.loaded(unit.label)
+        except Exception:
+            return False
+
+
+_batchers: Dict[tuple, StartBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def _batcher_for(backend: ServiceBackend) -> StartBatcher:
+    key = (backend.name, backend.scope, str(backend.unit_dir))
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = StartBatcher()
+        return _batchers[key]
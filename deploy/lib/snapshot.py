@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+进程 / 监听端口快照
+一次采集全部进程与 TCP 监听套接字，按 PID 与端口建立索引，
+供批量验证等场景复用，避免每个 Agent 各自调用 ps / lsof；
+另提供按 PID 读取累计 CPU 时间与 RSS (process_usage，资源采样用)
+与主机内存总量 / 可用量 (host_memory，部署前容量检查用)
+
+数据源优先级: /proc (Linux) → psutil (若已安装) → ps + lsof 各一次
+"""
+
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import psutil
+except ImportError:  # 可选依赖
+    psutil = None
+
+
+PROC = Path('/proc')
+TCP_LISTEN = '0A'
+TCP_ESTABLISHED = '01'
+
+
+class ProcessInfo:
+    """进程信息 (cpu_time 为累计 CPU 秒数，rss 为字节数；未采集时为 None)"""
+
+    def __init__(self, pid: int, argv: List[str], cpu_time: float = None, rss: int = None):
+        self.pid = pid
+        self.argv = argv
+        self.cpu_time = cpu_time
+        self.rss = rss
+
+    @property
+    def cmdline(self) -> str:
+        return ' '.join(self.argv)
+
+    def is_gateway(self, port: int = None) -> bool:
+        """是否为 openclaw gateway 进程 (可选校验 --port 参数)"""
+        if not self.argv or not any('openclaw' in Path(a).name for a in self.argv[:2]):
+            return False
+        if 'gateway' not in self.argv:
+            return False
+        if port is None:
+            return True
+        for i, arg in enumerate(self.argv):
+            if arg == '--port' and i + 1 < len(self.argv) and self.argv[i + 1] == str(port):
+                return True
+            if arg == f'--port={port}':
+                return True
+        return False
+
+
+class SystemSnapshot:
+    """进程与监听端口快照"""
+
+    def __init__(self, processes: Dict[int, ProcessInfo], listeners: Dict[int, Set[int]],
+                 source: str):
+        self.processes = processes
+        self.listeners = listeners   # port -> {pid} (PID 不可见时为空集合)
+        self.source = source
+
+    @classmethod
+    def capture(cls) -> 'SystemSnapshot':
+        """采集快照"""
+        if (PROC / 'net' / 'tcp').exists():
+            return cls(_proc_processes(), _proc_listeners(), 'proc')
+        if psutil is not None:
+            return cls(*_psutil_capture(), 'psutil')
+        return cls(_ps_processes(), _lsof_listeners(), 'ps+lsof')
+
+    def is_listening(self, port: int) -> bool:
+        return port in self.listeners
+
+    def listener_pids(self, port: int) -> Set[int]:
+        return self.listeners.get(port, set())
+
+    def process(self, pid: int) -> Optional[ProcessInfo]:
+        return self.processes.get(pid)
+
+    def usage(self, pid: int) -> Optional[ProcessInfo]:
+        """带 CPU 时间 / RSS 的进程信息 (快照已包含时直接返回，否则单独读取)"""
+        proc = self.processes.get(pid)
+        if proc is not None and proc.rss is not None:
+            return proc
+        return process_usage([pid]).get(pid)
+
+    def gateway_for_port(self, port: int) -> Optional[ProcessInfo]:
+        """查找监听该端口的 gateway 进程
+
+        优先使用套接字归属；其他用户的套接字 PID 不可见时 (L2)，
+        退回到按 `gateway --port <port>` 参数精确匹配。
+        """
+        for pid in self.listener_pids(port):
+            proc = self.processes.get(pid)
+            if proc and proc.is_gateway():
+                return proc
+        for proc in self.processes.values():
+            if proc.is_gateway(port):
+                return proc
+        return None
+
+
+def established_connections(ports) -> Dict[int, int]:
+    """统计以这些端口为本地端口的已建立 TCP 连接数 (即各 Gateway 的入站连接)"""
+    ports = set(ports)
+    if (PROC / 'net' / 'tcp').exists():
+        counts = _proc_established()
+    elif psutil is not None:
+        try:
+            counts = {}
+            for conn in psutil.net_connections(kind='tcp'):
+                if conn.status == psutil.CONN_ESTABLISHED and conn.laddr:
+                    counts[conn.laddr.port] = counts.get(conn.laddr.port, 0) + 1
+        except psutil.AccessDenied:
+            counts = _lsof_established()
+    else:
+        counts = _lsof_established()
+    return {port: counts.get(port, 0) for port in ports}
+
+
+def process_usage(pids) -> Dict[int, ProcessInfo]:
+    """读取指定进程的命令行、累计 CPU 时间与 RSS (不存在的 PID 不出现在结果中)
+
+    只访问这些 PID，不枚举全部进程: /proc/<pid>/stat → psutil → 一次 ps -p。
+    调用方据命令行确认 PID 未被其他进程复用。
+    """
+    pids = sorted(set(pids))
+    if not pids:
+        return {}
+    if (PROC / 'net' / 'tcp').exists():
+        return _proc_usage(pids)
+    if psutil is not None:
+        usage, denied = _psutil_usage(pids)
+        if denied:
+            usage.update(_ps_usage(denied))  # 其他用户的进程 (L2)，ps 可见
+        return usage
+    return _ps_usage(pids)
+
+
+def host_memory() -> Optional[Tuple[int, int]]:
+    """主机内存 (总量, 可用量)，字节；无法获取时返回 None
+
+    可用量指不换页即可分配的内存: Linux 取 MemAvailable，
+    macOS 取 vm_stat 的 free + inactive + speculative + purgeable 页。
+    数据源: /proc/meminfo → psutil → sysctl + vm_stat
+    """
+    if (PROC / 'meminfo').exists():
+        info = {}
+        for line in (PROC / 'meminfo').read_text().splitlines():
+            key, _, value = line.partition(':')
+            fields = value.split()
+            if fields and fields[0].isdigit():
+                info[key] = int(fields[0]) * 1024
+        if 'MemTotal' in info:
+            return info['MemTotal'], info.get('MemAvailable', info.get('MemFree', 0))
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.total, memory.available
+    return _vm_stat_memory()
+
+
+def listening_ports() -> Set[int]:
+    """当前处于监听状态的全部 TCP 端口 (只读一次套接字表，不枚举进程)
+
+    端口分配时调用一次，整段候选范围在内存中比对。
+    数据源: /proc/net/tcp{,6} → psutil → netstat (macOS 非 root 也能看到其他用户的套接字)；
+    均不可用时返回空集合 (退化为只按登记分配)。
+    """
+    if (PROC / 'net' / 'tcp').exists():
+        return set(_proc_listen_inodes().values())
+    if psutil is not None:
+        try:
+            return {conn.laddr.port for conn in psutil.net_connections(kind='tcp')
+                    if conn.status == psutil.CONN_LISTEN and conn.laddr}
+        except psutil.AccessDenied:
+            pass
+    return _netstat_listening()
+
+
+# ── /proc (Linux) ──
+
+
+def _proc_processes() -> Dict[int, ProcessInfo]:
+    processes = {}
+    for entry in PROC.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            raw = (entry / 'cmdline').read_bytes()
+        except OSError:
+            continue
+        argv = [a.decode(errors='replace') for a in raw.split(b'\0') if a]
+        if argv:
+            processes[int(entry.name)] = ProcessInfo(int(entry.name), argv)
+    return processes
+
+
+def _proc_usage(pids: List[int]) -> Dict[int, ProcessInfo]:
+    ticks = os.sysconf('SC_CLK_TCK')
+    page = os.sysconf('SC_PAGE_SIZE')
+    usage = {}
+    for pid in pids:
+        try:
+            stat = (PROC / str(pid) / 'stat').read_bytes()
+            raw = (PROC / str(pid) / 'cmdline').read_bytes()
+        except OSError:
+            continue
+        # comm 可能含空格与括号，字段从最后一个 ')' 之后算起 (state 为第 3 个字段)
+        fields = stat[stat.rindex(b')') + 2:].split()
+        argv = [a.decode(errors='replace') for a in raw.split(b'\0') if a]
+        usage[pid] = ProcessInfo(pid, argv,
+                                 cpu_time=(int(fields[11]) + int(fields[12])) / ticks,
+                                 rss=int(fields[21]) * page)
+    return usage
+
+
+def _proc_listen_inodes() -> Dict[str, int]:
+    """读取 /proc/net/tcp{,6}，返回 监听套接字 inode -> 端口"""
+    inodes = {}
+    for name in ('tcp', 'tcp6'):
+        try:
+            lines = (PROC / 'net' / name).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10 or fields[3] != TCP_LISTEN:
+                continue
+            port = int(fields[1].rsplit(':', 1)[1], 16)
+            inodes[fields[9]] = port
+    return inodes
+
+
+def _proc_established() -> Dict[int, int]:
+    counts = {}
+    for name in ('tcp', 'tcp6'):
+        try:
+            lines = (PROC / 'net' / name).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                continue
+            port = int(fields[1].rsplit(':', 1)[1], 16)
+            counts[port] = counts.get(port, 0) + 1
+    return counts
+
+
+def _proc_listeners() -> Dict[int, Set[int]]:
+    inodes = _proc_listen_inodes()
+    listeners = {port: set() for port in inodes.values()}
+    if not inodes:
+        return listeners
+
+    for entry in PROC.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            fds = os.listdir(entry / 'fd')
+        except OSError:
+            continue  # 其他用户的进程，无权限
+        for fd in fds:
+            try:
+                target = os.readlink(entry / 'fd' / fd)
+            except OSError:
+                continue
+            if target.startswith('socket:['):
+                port = inodes.get(target[8:-1])
+                if port is not None:
+                    listeners[port].add(int(entry.name))
+    return listeners
+
+
+# ── psutil ──
+
+
+def _psutil_capture():
+    processes = {}
+    for proc in psutil.process_iter(['pid', 'cmdline']):
+        argv = proc.info.get('cmdline') or []
+        if argv:
+            processes[proc.info['pid']] = ProcessInfo(proc.info['pid'], argv)
+
+    try:
+        listeners = {}
+        for conn in psutil.net_connections(kind='tcp'):
+            if conn.status == psutil.CONN_LISTEN and conn.laddr:
+                pids = listeners.setdefault(conn.laddr.port, set())
+                if conn.pid:
+                    pids.add(conn.pid)
+    except psutil.AccessDenied:
+        # macOS 非 root 无法枚举全部连接
+        listeners = _lsof_listeners()
+    return processes, listeners
+
+
+def _psutil_usage(pids: List[int]):
+    usage, denied = {}, []
+    for pid in pids:
+        try:
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                times = proc.cpu_times()
+                usage[pid] = ProcessInfo(pid, proc.cmdline(),
+                                         cpu_time=times.user + times.system,
+                                         rss=proc.memory_info().rss)
+        except psutil.NoSuchProcess:
+            continue
+        except psutil.AccessDenied:
+            denied.append(pid)
+    return usage, denied
+
+
+# ── ps + lsof (macOS 兜底) ──
+
+PS_FIELDS = 'pid=,rss=,time=,command='
+
+
+def _ps_processes() -> Dict[int, ProcessInfo]:
+    result = subprocess.run(['ps', '-axww', '-o', PS_FIELDS],
+                            capture_output=True, text=True)
+    return _parse_ps(result.stdout)
+
+
+def _ps_usage(pids: List[int]) -> Dict[int, ProcessInfo]:
+    try:
+        result = subprocess.run(['ps', '-ww', '-o', PS_FIELDS, '-p', ','.join(map(str, pids))],
+                                capture_output=True, text=True)
+    except OSError:
+        return {}
+    return _parse_ps(result.stdout)
+
+
+def _parse_ps(output: str) -> Dict[int, ProcessInfo]:
+    """解析 ps -o pid=,rss=,time=,command= 的输出 (rss 单位 KB)"""
+    processes = {}
+    for line in output.splitlines():
+        fields = line.split(None, 3)
+        if len(fields) < 4 or not fields[0].isdigit():
+            continue
+        pid = int(fields[0])
+        rss = int(fields[1]) * 1024 if fields[1].isdigit() else None
+        processes[pid] = ProcessInfo(pid, fields[3].split(),
+                                     cpu_time=_ps_seconds(fields[2]), rss=rss)
+    return processes
+
+
+def _ps_seconds(value: str) -> Optional[float]:
+    """ps 的 time 列 ([[dd-]hh:]mm:ss[.ss]) → 秒"""
+    days, _, clock = value.rpartition('-')
+    try:
+        seconds = 0.0
+        for part in clock.split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds + (int(days) * 86400 if days else 0)
+    except ValueError:
+        return None
+
+
+def _lsof_listeners() -> Dict[int, Set[int]]:
+    result = subprocess.run(['lsof', '-nP', '-iTCP', '-sTCP:LISTEN', '-F', 'pn'],
+                            capture_output=True, text=True)
+    listeners = {}
+    pid = None
+    for line in result.stdout.splitlines():
+        if line.startswith('p'):
+            pid = int(line[1:])
+        elif line.startswith('n') and ':' in line:
+            port = line.rsplit(':', 1)[1]
+            if port.isdigit():
+                listeners.setdefault(int(port), set()).add(pid)
+    return listeners
+
+
+def _netstat_listening() -> Set[int]:
+    try:
+        result = subprocess.run(['netstat', '-an', '-p', 'tcp'],
+                                capture_output=True, text=True)
+    except OSError:
+        return set()
+    ports = set()
+    for line in result.stdout.splitlines():
+        # tcp4  0  0  127.0.0.1.19001  *.*  LISTEN
+        fields = line.split()
+        if len(fields) >= 6 and fields[-1] == 'LISTEN':
+            port = re.split(r'[.:]', fields[3])[-1]
+            if port.isdigit():
+                ports.add(int(port))
+    return ports
+
+
+def _vm_stat_memory() -> Optional[Tuple[int, int]]:
+    try:
+        total = subprocess.run(['sysctl', '-n', 'hw.memsize'], capture_output=True, text=True)
+        stat = subprocess.run(['vm_stat'], capture_output=True, text=True)
+    except OSError:
+        return None
+    if not total.stdout.strip().isdigit():
+        return None
+    # Mach Virtual Memory Statistics: (page size of 16384 bytes)
+    # Pages free:                               12345.
+    page = re.search(r'page size of (\d+) bytes', stat.stdout)
+    pages = dict(re.findall(r'^Pages ([\w ]+?):\s+(\d+)\.', stat.stdout, re.MULTILINE))
+    available = sum(int(pages.get(key, 0))
+                    for key in ('free', 'inactive', 'speculative', 'purgeable'))
+    return int(total.stdout), available * int(page.group(1) if page else 4096)
+
+
+def _lsof_established() -> Dict[int, int]:
+    result = subprocess.run(['lsof', '-nP', '-iTCP', '-sTCP:ESTABLISHED', '-F', 'n'],
+                            capture_output=True, text=True)
+    counts = {}
+    for line in result.stdout.splitlines():
+        # n127.0.0.1:19001->127.0.0.1:53122
+        if line.startswith('n') and '->' in line:
+            port = line[1:].split('->', 1)[0].rsplit(':', 1)[1]
+            if port.isdigit():
+                counts[int(port)] = counts.get(int(port), 0) + 1
+    return counts
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+暂存构建
+Profile / workspace 目录树先在暂存目录中完整构建，再一次性安装到正式位置:
+
+    L1  暂存目录与正式目录相邻 (同一文件系统)，安装为一次 rename (原子)
+    L2  暂存目录在部署用户的临时目录中构建，打包为 tar 一次交给特权助手，
+        由 root 解包到目标旁、设定属主后 rename 到位 (见 privhelper.install_tree)
+
+安装之前失败时只需删除暂存目录，正式位置不会出现半成品。
+"""
+
+import io
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from exceptions import ConfigError
+
+
+class StagedTree:
+    """一组 正式路径 → 暂存路径 的目录树
+
+    构建阶段通过 path() 把正式路径映射到暂存路径写入；
+    install() 按声明顺序逐个 rename，最后一个安装的目录即"部署完成"标记。
+    """
+
+    def __init__(self, roots: Dict[Path, Path]):
+        self.roots = {Path(final): Path(staging) for final, staging in roots.items()}
+        self.installed: List[Path] = []
+
+    @property
+    def complete(self) -> bool:
+        """全部目录树均已安装"""
+        return len(self.installed) == len(self.roots)
+
+    def prepare(self):
+        """创建空的暂存目录 (清除上次中断留下的残余)"""
+        for staging in self.roots.values():
+            if staging.exists():
+                shutil.rmtree(staging)
+            staging.mkdir(parents=True)
+
+    def path(self, final: Path) -> Path:
+        """正式路径在暂存目录中的对应路径"""
+        final = Path(final)
+        for root, staging in self.roots.items():
+            if final == root or root in final.parents:
+                return staging / final.relative_to(root)
+        raise ConfigError(f"路径不在暂存范围内: {final}")
+
+    def install(self, installer: Callable[[Path, Path], None] = None):
+        """按声明顺序安装各目录树
+
+        默认把暂存目录 rename 到正式位置 (正式位置已存在时拒绝覆盖)；
+        传入 installer(final, staging) 时由其完成安装，之后删除本地暂存目录。
+        """
+        for final, staging in self.roots.items():
+            if final in self.installed:
+                continue
+            if installer is None:
+                if os.path.lexists(final):
+                    raise ConfigError(f"安装目标已存在: {final}")
+                os.rename(staging, final)
+            else:
+                installer(final, staging)
+                shutil.rmtree(staging, ignore_errors=True)
+            self.installed.append(final)
+
+    def reattach(self) -> bool:
+        """重新关联上次运行留下的目录树 (续跑 / 回滚时使用)
+
+        暂存目录仍在的视为未安装；暂存目录已不在而正式位置存在的视为已安装。
+        返回每棵目录树是否都还在 (暂存或已安装)。
+        """
+        self.installed = []
+        present = True
+        for final, staging in self.roots.items():
+            if staging.exists():
+                continue
+            if os.path.lexists(final):
+                self.installed.append(final)
+            else:
+                present = False
+        return present
+
+    def discard(self):
+        """删除尚未安装的暂存目录"""
+        for final, staging in self.roots.items():
+            if final not in self.installed:
+                shutil.rmtree(staging, ignore_errors=True)
+
+    def undo(self):
+        """撤销: 删除暂存目录与本次已安装的目录"""
+        self.discard()
+        for final in reversed(self.installed):
+            shutil.rmtree(final, ignore_errors=True)
+        self.installed = []
+
+
+def archive_tree(root: Path) -> bytes:
+    """把目录树打包为 tar (成员路径相对于 root，symlink 原样保存)"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        tar.add(root, arcname='.')
+    return buffer.getvalue()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+部署步骤调度器
+按声明的依赖关系并行执行互不依赖的步骤，并记录每步耗时与追踪 span
+
+步骤函数可返回产出 dict (端口、UID 等)；传入 StepJournal 时每步完成后写入日志，
+续跑时由 resume() 恢复已完成步骤的产出，回滚时由 undo_steps() 逆序撤销 (见 journal.py)。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional
+
+from exceptions import ConfigError
+
+
+DEFAULT_WORKERS = 4
+
+
+class Step:
+    """部署步骤
+
+    func() 可返回产出 dict，会写入步骤日志；
+    restore(产出) 在续跑时恢复该步骤的结果，返回 False 表示结果已失效需重新执行；
+    undo(产出) 在回滚时撤销该步骤做过的事。
+    """
+
+    def __init__(self, key: str, title: str, func: Callable[[], Optional[Dict]],
+                 deps: Iterable[str] = (),
+                 restore: Callable[[Dict], Optional[bool]] = None,
+                 undo: Callable[[Dict], None] = None):
+        self.key = key
+        self.title = title
+        self.func = func
+        self.deps = tuple(deps)
+        self.restore = restore
+        self.undo = undo
+        self.num = 0
+        self.status = 'pending'  # pending / running / done / failed / skipped
+        self.duration = None
+        self.outputs: Dict = {}
+
+
+class StepScheduler:
+    """依赖感知的步骤调度器
+
+    步骤按声明顺序编号；依赖全部完成的步骤会被并行提交。
+    任一步骤失败后不再提交新步骤，等待已在运行的步骤结束后
+    抛出第一个异常，保证调用方 rollback() 时没有并发写入。
+    """
+
+    def __init__(self, steps: List[Step], logger, max_workers: int = DEFAULT_WORKERS,
+                 journal=None):
+        self.steps = steps
+        self.logger = logger
+        self.max_workers = max_workers
+        self.journal = journal
+        self._by_key: Dict[str, Step] = {}
+        self._parent_span = None
+
+        for num, step in enumerate(steps, 1):
+            if step.key in self._by_key:
+                raise ConfigError(f"步骤重复: {step.key}")
+            step.num = num
+            self._by_key[step.key] = step
+
+        self._check_graph()
+
+    def _check_graph(self):
+        """检查依赖存在且无环"""
+        for step in self.steps:
+            for dep in step.deps:
+                if dep not in self._by_key:
+                    raise ConfigError(f"步骤 {step.key} 依赖未知步骤 {dep}")
+
+        visiting, visited = set(), set()
+
+        def visit(key):
+            if key in visited:
+                return
+            if key in visiting:
+                raise ConfigError(f"步骤依赖存在环: {key}")
+            visiting.add(key)
+            for dep in self._by_key[key].deps:
+                visit(dep)
+            visiting.discard(key)
+            visited.add(key)
+
+        for step in self.steps:
+            visit(step.key)
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """已完成步骤的耗时 (秒)，按步骤编号排序"""
+        return {s.title: s.duration for s in self.steps if s.duration is not None}
+
+    def resume(self, completed: Dict[str, Dict]) -> List[str]:
+        """把日志中已完成的步骤标记为完成，返回被跳过的步骤
+
+        依赖全部恢复且 restore() 未返回 False 的步骤才会跳过，
+        其余步骤 (及依赖它们的步骤) 在 run() 中重新执行。
+        """
+        total = len(self.steps)
+        restored = []
+        for step in self._topological():
+            if step.key not in completed or not all(dep in restored for dep in step.deps):
+                continue
+            outputs = completed[step.key] or {}
+            if step.restore is not None and step.restore(outputs) is False:
+                self.logger.debug(f"步骤结果已失效，重新执行: {step.title}")
+                continue
+            step.status = 'done'
+            step.outputs = outputs
+            restored.append(step.key)
+            self.logger.step_resumed(step.num, total, step.title)
+        return restored
+
+    def _topological(self) -> List[Step]:
+        """依赖在前的步骤顺序 (同层保持声明顺序)"""
+        ordered, seen = [], set()
+
+        def visit(step):
+            if step.key in seen:
+                return
+            seen.add(step.key)
+            for dep in step.deps:
+                visit(self._by_key[dep])
+            ordered.append(step)
+
+        for step in self.steps:
+            visit(step)
+        return ordered
+
+    def run(self):
+        """执行全部未完成的步骤"""
+        total = len(self.steps)
+        # 工作线程中的步骤 span 挂在调用方当前的 span (整次部署) 之下
+        self._parent_span = self.logger.current_span()
+        done = {step.key for step in self.steps if step.status == 'done'}
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='step') as pool:
+            while True:
+                if error is None:
+                    for step in self.steps:
+                        if (step.status == 'pending'
+                                and all(dep in done for dep in step.deps)):
+                            step.status = 'running'
+                            self.logger.step_start(step.num, total, step.title)
+                            running[pool.submit(self._run_step, step)] = step
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    exc = future.exception()
+                    if exc is None:
+                        step.status = 'done'
+                        done.add(step.key)
+                        self.logger.step_complete(step.num, total, step.title,
+                                                  duration=step.duration)
+                    else:
+                        step.status = 'failed'
+                        self.logger.step_failed(step.num, total, step.title, str(exc))
+                        if error is None:
+                            error = exc
+
+        for step in self.steps:
+            if step.status == 'pending':
+                step.status = 'skipped'
+
+        if error is not None:
+            raise error
+
+    def _run_step(self, step: Step):
+        start = time.monotonic()
+        try:
+            with self.logger.span(step.title, 'step', parent=self._parent_span,
+                                  key=step.key) as span_args:
+                with self.logger.profile_step(step.key, span_args):
+                    step.outputs = step.func() or {}
+            if self.journal is not None:
+                self.journal.record(step.key, step.outputs)
+        finally:
+            step.duration = time.monotonic() - start
+
+
+def undo_steps(steps: List[Step], journal, logger) -> bool:
+    """按完成的逆序撤销日志中记录的步骤
+
+    单个步骤撤销失败不影响其余步骤；全部撤销成功时删除日志并返回 True，
+    否则保留日志 (只剩未撤销的步骤)，修复后可再次回滚。
+    """
+    by_key = {step.key: step for step in steps}
+    completed = journal.load()['steps']
+    ok = True
+    for key in reversed(list(completed)):
+        step = by_key.get(key)
+        if step is not None and step.undo is not None:
+            try:
+                with logger.span(f"撤销 {step.title}", 'undo', key=key):
+                    step.undo(completed[key])
+            except Exception as e:
+                logger.warning(f"撤销失败 ({step.title}): {e}")
+                ok = False
+                continue
+            logger.info(f"   已撤销: {step.title}")
+        journal.undone(key)
+    if ok:
+        journal.remove()
+    return ok
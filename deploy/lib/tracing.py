@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+部署追踪
+把部署过程记录为带耗时的嵌套 span (部署 → 步骤 → 子进程/文件写入)，
+逐条追加到日志旁的 .spans.jsonl，并可导出为 Chrome trace 格式
+(chrome://tracing 或 https://ui.perfetto.dev 打开)。
+
+span 记录 (每行一个 JSON，span 结束时写入):
+    {"id": 3, "parent": 1, "name": "生成 openclaw.json", "cat": "step",
+     "start": 1767000000.123, "duration": 0.042, "tid": 123, "thread": "step_0",
+     "status": "ok", "args": {"key": "config"}}
+
+用法:
+    python3 deploy/lib/tracing.py deploy-l2-x-20260101-120000.spans.jsonl [-o trace.json]
+
+本文件只依赖标准库。
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def command_label(command) -> str:
+    """子进程 span 的名称: 只取前三个参数，避免把密码等敏感参数写进追踪"""
+    return ' '.join(str(c) for c in list(command)[:3])
+
+
+class Tracer:
+    """span 记录器 (线程安全)
+
+    同一线程内的 span 自动嵌套；跨线程 (例如调度器的工作线程) 时
+    由调用方显式传入 parent。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[int]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self) -> Optional[int]:
+        """当前线程最内层 span 的 id"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, category: str = 'misc', parent: int = None, **args):
+        """记录一个 span；with 块内可继续开启子 span"""
+        span_id = next(self._ids)
+        stack = self._stack()
+        if parent is None:
+            parent = stack[-1] if stack else None
+        record = {
+            'id': span_id,
+            'parent': parent,
+            'name': name,
+            'cat': category,
+            'start': time.time(),
+            'tid': threading.get_ident(),
+            'thread': threading.current_thread().name,
+            'status': 'ok',
+            'args': args,
+        }
+        started = time.perf_counter()
+        stack.append(span_id)
+        try:
+            yield record['args']
+        except BaseException as e:
+            record['status'] = 'error'
+            record['args']['error'] = str(e)
+            raise
+        finally:
+            stack.pop()
+            record['duration'] = time.perf_counter() - started
+            self._emit(record)
+
+    def _emit(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class StepProfiler:
+    """--profile 模式: 对单个步骤运行 cProfile 并保存 .prof (pstats 格式)
+
+    cProfile 只采样启用它的线程，步骤在调度器工作线程中运行时互不干扰；
+    Python 3.12+ 同一时刻只允许一个 profiler，冲突时跳过该步骤。
+    """
+
+    def __init__(self, output_dir: Path, prefix: str):
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+
+    @contextmanager
+    def profile(self, key: str, span_args: Dict = None):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            yield None
+            return
+
+        path = self.output_dir / f'{self.prefix}.{key}.prof'
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            if span_args is not None:
+                span_args['profile'] = str(path)
+
+
+def load_spans(path: Path) -> List[Dict]:
+    """读取 .spans.jsonl (忽略被截断的最后一行)"""
+    spans = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def to_chrome_trace(spans: List[Dict]) -> Dict:
+    """转换为 Chrome trace event 格式 (complete 事件，时间单位微秒)"""
+    pid = os.getpid()
+    events = []
+    threads = {}
+
+    for span in sorted(spans, key=lambda s: s['start']):
+        threads.setdefault(span['tid'], span.get('thread', ''))
+        events.append({
+            'name': span['name'],
+            'cat': span.get('cat', 'misc'),
+            'ph': 'X',
+            'ts': span['start'] * 1e6,
+            'dur': span['duration'] * 1e6,
+            'pid': pid,
+            'tid': span['tid'],
+            'args': {**span.get('args', {}), 'status': span.get('status', 'ok')},
+        })
+
+    for tid, name in threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                       'args': {'name': name}})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(spans_path: Path, output_path: Path = None) -> Path:
+    """把 .spans.jsonl 导出为 Chrome trace JSON，返回输出路径"""
+    spans_path = Path(spans_path)
+    if output_path is None:
+        output_path = spans_path.with_name(spans_path.name.replace('.spans.jsonl', '.trace.json'))
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(to_chrome_trace(load_spans(spans_path)), f, ensure_ascii=False)
+    return Path(output_path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把部署 span 导出为 Chrome trace')
+    parser.add_argument('spans', help='.spans.jsonl 文件')
+    parser.add_argument('-o', '--output', help='输出路径 (默认同目录 .trace.json)')
+    args = parser.parse_args()
+
+    output = export_chrome_trace(Path(args.spans), args.output and Path(args.output))
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
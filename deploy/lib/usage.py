@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Agent 资源用量采样 (deploy-agent --top，--watch 每轮顺带采样)
+把每个已登记 Agent 映射到其 Gateway 进程，采样 CPU 占用与 RSS，
+写入每个 Agent 一个的定长环形文件 (config/.usage/<名称>.ring)。
+
+环形文件布局 (小端，mmap 后直接作为数组读写，追加一次样本只改写几个字节):
+
+    头部  magic 'OCUR' | version u16 | 保留 u16 | capacity u32 | count u64 (累计写入数)
+    times[capacity]  f64   采样时间 (epoch 秒)
+    cpu[capacity]    f32   CPU 占用 (%，单核 100)，首次见到进程时为 NaN
+    rss[capacity]    u32   RSS (KB)
+
+采样开销: 进程 PID 按上次结果缓存，每次只读这些 PID 的 /proc/<pid>/stat
+(macOS 为一次 ps -p)；已知 PID 失效 (进程退出或被复用) 时才重新采集进程快照，
+未运行的 Agent 每 RESCAN_INTERVAL 秒查找一次。
+"""
+
+import fcntl
+import math
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import registry_snapshot
+from snapshot import SystemSnapshot, process_usage
+
+
+USAGE_DIR = '.usage'
+DEFAULT_CAPACITY = 2880     # 30s 一个样本约 24 小时
+DEFAULT_INTERVAL = 30       # 写入环形文件的最小间隔 (秒)
+RESCAN_INTERVAL = 30        # 未运行的 Agent 每隔多久重新采集进程快照查找 (秒)
+
+MAGIC = b'OCUR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQ')
+HEADER_SIZE = 32            # 头部占位 (对齐 f64 数组)
+
+
+def usage_dir(config_dir: Path = None) -> Path:
+    return Path(config_dir or registry_snapshot.default_config_dir()) / USAGE_DIR
+
+
+class UsageRing:
+    """单个 Agent 的定长环形样本文件 (mmap)，写入时持有 flock，可多进程同时读写"""
+
+    def __init__(self, path: Path, capacity: int = DEFAULT_CAPACITY, create: bool = True):
+        self.path = Path(path)
+        existing = self.path.exists()
+        if not existing and not create:
+            raise FileNotFoundError(self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.mm = None
+        try:
+            with self._locked():
+                old = self._read_all() if existing else None
+                if old is None:
+                    if not create:
+                        raise ValueError(f"不是有效的用量文件: {self.path}")
+                    self._format(capacity)
+                elif create and self.capacity != capacity:
+                    self._format(capacity, old)
+        except BaseException:
+            self.close()
+            raise
+
+    def _map(self):
+        self._release()
+        self.mm = mmap.mmap(self.fd, 0)
+        magic, version, _, capacity, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是有效的用量文件: {self.path}")
+        self.capacity = capacity
+        view = memoryview(self.mm)
+        offset = HEADER_SIZE
+        self.times = view[offset:offset + 8 * capacity].cast('d')
+        offset += 8 * capacity
+        self.cpu = view[offset:offset + 4 * capacity].cast('f')
+        offset += 4 * capacity
+        self.rss = view[offset:offset + 4 * capacity].cast('I')
+        view.release()
+
+    def _read_all(self) -> Optional[List[tuple]]:
+        """映射已有文件并读出全部样本；文件损坏或版本不符时返回 None"""
+        try:
+            self._map()
+        except (ValueError, struct.error, OSError):
+            self._release()
+            return None
+        return self.samples()
+
+    def _format(self, capacity: int, samples: List[tuple] = None):
+        """按 capacity 重建文件 (容量变化时保留最近的样本)"""
+        self._release()
+        size = HEADER_SIZE + 16 * capacity
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, size)
+        os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, 0, capacity, 0), 0)
+        self._map()
+        for sample in (samples or [])[-capacity:]:
+            self._put(*sample)
+
+    @property
+    def count(self) -> int:
+        """累计写入的样本数 (可超过容量)"""
+        return HEADER.unpack_from(self.mm, 0)[4]
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, ts: float, cpu: Optional[float], rss: int):
+        """追加一个样本 (覆盖最旧的)；rss 为字节数"""
+        with self._locked():
+            self._put(ts, cpu, rss // 1024)
+
+    def _put(self, ts: float, cpu: Optional[float], rss_kb: int):
+        count = self.count
+        slot = count % self.capacity
+        # 先写数值、后写时间与计数，并发读者至多看到上一轮的旧值
+        self.cpu[slot] = math.nan if cpu is None else cpu
+        self.rss[slot] = min(int(rss_kb), 0xFFFFFFFF)
+        self.times[slot] = ts
+        struct.pack_into('<Q', self.mm, HEADER.size - 8, count + 1)
+
+    def samples(self, since: float = None) -> List[tuple]:
+        """按时间顺序返回 (time, cpu 或 None, rss_kb)"""
+        count, capacity = self.count, self.capacity
+        start = max(0, count - capacity)
+        result = []
+        for i in range(start, count):
+            slot = i % capacity
+            ts = self.times[slot]
+            if since is not None and ts < since:
+                continue
+            cpu = self.cpu[slot]
+            result.append((ts, None if math.isnan(cpu) else cpu, self.rss[slot]))
+        return result
+
+    def _locked(self):
+        return _FileLock(self.fd)
+
+    def _release(self):
+        if self.mm is not None:
+            for name in ('times', 'cpu', 'rss'):
+                getattr(self, name).release()
+            self.mm.close()
+            self.mm = None
+
+    def close(self):
+        self._release()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class _FileLock:
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法百分位 (values 可无序)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+class UsageSample:
+    """一个 Agent 的一次采样结果"""
+
+    __slots__ = ('name', 'mode', 'port', 'pid', 'time', 'cpu', 'rss')
+
+    def __init__(self, agent: Dict):
+        self.name = agent.get('name') or agent.get('agent')
+        self.mode = agent.get('mode', 'l1')
+        self.port = agent.get('port')
+        self.pid: Optional[int] = None
+        self.time = time.time()
+        self.cpu: Optional[float] = None    # %，需两次采样才有
+        self.rss: Optional[int] = None      # 字节
+
+
+class UsageSampler:
+    """按登记采样各 Gateway 的 CPU / RSS 并写入环形文件
+
+    interval 为写入环形文件的最小间隔 (--top 刷新更快时只在内存中更新当前值)。
+    """
+
+    def __init__(self, config_dir: Path = None, capacity: int = DEFAULT_CAPACITY,
+                 interval: float = DEFAULT_INTERVAL):
+        self.dir = usage_dir(config_dir)
+        self.capacity = capacity
+        self.interval = interval
+        self._rings: Dict[str, UsageRing] = {}
+        self._pids: Dict[str, int] = {}
+        self._last: Dict[int, tuple] = {}   # pid -> (monotonic, cpu_time)
+        self._scanned = 0.0
+
+    def sample(self, agents: List[Dict], snapshot: SystemSnapshot = None) -> Dict[str, UsageSample]:
+        """采样一轮；snapshot 给出时 (如 --watch 已采集) 直接用它定位 PID"""
+        samples = {}
+        for agent in agents:
+            sample = UsageSample(agent)
+            if sample.port:
+                samples[sample.name] = sample
+
+        pids = {name: self._pid(s, snapshot) for name, s in samples.items()}
+        usage = process_usage(pid for pid in pids.values() if pid)
+        stale = [name for name, pid in pids.items()
+                 if not pid or pid not in usage or not usage[pid].is_gateway(samples[name].port)]
+        lost = any(name in self._pids for name in stale)
+        if stale and snapshot is None and (
+                lost or time.monotonic() - self._scanned >= RESCAN_INTERVAL):
+            snapshot = SystemSnapshot.capture()
+            self._scanned = time.monotonic()
+            for name in stale:
+                pids[name] = self._pid(samples[name], snapshot)
+            usage.update(process_usage(pids[name] for name in stale if pids[name]))
+
+        now = time.monotonic()
+        for name, sample in samples.items():
+            proc = usage.get(pids[name])
+            if proc is None or proc.rss is None or not proc.is_gateway(sample.port):
+                self._pids.pop(name, None)
+                continue
+            sample.pid, sample.rss = proc.pid, proc.rss
+            self._pids[name] = proc.pid
+            previous = self._last.get(proc.pid)
+            if previous is not None and proc.cpu_time is not None and now > previous[0]:
+                sample.cpu = max(0.0, (proc.cpu_time - previous[1]) / (now - previous[0]) * 100)
+            if proc.cpu_time is not None:
+                self._last[proc.pid] = (now, proc.cpu_time)
+            self._record(sample)
+
+        live = set(self._pids.values())
+        self._last = {pid: v for pid, v in self._last.items() if pid in live}
+        return samples
+
+    def _pid(self, sample: UsageSample, snapshot: Optional[SystemSnapshot]) -> Optional[int]:
+        if snapshot is None:
+            return self._pids.get(sample.name)
+        proc = snapshot.gateway_for_port(sample.port)
+        return proc.pid if proc else None
+
+    def _record(self, sample: UsageSample):
+        ring = self.ring(sample.name)
+        latest = ring.times[(ring.count - 1) % ring.capacity] if ring.count else 0
+        # 已有历史时跳过没有 CPU 值的样本 (每次启动 --top / --watch 的第一轮)
+        if sample.cpu is None and ring.count:
+            return
+        if sample.time - latest >= self.interval:
+            ring.append(sample.time, sample.cpu, sample.rss)
+
+    def ring(self, name: str) -> UsageRing:
+        if name not in self._rings:
+            self._rings[name] = UsageRing(self.dir / f'{name}.ring', self.capacity)
+        return self._rings[name]
+
+    def close(self):
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
+
+
+class UsageStats:
+    """一个 Agent 的历史统计 (来自环形文件)"""
+
+    def __init__(self, samples: List[tuple]):
+        self.count = len(samples)
+        self.span = samples[-1][0] - samples[0][0] if samples else 0.0
+        cpu = [c for _, c, _ in samples if c is not None]
+        rss = [r * 1024 for _, _, r in samples]
+        self.cpu_p95 = percentile(cpu, 95)
+        self.rss_p95 = percentile(rss, 95)
+        self.rss_max = max(rss) if rss else None
+
+
+def load_stats(name: str, config_dir: Path = None, since: float = None) -> UsageStats:
+    """读取 Agent 的历史统计 (没有环形文件时为空统计)"""
+    try:
+        ring = UsageRing(usage_dir(config_dir) / f'{name}.ring', create=False)
+    except (FileNotFoundError, ValueError):
+        return UsageStats([])
+    try:
+        return UsageStats(ring.samples(since))
+    finally:
+        ring.close()
+
+
+def _mb(value: Optional[float]) -> str:
+    return f"{value / 1024 ** 2:.0f}MB" if value is not None else '-'
+
+
+def _pct(value: Optional[float]) -> str:
+    return f"{value:.1f}%" if value is not None else '-'
+
+
+def _span(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 60:.0f}m"
+
+
+def print_top(samples: Dict[str, UsageSample], stats: Dict[str, UsageStats],
+              hibernating=(), echo=print):
+    """打印用量表 (按当前 RSS 降序)"""
+    rows = sorted(samples.values(), key=lambda s: s.rss or 0, reverse=True)
+    echo("=" * 96)
+    echo(f"{'名称':<20} {'模式':<5} {'PID':<8} {'CPU':>7} {'CPU p95':>8} "
+         f"{'RSS':>8} {'RSS p95':>8} {'RSS 峰值':>8}   样本")
+    echo("-" * 96)
+    for s in rows:
+        st = stats.get(s.name) or UsageStats([])
+        pid = str(s.pid) if s.pid else ('休眠' if s.name in hibernating else '未运行')
+        history = f"{st.count} / {_span(st.span)}" if st.count else '-'
+        echo(f"{s.name:<20} {s.mode.upper():<5} {pid:<8} {_pct(s.cpu):>7} {_pct(st.cpu_p95):>8} "
+             f"{_mb(s.rss):>8} {_mb(st.rss_p95):>8} {_mb(st.rss_max):>8}   {history}")
+    echo("-" * 96)
+    running = [s for s in rows if s.pid]
+    total_cpu = sum(s.cpu for s in running if s.cpu is not None)
+    total_rss = sum(s.rss for s in running)
+    echo(f"运行中 {len(running)}/{len(rows)}，合计 CPU {total_cpu:.1f}%，RSS {_mb(total_rss)}")
@@ -3,13 +3,12 @@
 工具函数
 """
 
-from config import ConfigManager
+import registry_snapshot
 
 
 def list_agents():
     """列出已部署的 Agent"""
-    config = ConfigManager()
-    agents = config.list_agents()
+    agents = registry_snapshot.list_agents()
     
     if not agents:
         print("暂无已部署的 Agent")
@@ -3,22 +3,32 @@
 部署验证器
 """
 
-import subprocess
-import time
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
 from config import DeployResult, VerifyReport, VerifyCheck
+from snapshot import SystemSnapshot
 
 
 class Verifier:
     """部署验证器"""
     
-    def __init__(self, deploy_result: DeployResult):
+    def __init__(self, deploy_result: DeployResult, snapshot: SystemSnapshot = None):
         self.result = deploy_result
         self.checks = []
+        self._snapshot = snapshot
+    
+    @property
+    def snapshot(self) -> SystemSnapshot:
+        """进程/端口快照 (单个验证时按需采集一次)"""
+        if self._snapshot is None:
+            self._snapshot = SystemSnapshot.capture()
+        return self._snapshot
     
-    def run(self) -> VerifyReport:
+    def run(self, echo: bool = True) -> VerifyReport:
         """执行验证"""
-        print("开始验证...\n")
+        if echo:
+            print("开始验证...\n")
         
         checks = [
             ("进程检查", self._check_process),
@@ -31,40 +41,35 @@ class Verifier:
             try:
                 passed, message = check_func()
                 self.checks.append(VerifyCheck(name, passed, message))
-                icon = "✅" if passed else "❌"
-                print(f"  {icon} {name}: {message}")
             except Exception as e:
                 self.checks.append(VerifyCheck(name, False, str(e)))
-                print(f"  ❌ {name}: {e}")
+            if echo:
+                check = self.checks[-1]
+                icon = "✅" if check.passed else "❌"
+                print(f"  {icon} {name}: {check.message}")
         
         self.result.verify_report = VerifyReport(self.checks)
         
         # 总结
-        passed = sum(1 for c in self.checks if c.passed)
-        total = len(self.checks)
-        print(f"\n验证结果：{passed}/{total} 通过")
+        if echo:
+            passed = sum(1 for c in self.checks if c.passed)
+            total = len(self.checks)
+            print(f"\n验证结果：{passed}/{total} 通过")
         
         return self.result.verify_report
     
     def _check_process(self):
         """检查进程"""
-        result = subprocess.run(
-            ['ps', 'aux'],
-            capture_output=True, text=True
-        )
-        
-        if 'openclaw' in result.stdout and str(self.result.port) in result.stdout:
-            return True, "Gateway 运行中"
+        proc = self.snapshot.gateway_for_port(self.result.port)
+        if proc:
+            usage = self.snapshot.usage(proc.pid)
+            rss = f", RSS {usage.rss / 1024 ** 2:.0f}MB" if usage and usage.rss else ''
+            return True, f"Gateway 运行中 (PID {proc.pid}{rss})"
         return False, "Gateway 未运行"
     
     def _check_port(self):
         """检查端口"""
-        result = subprocess.run(
-            ['lsof', '-i', f':{self.result.port}'],
-            capture_output=True, text=True
-        )
-        
-        if 'LISTEN' in result.stdout:
+        if self.snapshot.is_listening(self.result.port):
             return True, f"端口 {self.result.port} 监听中"
         return False, f"端口 {self.result.port} 未监听"
     
@@ -90,3 +95,55 @@ class Verifier:
         # 这里可以实现调用 Gateway API 验证
         # 简化版本：跳过
         return True, "跳过 (需手动验证)"
+
+
+def result_from_registry(agent: Dict) -> DeployResult:
+    """根据 ports.yaml 中的登记信息构造 DeployResult"""
+    # 优先使用 name，如果没有则用 agent 字段 (兼容旧数据)
+    name = agent.get('name') or agent.get('agent', 'N/A')
+    result = DeployResult(success=True, mode=agent.get('mode', 'l1'), agent_name=name)
+    result.port = agent.get('port')
+    result.username = agent.get('username')
+    result.uid = agent.get('uid')
+    return result
+
+
+class FleetVerifier:
+    """批量验证器: 一次快照，并发验证给定的已登记 Agent"""
+    
+    def __init__(self, agents: List[Dict], workers: int = 8):
+        self.agents = agents
+        self.workers = workers
+    
+    def run(self, names: List[str] = None) -> List[DeployResult]:
+        agents = self.agents
+        if names:
+            agents = [a for a in agents if (a.get('name') or a.get('agent')) in names]
+        results = [result_from_registry(a) for a in agents if a.get('port')]
+        
+        snapshot = SystemSnapshot.capture()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(lambda r: Verifier(r, snapshot).run(echo=False), results))
+        
+        self._print_table(results, snapshot)
+        return results
+    
+    def _print_table(self, results: List[DeployResult], snapshot: SystemSnapshot):
+        print(f"\n📋 Fleet 验证 (快照来源: {snapshot.source})\n")
+        print(f"   {'名称':<18} {'模式':<6} {'端口':<8} {'通过':<6} {'失败项'}")
+        print("-" * 70)
+        
+        healthy = 0
+        for result in results:
+            checks = result.verify_report.checks
+            failed = [c for c in checks if not c.passed]
+            if not failed:
+                healthy += 1
+            passed = f"{len(checks) - len(failed)}/{len(checks)}"
+            icon = "✅" if not failed else "❌"
+            detail = ', '.join(f"{c.name}: {c.message}" for c in failed) or '-'
+            print(f"{icon} {result.agent_name:<18} {result.mode.upper():<6} "
+                  f"{result.port:<8} {passed:<6} {detail}")
+        
+        print("-" * 70)
+        print(f"健康：{healthy}/{len(results)}\n")